@@ -8,27 +8,44 @@ every other conceivable plugin.
 
 import os
 import os.path
+import stat
 
 TARGET  = "file"
 VERSION = 0x00010100
 #DEPENDENCIES = []
+STAT = True
 
-def process( name, state ):
+def _stat( name ):
+	# stat always works (regardless of permissions) as long as the
+	# the file is not missing. (In that case it raises FileNotFound.)
+	try:
+		return os.stat( name )
+	except OSError:
+		return None
+
+def process( name, state, info=None ):
 	"""
 	This plugin only examines attributes of the file visible "from the
 	outside"--that is, without opening and reading any of its contents.
 	readable { 'absent','notfile','perm','yes' }
+	info is the subject's os.stat_result, if the framework has it. It may
+	have been taken long before (in discovery), so it's trusted only while
+	the file still exists.
 	"""
 	ext  = os.path.splitext( name )[1][1:] # skip over the '.'
-	info = None
-	if os.path.exists( name ):
-		if os.path.isfile( name ):
-			readable = 'yes' if os.access( name, os.R_OK ) else 'perm'
+	fresh = info is None
+	if fresh:
+		info = _stat( name )
+	access = info is not None and stat.S_ISREG( info.st_mode ) \
+		and os.access( name, os.R_OK )
+	if info is not None and not access and not fresh:
+		# The file may have vanished (or been replaced) since info.
+		info = _stat( name )
+	if info is not None:
+		if stat.S_ISREG( info.st_mode ):
+			readable = 'yes' if access else 'perm'
 		else:
 			readable = 'notfile'
-		# stat always works (regardless of permissions) as long as the
-		# the file is not missing. (In that case it raises FileNotFound.)
-		info = os.stat( name )
 	else:
 		readable = 'missing'
 	size  = info.st_size  if info else None
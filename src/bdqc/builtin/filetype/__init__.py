@@ -9,54 +9,17 @@ compressed* content. Detection early lets downstream plugins do the sensible
 thing.
 """
 
-import os
 import os.path
-import warnings
-import importlib
 import logging
 import struct
 
+import bdqc.builtin.compiled
+
 TARGET  = "file"
-VERSION = 0x00010100
+VERSION = 0x00010200
 DEPENDENCIES = ['bdqc.builtin.extrinsic',]
 
-_KNOWN_CODECS = (
-	{	'canonical_ext':"gz",
-		'sig':bytes((0x1F,0x8B )),
-		'lib':"gzip"
-	},
-	{	'canonical_ext':"bz2",
-		'sig':bytes((0x42,0x5A,0x68)),
-		'lib':"bz2"
-	},
-	{	'canonical_ext':"xz",
-		'sig':bytes((0xFD,0x37,0x7A,0x58,0x5A,0x00)),
-		'lib':"lzma"
-	}
-)
-
 _MISMATCH_TEMPLATE = "Compression indicated by {}'s extension does not match that indicated by its signature (\"{}\")"
-_NO_CODEC_TEMPLATE = "No codec available for {}"
-
-def _id_codec_by_sig( fp ):
-	"""
-	Infers codec type by examining the files initial bytes.
-	GZIP: 1F 8B
-	BZIP: 42 5A 68          ('B', 'Z', 'h')
-	  XZ: FD 37 7A 58 5A 00 (FD, '7', 'z', 'X', 'Z', 0x00)
-	This is intended to return a character "code" that
-	corresponds to the more-or-less standard file extensions.
-	"""
-	pos = fp.tell()
-	fp.seek(0, os.SEEK_SET )
-	sig = fp.read(6)
-	fp.seek(pos, os.SEEK_SET )
-	for codec in _KNOWN_CODECS:
-		if len(sig) >= len(codec['sig']) \
-			and codec['sig'] == sig[:len(codec['sig'])]:
-			return codec
-	return None
-
 
 def process( name, state ):
 	"""
@@ -64,40 +27,31 @@ def process( name, state ):
 	assess whether it's compressed, get the signature of the content, and
 	attempt to classify it as "definitely binary" or "potentially text"
 	using a DB of known file signatures.
+	Compression is identified and decoded by the same compiled codecs
+	(zlib, libbz2, liblzma) used by the tabular plugin, so the two always
+	agree on what a file contains.
 	"""
 	if not state.get('bdqc.builtin.extrinsic',False):
 		return None
 	codec = None
-	_open = open
 	sig   = None
 	if state['bdqc.builtin.extrinsic']['readable'] == "yes":
-		with open(name,"rb") as fp:
-			codec = _id_codec_by_sig( fp )
+		codec, sig = bdqc.builtin.compiled.file_signature( name, 8 )
 		if codec: # ...implying it IS a compressed file.
-			expected_ext = codec['canonical_ext']
 			actual_ext = os.path.splitext( name )[1].lower()
-			if not actual_ext.endswith( expected_ext ):
+			if not actual_ext.endswith( codec ):
 				logging.warn( _MISMATCH_TEMPLATE.format( name, codec ) )
-			try:
-				lib = importlib.import_module(codec['lib'])
-				_open = lib.open
-			except ImportError:
-				logging.warn( _NO_CODEC_TEMPLATE.format( name ) )
-				_open = None # ...we won't be able to read the actual sig
-		if _open:
-			with _open( name, "rb") as fp:
-				sig = fp.read(8)
-			# Pad it to 8 bytes and convert it to a hexadecimal string
-			# which is more easily dealt with in JSON.
-			if len(sig) < 8:
-				sig += bytes(8-len(sig))
-			sig = "{0:08X}{1:08X}".format( *struct.unpack( ">2I", sig ) )
+		# Pad it to 8 bytes and convert it to a hexadecimal string
+		# which is more easily dealt with in JSON.
+		if len(sig) < 8:
+			sig += bytes(8-len(sig))
+		sig = "{0:08X}{1:08X}".format( *struct.unpack( ">2I", sig ) )
 		# TODO: Signature-based file infererence should attempt to
 		# categorize file as "definitely binary" or "potentially text" and
 		# further
 		#	raster image
 		#	executable
-	return {'compression':codec['canonical_ext'] if codec else None, 'sig':sig }
+	return {'compression':codec, 'sig':sig }
 
 # Unit test
 if __name__=="__main__":
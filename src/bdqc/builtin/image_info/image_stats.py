@@ -6,9 +6,11 @@ import os
 import os.path
 from PIL import ImageStat, Image
 import warnings
+import bdqc.pagecache
 
 TARGET  = "file"
 VERSION = 0x00010100
+INTRINSIC = True
 DEPENDENCIES = ['bdqc.builtin.extrinsic',]
 PERMITTED_EXTENSIONS = ['jpg', 'bmp', 'tiff', 'png', 'sr', 'ras', 'dib', 'jp2', 'pbm', 'pgm', 
              'ppm', 'tif', 'jpeg', 'jpe']
@@ -35,9 +37,11 @@ def process(name, state):
             # collect remaining attributes
             try:
                 
-                # read image and instantiate ImageStat.Stat class
-                img= Image.open(name)
-                img_stats= ImageStat.Stat(img)
+                # read image and instantiate ImageStat.Stat class (which
+                # loads all the pixels, so the file is read through here)
+                with bdqc.pagecache.sequential(name) as fp:
+                    img= Image.open(fp)
+                    img_stats= ImageStat.Stat(img)
                 
                 # height, width, depth, matrix size (h * w * d)
                 height, width= img.size
@@ -0,0 +1,49 @@
+
+"""
+Summarizes the reads of nucleotide sequence files (FASTQ, FASTA and SAM):
+their count and length distribution, base composition overall and by
+position, and quality scores. The file is scanned once, by compiled code,
+in memory independent of its size.
+"""
+
+from os import getenv
+import os.path
+
+import bdqc.builtin.compiled
+
+TARGET  = "file"
+VERSION = 0x00010000
+INTRINSIC = True
+DEPENDENCIES = ['bdqc.builtin.extrinsic',]
+
+# Only files with these extensions (before any compression extension) are
+# scanned; the format itself is inferred from the content. Overridable by a
+# comma-separated list, e.g. SEQUENCE_EXTENSIONS=".fq,.fastq".
+SEQUENCE_EXTENSIONS = tuple( getenv('SEQUENCE_EXTENSIONS',
+	'.fastq,.fq,.fasta,.fa,.fna,.ffn,.sam').lower().split(',') )
+COMPRESSION_EXTENSIONS = ('.gz','.bz2','.xz')
+
+def _is_sequence( name ):
+	root,ext = os.path.splitext( name.lower() )
+	if ext in COMPRESSION_EXTENSIONS:
+		ext = os.path.splitext( root )[1]
+	return ext in SEQUENCE_EXTENSIONS
+
+def process( name, state ):
+	"""
+	Returns None unless the extrinsic builtin found name readable and its
+	extension is that of a sequence file. Otherwise the result is that of
+	bdqc.builtin.compiled.sequence_scan, which is None if the content is
+	not recognizably FASTQ, FASTA or SAM.
+	"""
+	if not state.get('bdqc.builtin.extrinsic',False):
+		return None
+	if state['bdqc.builtin.extrinsic']['readable'] != "yes":
+		return None
+	if not _is_sequence( name ):
+		return None
+	return bdqc.builtin.compiled.sequence_scan( name )
+
+if __name__=="__main__":
+	import sys
+	print( process( sys.argv[1], {'bdqc.builtin.extrinsic':{'readable':"yes"}} ) )
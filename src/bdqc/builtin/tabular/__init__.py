@@ -4,11 +4,63 @@ Its results are the basis for the first-round classification of
 a file as either 1) ASCII text, 2) UTF-8 text, or 3) binary.
 """
 
+from os import getenv
+import os.path
+
 import bdqc.builtin.compiled
-import json
 
 TARGET  = "file"
-VERSION = 0x00010100
+VERSION = 0x00010500
+INTRINSIC = True
+
+# Threads used to scan each (sufficiently large, uncompressed) file.
+SCAN_THREADS = int( getenv('TABULAR_SCAN_THREADS','1') )
+
+# If positive, (sufficiently large, uncompressed) files are sampled until
+# their column statistics change by less than this; see the docstring of
+# bdqc.builtin.compiled.tabular_scan. Results then include the fraction of
+# the file sampled, so between-file analysis can account for it.
+SAMPLE_TOLERANCE = float( getenv('TABULAR_SAMPLE_TOLERANCE','0') )
+SAMPLE_SEED      = int( getenv('TABULAR_SAMPLE_SEED','0') )
+
+# Results depend on the settings above as well as on the content, so they
+# are only reused or shared (see bdqc.scan) among scans with the same ones.
+CONTEXT = { 'threads':SCAN_THREADS,
+	'sample_tolerance':SAMPLE_TOLERANCE,
+	'sample_seed':SAMPLE_SEED }
+
+# Files in a collection usually share one format, so the format inferred
+# from one file is offered to the scan of the next with the same extension.
+# The scan checks it against the file's first lines and infers the format
+# anew if they disagree; otherwise header detection and format inference
+# are skipped.
+REUSE_FORMAT = getenv('TABULAR_REUSE_FORMAT','1') != '0'
+FORMAT_KEYS = ('column_separator','separator_is_regex','separator_is_quoted',
+	'column_count','metadata_prefix','line_terminator')
+COMPRESSION_EXTENSIONS = ('.gz','.bz2','.xz')
+
+# Files with these extensions (before any compression extension) are also
+# analyzed as JSON Lines: tabledata['records'] then describes each key of
+# the records as tabledata['table'] describes each column of a table.
+JSONL_EXTENSIONS = ('.jsonl','.ndjson')
+
+_formats = {}
+
+def _format_key( name ):
+	"""
+	The extension of name, including any preceding a compression extension.
+	"""
+	root,ext = os.path.splitext( name.lower() )
+	if ext in COMPRESSION_EXTENSIONS:
+		ext = os.path.splitext( root )[1] + ext
+	return ext
+
+def _is_jsonl( name ):
+	root,ext = os.path.splitext( name.lower() )
+	if ext in COMPRESSION_EXTENSIONS:
+		ext = os.path.splitext( root )[1]
+	return ext in JSONL_EXTENSIONS
+
 DEPENDENCIES = ['bdqc.builtin.extrinsic',]
 
 def process( name, state ):
@@ -24,11 +76,23 @@ def process( name, state ):
 			'transition_histogram':None,
 	   		'tabledata':None }
 	tabledata = None
+	key = _format_key( name ) if REUSE_FORMAT else None
 	try:
-		result = bdqc.builtin.compiled.tabular_scan( name )
-		tabledata = json.loads( result )
+		tabledata = bdqc.builtin.compiled.tabular_scan( name,
+			threads=SCAN_THREADS,
+			sample_tolerance=SAMPLE_TOLERANCE,
+			seed=SAMPLE_SEED,
+			format=_formats.get( key ) )
 	except Exception:
 		pass
+	if key is not None and tabledata and tabledata.get('table'):
+		table = tabledata['table']
+		_formats[ key ] = { k:table[k] for k in FORMAT_KEYS }
+	if tabledata is not None and _is_jsonl( name ):
+		try:
+			tabledata['records'] = bdqc.builtin.compiled.jsonl_scan( name )
+		except Exception:
+			tabledata['records'] = None
 	return tabledata
 
 if __name__=="__main__":
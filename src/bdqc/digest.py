@@ -0,0 +1,55 @@
+
+"""
+Digests identifying subjects' content, so that the results of plugins
+may be shared among byte-identical files.
+
+The partial digest covers only a file's size and its first and last
+PARTIAL_BLOCK bytes, so it costs at most two small reads however large
+the file. Files differing in a partial digest certainly differ; files
+whose partial digests collide are compared by their full digests.
+"""
+
+import os
+import hashlib
+
+import bdqc.pagecache
+
+PARTIAL_BLOCK = 64*1024
+_READ_BLOCK = 1024*1024
+
+def _hasher( size ):
+	h = hashlib.blake2b( digest_size=20 )
+	h.update( size.to_bytes( 8, 'little' ) )
+	return h
+
+def is_complete( size ):
+	"""
+	Whether a partial digest of a file of <size> bytes covers all of it,
+	in which case it is the same as the full digest.
+	"""
+	return size <= 2*PARTIAL_BLOCK
+
+def partial( name ):
+	with open( name, "rb" ) as fp:
+		size = os.fstat( fp.fileno() ).st_size
+		h = _hasher( size )
+		if is_complete( size ):
+			h.update( fp.read() )
+		else:
+			h.update( fp.read( PARTIAL_BLOCK ) )
+			fp.seek( -PARTIAL_BLOCK, os.SEEK_END )
+			h.update( fp.read( PARTIAL_BLOCK ) )
+	return h.hexdigest()
+
+def full( name ):
+	with bdqc.pagecache.sequential( name ) as fp:
+		h = _hasher( os.fstat( fp.fileno() ).st_size )
+		for block in iter( lambda:fp.read( _READ_BLOCK ), b'' ):
+			h.update( block )
+	return h.hexdigest()
+
+# Unit test
+if __name__=="__main__":
+	import sys
+	for name in sys.argv[1:]:
+		print( partial( name ), full( name ), name )
@@ -1,30 +1,87 @@
 
+from os import scandir
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-from os import listdir
-from os.path import join,isdir
-from re import match
+def _stat( e ):
+	try:
+		return e.stat()
+	except OSError:
+		return None # ...e.g. a dangling symbolic link.
 
-def walk( root, depth=None, include=None, exclude=None, callback=None ):
+def _scan( d, include, exclude, with_stat ):
+	"""
+	List directory d, returning the files in it that pass the filters and
+	the subdirectories of it to be walked. The file type of each entry is
+	(on most platforms) known from the listing itself, so no entry is
+	stat'ed, save symbolic links, unless with_stat, in which case files
+	are returned as ( path, os.stat_result ) pairs.
+	"""
+	files = []
+	subs = []
+	with scandir( d ) as entries:
+		for e in entries:
+			if e.is_dir():
+				# Excluded directories are pruned, contents and all.
+				if not ( exclude and exclude( e.path ) ):
+					subs.append( e.path )
+			elif ((not include) or include( e.path )) \
+				 and ((not exclude) or not exclude( e.path )):
+				files.append( ( e.path, _stat( e ) ) if with_stat else e.path )
+	return files, subs
+
+def iwalk( root, depth=None, include=None, exclude=None, threads=1, with_stat=False ):
+	"""
+	Generate the filenames walk would, as the walk proceeds. If threads
+	is more than 1, that many directories are listed concurrently (which
+	pays on network filesystems) and filenames are generated in no
+	particular order. If with_stat, ( filename, os.stat_result ) pairs are
+	generated instead, the latter taken while listing (and, on Windows,
+	without any further system call) or None if the file vanished.
+	"""
+	include = re.compile( include ).match if include else None
+	exclude = re.compile( exclude ).match if exclude else None
+	if threads > 1:
+		yield from _iwalk_concurrently( root, depth, include, exclude, threads, with_stat )
+		return
+	# root is at level 1; subdirectories are walked to level depth.
+	stack = [ ( root, 1 ), ]
+	while stack:
+		d,level = stack.pop()
+		files,subs = _scan( d, include, exclude, with_stat )
+		yield from files
+		if not depth or level < depth:
+			stack.extend( ( s, level+1 ) for s in subs )
+
+def _iwalk_concurrently( root, depth, include, exclude, threads, with_stat ):
+	pool = ThreadPoolExecutor( threads )
+	try:
+		pending = { pool.submit( _scan, root, include, exclude, with_stat ):1 }
+		while pending:
+			done,_ = wait( pending, return_when=FIRST_COMPLETED )
+			for f in done:
+				level = pending.pop( f )
+				files,subs = f.result()
+				if not depth or level < depth:
+					for s in subs:
+						pending[ pool.submit( _scan, s, include, exclude, with_stat ) ] = level+1
+				yield from files
+	finally:
+		# ...in case the walk is abandoned (or failed) before it's done.
+		pool.shutdown( wait=False, cancel_futures=True )
+
+def walk( root, depth=None, include=None, exclude=None, callback=None, threads=1 ):
 	"""
 	A slightly more capable directory tree walker than that provided
 	by os.walk. This provides for limiting depth of recursion and
-	filtering filenames with a regular expression.
+	filtering filenames with a regular expression. Directories matching
+	the exclude expression are not descended.
 	"""
 	files = []
-	stack = [ root, ]
 	if callback is None:
 		callback = lambda x:files.append(x)
-	while stack and ( not depth or len(stack) <= depth ):
-		d = stack.pop()
-		subs = []
-		for e in listdir( d ):
-			c = join( d, e )
-			if isdir( c ):
-				subs.append( c )
-			elif ((not include) or match( include, c)) \
-				 and ((not exclude) or not match( exclude, c)):
-				callback( c )
-		stack.extend( subs )
+	for c in iwalk( root, depth, include, exclude, threads ):
+		callback( c )
 	return files
 
 if __name__=="__main__":
@@ -33,4 +90,3 @@ if __name__=="__main__":
 			None if len(sys.argv) < 3 else int(sys.argv[2]),
 			None if len(sys.argv) < 4 else     sys.argv[3] ):
 		print( f )
-
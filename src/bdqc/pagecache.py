@@ -0,0 +1,111 @@
+
+"""
+Page cache advice for files read in their entirety, once.
+
+A scan reads every byte of (potentially) very many files that it will not
+read again. Under the default "keep" policy those files' pages are left to
+the kernel, which may evict everything else cached to hold them. Under the
+"drop" policy the pages are released (by posix_fadvise), in ranges of
+DROP_INTERVAL bytes, as reading passes them.
+In either case files are read with sequential advice so read-ahead is
+maximal.
+
+The policy is per-process; it applies to files opened by the compiled
+scanners as well as by plugins that use sequential() below.
+"""
+
+import os
+from contextlib import contextmanager
+
+import bdqc.builtin.compiled
+
+KEEP = "keep"
+DROP = "drop"
+POLICIES = ( KEEP, DROP )
+
+_policy = KEEP
+
+# The bytes read between releases under the "drop" policy (as the compiled
+# scanners' CACHE_DROP_INTERVAL).
+DROP_INTERVAL = 8*1024*1024
+
+def set_policy( policy ):
+	global _policy
+	if policy not in POLICIES:
+		raise ValueError( "unknown cache policy \"{}\"".format( policy ) )
+	bdqc.builtin.compiled.set_cache_policy( policy )
+	_policy = policy
+
+def policy():
+	return _policy
+
+def _advise( fp, advice, offset=0, length=0 ):
+	try:
+		os.posix_fadvise( fp.fileno(), offset, length, advice )
+	except OSError:
+		pass # ...advice is only advice.
+
+class _Releasing(object):
+	"""
+	Wraps a file opened by sequential so that, as it's read, the pages
+	preceding its position are released every DROP_INTERVAL bytes.
+	Everything but reading is delegated to the file.
+	"""
+
+	def __init__( self, fp ):
+		self._fp = fp
+		self._dropped = 0
+
+	def __getattr__( self, name ):
+		return getattr( self._fp, name )
+
+	def __iter__( self ):
+		return iter( self.readline, self._fp.read(0) )
+
+	def _consumed( self, result ):
+		POS = self._fp.tell()
+		if POS - self._dropped >= DROP_INTERVAL:
+			_advise( self._fp, os.POSIX_FADV_DONTNEED, self._dropped, POS - self._dropped )
+			self._dropped = POS
+		return result
+
+	def read( self, *args ):
+		return self._consumed( self._fp.read( *args ) )
+
+	def read1( self, *args ):
+		return self._consumed( self._fp.read1( *args ) )
+
+	def readinto( self, b ):
+		return self._consumed( self._fp.readinto( b ) )
+
+	def readline( self, *args ):
+		return self._consumed( self._fp.readline( *args ) )
+
+@contextmanager
+def sequential( name, mode="rb" ):
+	"""
+	Open <name> as open() does for a single sequential reading, and, under
+	the "drop" policy, release its pages from the page cache as it's read
+	and, finally, on exit. The latter covers pages read other than by the
+	file's read methods (e.g. after seeks).
+	"""
+	with open( name, mode ) as fp:
+		if hasattr( os, 'posix_fadvise' ):
+			_advise( fp, os.POSIX_FADV_SEQUENTIAL )
+		try:
+			if _policy == DROP and hasattr( os, 'posix_fadvise' ):
+				yield _Releasing( fp )
+			else:
+				yield fp
+		finally:
+			if _policy == DROP and hasattr( os, 'posix_fadvise' ):
+				_advise( fp, os.POSIX_FADV_DONTNEED )
+
+# Unit test
+if __name__=="__main__":
+	import sys
+	set_policy( sys.argv[1] )
+	for name in sys.argv[2:]:
+		with sequential( name ) as fp:
+			n = sum( len(b) for b in iter( lambda:fp.read(1<<20), b'' ) )
+		print( name, n )
@@ -22,15 +22,30 @@ Plugins
 import sys
 import os.path
 import os
+import stat
 import json
+import hashlib
+import pathlib
 import time
 import logging
 import io
+import queue
+import threading
+import itertools
+import collections
+import multiprocessing
 import pkg_resources
 import warnings
+try:
+	import resource
+except ImportError: # ...it's Unix-only.
+	resource = None
 
 import bdqc.plugin
 import bdqc.dir
+import bdqc.pagecache
+import bdqc.store
+import bdqc.digest
 from bdqc.analysis import Matrix
 from bdqc.statpath import selectors
 
@@ -38,38 +53,145 @@ ANALYSIS_EXTENSION = ".bdqc"
 DATA_PATH = pkg_resources.resource_filename('bdqc', '')
 DEFAULT_PLUGIN_RCFILE = pkg_resources.resource_filename('bdqc', '/plugins.txt')
 _PLUGIN_VERSION = "VERSION"
+# A plugin declaring itself INTRINSIC promises that its results depend
+# only on the content of the subject, the subject's extension(s) and its
+# upstream results, so that they may be shared among identical files.
+_PLUGIN_INTRINSIC = "INTRINSIC"
+# A plugin declaring STAT = True is passed, as a third argument to its
+# process, the subject's os.stat_result (usually taken in discovery), so
+# it needn't stat the subject itself.
+_PLUGIN_STAT = "STAT"
+# A plugin whose results depend on settings besides its input (e.g. on
+# environment variables) declares them in a JSON-serializable CONTEXT, so
+# that results computed under other settings are neither taken as current
+# nor shared.
+_PLUGIN_CONTEXT = "CONTEXT"
 _CACHE_VERSION  = "version"
+# Subjects are handed to pool workers in batches of this size to amortize
+# interprocess communication...
+_POOL_CHUNKSIZE = 8
+# ...and at most this many batches per worker are outstanding at once.
+_POOL_BACKLOG = 4
+# Discovery of subjects runs ahead of their processing by at most this many.
+_LOOKAHEAD = 65536
+# At most this many threads inflate each BGZF file by default (as in bgzf.c).
+_MAX_DECOMPRESSION_THREADS = 8
+
+def _as_subject( item ):
+	"""
+	Subjects are filenames or ( filename, os.stat_result ) pairs; returns
+	the latter with None for the unknown os.stat_result of the former.
+	"""
+	return item if isinstance( item, tuple ) else ( item, None )
+
+
+def _read_manifest( name ):
+	"""
+	Generate the filenames listed in the file <name>, up to its first empty
+	line. No validation or existence checks are desired at this point.
+	"""
+	with open( name ) as fp:
+		for line in fp:
+			if len(line) <= 1:
+				break
+			yield line.rstrip()
 
-def build_input( subjects, include=None, exclude=None, depth=None, preclude_recursion=True ):
+
+def build_input( subjects, include=None, exclude=None, depth=None, preclude_recursion=True, walk_threads=1, with_stat=False ):
 	"""
-	Create a list of absolute file paths from a variety of sources in
-	the <subjects> list which may include:
+	Generate file paths from a variety of sources in the <subjects> list
+	which may include:
 	1. root directories to be recursively walked
 	2. file names to include verbatim
 	3. file naems of manifests which contain filenames to be included.
+	Sources are read lazily, as paths are consumed, so that processing
+	can begin as soon as the first path is found. Directories are walked
+	by walk_threads threads (see bdqc.dir.iwalk). If with_stat, subjects
+	are generated as ( path, os.stat_result ) pairs, with the latter None
+	unless it was had for free in walking a directory.
 	"""
-	accum = []
+	filtered = 0
 	for s in subjects:
 		try:
 			if s.startswith("@"):
-				with open( s[1:] ) as fp:
-					accum.extend( _read_manifest( fp ) )
+				source = map( _as_subject, _read_manifest( s[1:] ) )
 			elif os.path.isdir( s ):
-				accum.extend( bdqc.dir.walk( s, depth, include, exclude ) )
+				source = bdqc.dir.iwalk( s, depth, include, exclude, walk_threads, with_stat )
+				if not with_stat:
+					source = map( _as_subject, source )
 			else:
-				accum.append( s )
+				source = ( ( s, None ), )
+			for f,st in source:
+				# If user reruns bdqc.scan on a directory already containing
+				# .bdqc without a sufficiently specific manifest and/or
+				# filters, recursive analysis will occur that is almost
+				# certainly not wanted.
+				if preclude_recursion and f.endswith(ANALYSIS_EXTENSION):
+					filtered += 1
+				else:
+					yield ( f, st ) if with_stat else f
 		except RuntimeError as x:
 			print( x, file=sys.stderr )
-	# If user reruns bdqc.scan on a directory already containing .bdqc
-	# without a sufficiently specific manifest and/or filters, recursive
-	# analysis will occur that is almost certainly not wanted.
-	if preclude_recursion:
-		prefilter_count = len(accum)
-		accum = list(filter( lambda f:not f.endswith(ANALYSIS_EXTENSION), accum ))
-		if len(accum) < prefilter_count:
-			logging.warning( "filtered {} *{} files".format(
-				prefilter_count-len(accum), ANALYSIS_EXTENSION ) )
-	return accum
+	if filtered > 0:
+		logging.warning( "filtered {} *{} files".format(
+			filtered, ANALYSIS_EXTENSION ) )
+
+
+class _Lookahead(object):
+	"""
+	Iterates over subjects drawn, by a thread of its own, from a possibly
+	slow and lazy source (e.g. a directory walk) so that discovery of
+	subjects overlaps their processing. At most <limit> subjects are held
+	between the two. discovered counts the subjects drawn so far, which,
+	once exhausted, is their total.
+	"""
+
+	_END = object()
+
+	def __init__( self, subjects, limit ):
+		self.discovered = 0
+		self.exhausted = False
+		self._queue = queue.Queue( limit )
+		self._closed = threading.Event()
+		self._thread = threading.Thread( target=self._draw, args=( subjects, ), daemon=True )
+		self._thread.start()
+
+	def _put( self, item ):
+		while not self._closed.is_set():
+			try:
+				self._queue.put( item, timeout=0.5 )
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def _draw( self, subjects ):
+		try:
+			for s in subjects:
+				self.discovered += 1
+				if not self._put( s ):
+					return
+		except Exception as X:
+			# ...delivered to, and raised by, the consumer.
+			self._put( X )
+			return
+		self.exhausted = True
+		self._put( self._END )
+
+	def __iter__( self ):
+		while True:
+			s = self._queue.get()
+			if s is self._END:
+				return
+			if isinstance( s, Exception ):
+				raise s
+			yield s
+
+	def close( self ):
+		"""
+		Stop drawing subjects (if still doing so).
+		"""
+		self._closed.set()
 
 
 def _format_time( s ):
@@ -91,6 +213,77 @@ def _format_time( s ):
 		return "{:02d}:{:02d}:{:02d}".format( h, m, s )
 
 
+def _is_shareable( plugin ):
+	return getattr( plugin, _PLUGIN_INTRINSIC, False ) \
+		and hasattr( plugin, _PLUGIN_VERSION )
+
+
+def _version( plugin ):
+	"""
+	What the store records of a plugin with complete results: its VERSION
+	and, if it declares one, its CONTEXT.
+	"""
+	VERSION = getattr( plugin, _PLUGIN_VERSION, None )
+	if hasattr( plugin, _PLUGIN_CONTEXT ):
+		return [ VERSION, getattr( plugin, _PLUGIN_CONTEXT ) ]
+	return VERSION
+
+
+def _context( name, plugin, cache ):
+	"""
+	Everything besides content on which the results of an intrinsic plugin
+	may depend: name's extension(s), the plugin's upstream results and its
+	CONTEXT, if any.
+	"""
+	upstream = json.dumps( { dep:cache.get(dep,None)
+		for dep in getattr(plugin,"DEPENDENCIES",[]) }, sort_keys=True )
+	if hasattr( plugin, _PLUGIN_CONTEXT ):
+		upstream += json.dumps( getattr( plugin, _PLUGIN_CONTEXT ), sort_keys=True )
+	return "{}:{}".format( ''.join( pathlib.PurePath( name ).suffixes ).lower(),
+		hashlib.blake2b( upstream.encode(), digest_size=16 ).hexdigest() )
+
+
+def _bytes_read():
+	"""
+	Bytes the calling thread has so far read from storage (as opposed to
+	from the page cache), or 0 where that isn't known. Where per-thread
+	usage isn't available (it's Linux-only) the whole process' is used.
+	"""
+	if resource is None:
+		return 0
+	WHO = getattr( resource, "RUSAGE_THREAD", resource.RUSAGE_SELF )
+	return resource.getrusage( WHO ).ru_inblock * 512
+
+
+# Each process in an Executor's pool holds its own Executor, created once
+# by _init_worker, with which it processes every subject sent to it.
+_worker_executor = None
+
+def _init_worker( plugin_names, clobber, ignore_exceptions, cache_policy, store, want_results, dedup, jobs ):
+	"""
+	Pool initializer. Modules can't be pickled, so the worker reloads the
+	plugins by name and resolves the same execution order as the parent.
+	Unless DECOMPRESSION_THREADS is set, the workers share the processors
+	in inflating BGZF files rather than each using all of them.
+	"""
+	global _worker_executor
+	if "DECOMPRESSION_THREADS" not in os.environ:
+		os.environ["DECOMPRESSION_THREADS"] = str( max( 1,
+			min( _MAX_DECOMPRESSION_THREADS, ( os.cpu_count() or 1 ) // jobs ) ) )
+	bdqc.pagecache.set_policy( cache_policy )
+	_worker_executor = Executor( bdqc.plugin.Manager( plugin_names ), [],
+		clobber = clobber,
+		dryrun = False,
+		store = store,
+		dedup = dedup )
+	_worker_executor.ignore_exceptions = ignore_exceptions
+	_worker_executor.want_results = want_results
+
+
+def _process_in_worker( chunk ):
+	return [ _worker_executor._process_subject( s, st ) for s,st in chunk ]
+
+
 class Executor(object):
 	"""
 	Manages the execution of a set of file-analysis plugins on a set of
@@ -100,15 +293,37 @@ class Executor(object):
 	"""
 
 	def __init__( self, plugin_mgr, subjects, **kwargs ):
-		assert isinstance( subjects, list ) and \
-			all([isinstance(s,str) for s in subjects ])
+		"""
+		subjects may be any iterable of filenames, or of ( filename,
+		os.stat_result ) pairs, including a generator (e.g. from
+		build_input); it is iterated once, by run. A subject's
+		os.stat_result, if given, is used in place of stat'ing it again.
+		"""
 		assert isinstance( plugin_mgr, bdqc.plugin.Manager )
 		self.subjects = subjects
 		self.plugin_mgr = plugin_mgr
 		self.results = {}
-		self.adjacent = kwargs.get( "cache",   True )
+		# "cache" is this option's original name.
+		self.adjacent = kwargs.get( "adjacent", kwargs.get( "cache", True ) )
 		self.clobber  = kwargs.get( "clobber", True )
 		self.dryrun   = kwargs.get( "dryrun",  False ) 
+		self.jobs     = kwargs.get( "jobs",    1 )
+		# If a store (filename) is given, results are kept there rather
+		# than (or as well as, if adjacent) alongside each subject.
+		STORE = kwargs.get( "store", None )
+		self.store = bdqc.store.Store( STORE ) if STORE else None
+		# The version (and context) of every plugin, recorded in the store
+		# with complete results so that it can tell when they're current.
+		self.versions = { p.__name__:_version( p ) for p in iter(plugin_mgr) }
+		# Whether results that are still current must be read (see run).
+		self.want_results = True
+		# If dedup, intrinsic plugins' results are shared (via the store)
+		# among subjects with identical content.
+		self.dedup = kwargs.get( "dedup", False )
+		if self.dedup and self.store is None:
+			raise ValueError( "deduplication requires a store" )
+		# Total of subjects' bytes_read (see _process_subject) after run.
+		self.bytes_read = 0
 
 	def __del__( self ):
 		pass
@@ -178,132 +393,375 @@ class Executor(object):
 				plugin_version, "" if run else "not ", oldres_version )
 			return ( upstream_results if run else None, why )
 
-	def run( self, matrix:"bdqc.analysis.Matrix"=None, **args ):
+	def _in_context( self, s, st, cache ):
 		"""
-		Returns a count of missing files.
-		TODO: Eventually this should incorporate the multiprocessing module.
+		Remove from cache (as returned by the store for s) the results of
+		plugins declaring a CONTEXT unless the store confirms they were
+		computed in the current one. Returns cache.
 		"""
-		missing = 0
+		CONTEXTUAL = [ p.__name__ for p in iter(self.plugin_mgr)
+			if hasattr( p, _PLUGIN_CONTEXT ) and p.__name__ in cache ]
+		if CONTEXTUAL:
+			VERSIONS = self.store.versions( s, st ) or {}
+			for name in CONTEXTUAL:
+				if VERSIONS.get( name ) != self.versions[ name ]:
+					del cache[ name ]
+		return cache
+
+	def _identify( self, s, st ):
+		"""
+		Identify the content of s for deduplication. Returns a pair:
 
-		accumulate = args.get( "accumulator", None )
-		progress = args.get( "progress_output", None )
+			( shared, content )
 
-		assert accumulate is None or isinstance( accumulate, io.TextIOBase )
-		assert progress is None or isinstance( progress, io.TextIOBase )
+		...where shared is a dict of results computed from content
+		identical to s's (as returned by bdqc.store.Store.shared) and
+		content is a list of rows for Store.put_content, s's first. Full
+		digests are computed only when partial digests collide: s's and
+		those of any colliding subjects that were never needed before.
+		Raises OSError if s can't be read; colliding subjects that can't
+		be are ignored.
+		"""
+		def _full( name, size ):
+			return PARTIAL if bdqc.digest.is_complete( size ) else bdqc.digest.full( name )
+
+		known = self.store.content_of( s, st )
+		PARTIAL = known[0] if known else bdqc.digest.partial( s )
+		others = self.store.others_with_partial( s, PARTIAL )
+		if not others:
+			return ( {}, [ ( s, st.st_size, st.st_mtime_ns, PARTIAL, None ) ] )
+
+		DIGEST = known[1] if known and known[1] else _full( s, st.st_size )
+		content = [ ( s, st.st_size, st.st_mtime_ns, PARTIAL, DIGEST ) ]
+		shared = self.store.shared( DIGEST )
+		seeded = False
+		for path,size,mtime_ns,digest in others:
+			if digest is not None and ( seeded or digest != DIGEST ):
+				continue
+			try:
+				ost = os.stat( path )
+				if ( ost.st_size, ost.st_mtime_ns ) != ( size, mtime_ns ):
+					continue # ...it will be identified anew when next scanned.
+				if digest is None:
+					digest = _full( path, size )
+					content.append( ( path, size, mtime_ns, PARTIAL, digest ) )
+			except OSError:
+				continue
+			if digest == DIGEST and not seeded:
+				# Its results may never have been shared (if its digest
+				# wasn't known when they were stored), but they're the same.
+				seeded = True
+				cache = self._in_context( path, ost, self.store.get( path, ost ) )
+				for p in iter(self.plugin_mgr):
+					d = cache.get( p.__name__, None )
+					if _is_shareable( p ) and d and _CACHE_VERSION in d:
+						d = dict( d )
+						shared.setdefault( ( p.__name__, d.pop( _CACHE_VERSION ),
+							_context( path, p, cache ) ), d )
+		return ( shared, content )
+
+	def _process_subject( self, s, st=None ):
+		"""
+		Apply each plugin, in execution order, to the single subject s,
+		whose os.stat_result st (if not given) is taken once, here, and
+		passed to every plugin that declares STAT (see _PLUGIN_STAT).
+		This is everything run does per subject EXCEPT disposition of the
+		results, so it may be carried out in another process.
+
+		Returns a 5-tuple:
+
+			( cache, st, bytes_read, current, content )
+
+		...where cache is the dict of all plugins' results for s (updated
+		from any earlier results), st is the os.stat_result of s taken
+		before any plugin ran (or None if s is not a file) and bytes_read
+		is the count of bytes the plugins read from storage (rather than
+		the page cache) in processing it (see _bytes_read; reads by other
+		threads, e.g. discovery's, are excluded). current is True if the store
+		held complete results still current for s (in which case cache is
+		empty unless self.want_results), None if any plugin failed on s
+		and otherwise False. If self.dedup, content is as returned by
+		_identify; otherwise it is None.
+		"""
+		ST = st
+		if ST is None:
+			try:
+				ST = os.stat( s )
+			except OSError:
+				pass
+		SUBJECT_EXISTS = ST is not None and stat.S_ISREG( ST.st_mode )
+		bytes_read = 0
+		ran = set()
+		failed = False
 
-		if accumulate:
-			print( "{", file=accumulate )
+		# 0. If the store holds complete results for s from exactly these
+		#    plugins since s last changed, running them can change nothing.
+		#    s isn't even opened, and the results are read only if wanted.
 
-		completed_subjects = 0
-		ran = set()
-		START_TIME = time.clock()
-		for s in self.subjects: # for each file...
-
-			SUBJECT_EXISTS = os.path.isfile( s )
-			ran.clear()
-
-			# 1. If the data and cache both exist and the data is newer than
-			#    the cache, everything in the cache is assumed invalid.
-		 	#    Otherwise, because the cache is written in its entirety (at
-			#    bottom), it must be read in first. It may happen that only
-		 	#    parts of the cache are updated.
-
-			cache_file = s + ANALYSIS_EXTENSION
-			if not self.clobber \
-				and SUBJECT_EXISTS \
-				and os.path.isfile( cache_file ) \
-				and os.stat( s ).st_mtime < os.stat( cache_file ).st_mtime:
-				try:
-					with open(cache_file) as fp:
-						cache = json.load( fp )
-				except ValueError:
-					logging.error( "content of {} is invalid JSON".format(cache_file) )
-					# This is also thrown when cache_file is a present,
-					# but empty file; handling the ValueError exception is
-					# more general...includes malformed content.
-					cache = {}
+		if SUBJECT_EXISTS and self.store and not self.clobber \
+			and self.store.is_current( s, ST, self.versions ):
+			if self.dryrun:
+				print( "{}: skip all plugins because it and they are unchanged since its results were stored".format( s ) )
 			else:
+				logging.info( "skipping {}: results are current".format( s ) )
+			cache = self.store.get( s, ST ) if self.want_results else {}
+			return ( cache, ST, 0, True, None )
+
+		# 1. If the data and cache both exist and the data is newer than
+		#    the cache, everything in the cache is assumed invalid.
+		#    Otherwise, because the cache is written in its entirety (by
+		#    run), it must be read in first. It may happen that only
+		#    parts of the cache are updated. A store only returns results
+		#    computed when the data had its current size and mtime.
+
+		cache_file = s + ANALYSIS_EXTENSION
+		try:
+			CACHE_ST = os.stat( cache_file ) \
+				if SUBJECT_EXISTS and not ( self.clobber or self.store ) else None
+		except OSError:
+			CACHE_ST = None
+		if self.clobber or not SUBJECT_EXISTS:
+			cache = {}
+		elif self.store:
+			cache = self._in_context( s, ST, self.store.get( s, ST ) )
+		elif CACHE_ST and stat.S_ISREG( CACHE_ST.st_mode ) \
+			and ST.st_mtime < CACHE_ST.st_mtime:
+			try:
+				with open(cache_file) as fp:
+					cache = json.load( fp )
+			except ValueError:
+				logging.error( "content of {} is invalid JSON".format(cache_file) )
+				# This is also thrown when cache_file is a present,
+				# but empty file; handling the ValueError exception is
+				# more general...includes malformed content.
 				cache = {}
-			# An empty cache dict insures _should_run will return True.
-
-			# 2. Apply each plugin to s.
+		else:
+			cache = {}
+		# An empty cache dict insures _should_run will return True.
+
+		# Clobbering reruns everything, so nothing is reused.
+		shared,content = {},None
+		if self.dedup and SUBJECT_EXISTS and not ( self.dryrun or self.clobber ):
+			try:
+				shared,content = self._identify( s, ST )
+			except FileNotFoundError:
+				# It has vanished since ST was taken (in discovery).
+				return ( {}, None, 0, False, None )
+			except OSError as X:
+				# The plugins run (and report on it) as if without dedup.
+				logging.warning( "{} while identifying {}; not deduplicating it".format( X, s ) )
+
+		# 2. Apply each plugin to s.
+
+		if SUBJECT_EXISTS or self.dryrun:
+
+			for p in iter(self.plugin_mgr):
+
+				USR,REASON = self._should_run( p, cache, ran )
+				RUN = USR is not None # UpStream Results not None
+
+				if self.dryrun:
+
+					# ALWAYS print on stdout; that's the point of dry run!
+					print( "{}({}): {} because {}".format( p.__name__, s,
+						"run" if RUN else "skip",
+						REASON ) )
+					if RUN:
+						ran.add( p.__name__ ) # *would* have been run!
+
+				elif RUN:
+
+					try:
+						d = None
+						if shared and _is_shareable( p ):
+							d = shared.get( ( p.__name__, int( getattr( p, _PLUGIN_VERSION ) ),
+								_context( s, p, cache ) ), None )
+						if d is not None:
+							logging.info( "reusing {} results of content identical to {}".format( p.__name__, s ) )
+							d = dict( d )
+						else:
+							READ_BEFORE = _bytes_read()
+							if getattr( p, _PLUGIN_STAT, False ):
+								d = p.process( s, USR, ST )
+							else:
+								d = p.process( s, USR )
+							bytes_read += _bytes_read() - READ_BEFORE
+
+						if d is not None:
+
+							# Insure plugin's result is wrapped in a dict.
+							if not isinstance(d,dict):
+								d = {"value":d,}
+							# Automatically append plugin's version to results.
+							if hasattr( p, _PLUGIN_VERSION ):
+								d[_CACHE_VERSION] = int( getattr( p, _PLUGIN_VERSION ) )
+
+							# Add this plugin's results to subject's cache.
+							cache[ p.__name__ ] = d
+							ran.add( p.__name__ )
+
+					except Exception as X:
+						logging.error( "{} while processing {} with {}".format( X, s, p.__name__ ) )
+						failed = True
+						if not getattr(self,"ignore_exceptions",False):
+							raise
+				else:
+					logging.info( "skipping {}({}): {}".format( p.__name__, s, REASON ) )
+			else:
+				pass # just tagging the end of the for loop.
 
-			if SUBJECT_EXISTS or self.dryrun:
+		return ( cache, ST if SUBJECT_EXISTS else None, bytes_read,
+			None if failed else False, content )
 
+	def _store( self, s, st, cache, current, content ):
+		"""
+		Queue the results of s (see _process_subject) in the store.
+		"""
+		# Results are complete unless a plugin failed.
+		self.store.put( s, st, cache, None if current is None else self.versions )
+		if content:
+			for row in content:
+				self.store.put_content( *row )
+			DIGEST = content[0][-1]
+			if DIGEST is not None:
 				for p in iter(self.plugin_mgr):
+					d = cache.get( p.__name__, None )
+					if _is_shareable( p ) and d and _CACHE_VERSION in d:
+						self.store.put_shared( DIGEST, p.__name__, d[_CACHE_VERSION],
+							_context( s, p, cache ), d )
 
-					USR,REASON = self._should_run( p, cache, ran )
-					RUN = USR is not None # UpStream Results not None
+	def _create_pool( self ):
+		"""
+		Create a pool of self.jobs worker processes each of which runs the
+		same plugins (in the same order) as this Executor.
+		"""
+		names = [ p.__name__ for p in iter(self.plugin_mgr) ]
+		return multiprocessing.Pool( self.jobs, _init_worker,
+			( names, self.clobber, getattr(self,"ignore_exceptions",False),
+			bdqc.pagecache.policy(),
+			self.store.filename if self.store else None,
+			self.want_results,
+			self.dedup,
+			self.jobs ) )
+
+	def _dispatch( self, pool, subjects ):
+		"""
+		Generate ( subject, outcome ) pairs, in subject order, from the
+		processing of the iterator <subjects> (of ( filename, stat )
+		pairs) by <pool>. Only a few chunks
+		per worker are outstanding at once, so subjects are drawn only as
+		fast as they are processed.
+		"""
+		pending = collections.deque()
+		LIMIT = _POOL_BACKLOG * self.jobs
+		for chunk in iter( lambda:list( itertools.islice( subjects, _POOL_CHUNKSIZE ) ), [] ):
+			pending.append( ( chunk, pool.apply_async( _process_in_worker, ( chunk, ) ) ) )
+			while len(pending) > LIMIT:
+				chunk,outcomes = pending.popleft()
+				yield from zip( ( s for s,_ in chunk ), outcomes.get() )
+		while pending:
+			chunk,outcomes = pending.popleft()
+			yield from zip( ( s for s,_ in chunk ), outcomes.get() )
 
-					if self.dryrun:
+	def run( self, matrix:"bdqc.analysis.Matrix"=None, **args ):
+		"""
+		Returns a count of missing files.
 
-						# ALWAYS print on stdout; that's the point of dry run!
-						print( "{}({}): {} because {}".format( p.__name__, s,
-							"run" if RUN else "skip",
-							REASON ) )
-						if RUN:
-							ran.add( p.__name__ ) # *would* have been run!
+		If self.jobs > 1 subjects are processed by a pool of that many
+		worker processes. Results are nonetheless delivered to the matrix,
+		the accumulator and the progress output by this process in subject
+		order, so output is identical to that of a serial run.
+		Dry runs are always serial.
 
-					elif RUN:
+		Subjects are drawn from self.subjects as processing proceeds, so
+		progress is reported against an estimated total: the count of
+		subjects discovered so far, marked "+" until discovery finishes.
+		"""
+		missing = 0
 
-						try:
-							d = p.process( s, USR )
+		accumulate = args.get( "accumulator", None )
+		progress = args.get( "progress_output", None )
 
-							if d is not None:
+		assert accumulate is None or isinstance( accumulate, io.TextIOBase )
+		assert progress is None or isinstance( progress, io.TextIOBase )
+
+		if accumulate:
+			print( "{", file=accumulate )
 
-								# Insure plugin's result is wrapped in a dict.
-								if not isinstance(d,dict):
-									d = {"value":d,}
-								# Automatically append plugin's version to results.
-								if hasattr( p, _PLUGIN_VERSION ):
-									d[_CACHE_VERSION] = int( getattr( p, _PLUGIN_VERSION ) )
+		# Results of subjects the store holds as current are needed only
+		# if they're going somewhere.
+		self.want_results = matrix is not None or accumulate is not None or self.adjacent
 
-								# Add this plugin's results to subject's cache.
-								cache[ p.__name__ ] = d
-								ran.add( p.__name__ )
+		# The pool is forked before discovery's threads start: a child
+		# forked from a multi-threaded process inherits any locks other
+		# threads held at the time, held forever.
+		if self.jobs > 1 and not self.dryrun:
+			pool = self._create_pool()
+		else:
+			pool = None
+		source = _Lookahead( self.subjects, _LOOKAHEAD )
+		subjects = map( _as_subject, source )
+		if pool:
+			outcomes = self._dispatch( pool, subjects )
+		else:
+			outcomes = ( ( s, self._process_subject( s, st ) ) for s,st in subjects )
 
-						except Exception as X:
-							logging.error( "{} while processing {} with {}".format( X, s, p.__name__ ) )
-							if not getattr(self,"ignore_exceptions",False):
-								raise
-					else:
-						logging.info( "skipping {}({}): {}".format( p.__name__, s, REASON ) )
-				else:
-					pass # just tagging the end of the for loop.
-			else: # not SUBJECT_EXISTS
-				logging.warning( "{} is missing or is not a file".format( s ) )
-				missing += 1
-
-			# 3. Store locally, accumulate, and/or add to an analysis.Matrix
-			#    for immediate second stage analysis.
-
-			if not self.dryrun:
-				if matrix:
-					matrix.add_file_data( s, cache )
-				results = json.dumps( cache, sort_keys=True, indent=4 )
-				assert results is not None
-				if self.adjacent: # store JSON results adjacent to subject
-					with open( cache_file, "w" ) as fp:
-						print( results, file=fp )
-				if accumulate:
-					if completed_subjects > 0:
-						print( ",", file=accumulate )	
-					print( '"{}":'.format(s), results, file=accumulate )
-
-			# 4. Update the expected time.
-
-			completed_subjects += 1
-			if progress:
-				rem_s = ( len(self.subjects) - completed_subjects ) \
-					* ( ( time.clock() - START_TIME ) / completed_subjects )
-				if rem_s > 0:
-					time_string = _format_time( int(rem_s) )
-					prog_report = "{}/{} files. time remaining: {}".format(
-						completed_subjects,
-						len(self.subjects),
-						time_string )
-					#self.prog_len = max(len(prog_report),self.prog_len)
-					print( prog_report, end="\r" if progress.isatty() else "\n" )
+		completed_subjects = 0
+		# Wall clock time since, with a pool, this process' CPU time
+		# says nothing about progress.
+		START_TIME = time.time()
+		try:
+			for s,(cache,ST,BYTES_READ,CURRENT,CONTENT) in outcomes: # for each file...
+
+				if ST is None and not self.dryrun:
+					logging.warning( "{} is missing or is not a file".format( s ) )
+					missing += 1
+				elif not self.dryrun:
+					logging.info( "read {} bytes from storage for {}".format( BYTES_READ, s ) )
+					self.bytes_read += BYTES_READ
+
+				# 3. Store locally, accumulate, and/or add to an analysis.Matrix
+				#    for immediate second stage analysis.
+
+				if not self.dryrun:
+					if matrix:
+						matrix.add_file_data( s, cache )
+					if self.store and ST is not None and not CURRENT:
+						self._store( s, ST, cache, CURRENT, CONTENT )
+					if self.adjacent or accumulate:
+						results = json.dumps( cache, sort_keys=True, indent=4 )
+						assert results is not None
+					if self.adjacent: # store JSON results adjacent to subject
+						with open( s + ANALYSIS_EXTENSION, "w" ) as fp:
+							print( results, file=fp )
+					if accumulate:
+						if completed_subjects > 0:
+							print( ",", file=accumulate )	
+						print( '"{}":'.format(s), results, file=accumulate )
+
+				# 4. Update the expected time.
+
+				completed_subjects += 1
+				if progress:
+					ESTIMATE = max( source.discovered, completed_subjects )
+					rem_s = ( ESTIMATE - completed_subjects ) \
+						* ( ( time.time() - START_TIME ) / completed_subjects )
+					if rem_s > 0:
+						time_string = _format_time( int(rem_s) )
+						prog_report = "{}/{}{} files. time remaining: {}".format(
+							completed_subjects,
+							ESTIMATE,
+							"" if source.exhausted else "+",
+							time_string )
+						#self.prog_len = max(len(prog_report),self.prog_len)
+						print( prog_report, end="\r" if progress.isatty() else "\n" )
+		finally:
+			source.close()
+			if pool:
+				pool.terminate()
+				pool.join()
+			if self.store:
+				self.store.flush()
 
 		if accumulate:
 			print( "}", file=accumulate )
@@ -338,7 +796,9 @@ def _main( args ):
 
 	# ...and subjects from command line args.
 
-	subjects = build_input( args.subjects, args.include, args.exclude, args.depth )
+	subjects = build_input( args.subjects, args.include, args.exclude, args.depth,
+		walk_threads = args.walk_threads,
+		with_stat = True )
 
 	if args.dryrun:
 		print( "These plugins..." )
@@ -348,12 +808,17 @@ def _main( args ):
 			print( "{}. {} (from {})".format( i, p.__name__, p.__path__ ) )
 		print( "...would be executed as follows..." )
 
+	bdqc.pagecache.set_policy( args.cache_policy )
+
 	# Finally, create and run an Executor.
 
 	_exec = Executor( mgr, subjects,
 			dryrun = args.dryrun,
 			clobber = args.clobber,
-			adjacent = (not args.no_adjacent) )
+			adjacent = not ( args.no_adjacent or args.store ),
+			store = args.store,
+			dedup = args.dedup,
+			jobs = args.jobs )
 
 	status = bdqc.analysis.STATUS_NO_OUTLIERS
 
@@ -377,6 +842,7 @@ def _main( args ):
 			m = Matrix( **statistic_filters )
 
 		missing = _exec.run( m, accumulator=accum_fp, progress_output=prog_fp )
+		logging.info( "read {} bytes from storage in total".format( _exec.bytes_read ) )
 
 		if accum_fp:
 			accum_fp.close()
@@ -424,18 +890,6 @@ if __name__=="__main__":
 		else:
 			return None
 
-	def _read_manifest( fp ):
-		"""
-		Read a list of filenames from fp. No validation or
-		existence checks are desired at this point.
-		"""
-		accum = []
-		line = fp.readline()
-		while len(line) > 1:
-			accum.append( line.rstrip() )
-			line = fp.readline()
-		return accum
-
 	_parser = argparse.ArgumentParser(
 		description="A framework for \"Big Data\" QC/validation.",
 		epilog="""The command line interface is one of two ways to use this
@@ -468,14 +922,35 @@ if __name__=="__main__":
 	_parser.add_argument( "--exclude", "-E",
 		default=None,
 		help="""When recursing through directories, any files matching the
-		<exclude> pattern are excluded from the analysis. The comments
-		regarding the <include> pattern also apply here.""")
+		<exclude> pattern are excluded from the analysis, and directories
+		matching it are not descended. The comments regarding the
+		<include> pattern also apply here.""")
+	_parser.add_argument( "--walk-threads",
+		default=1, type=int,
+		help="""Number of threads listing directories concurrently, which
+		can speed discovery on network filesystems. With more than one,
+		subjects are discovered in no particular order
+		(default:%(default)s).""")
 
 	# Output control
 
 	_parser.add_argument( "--no-adjacent",
 		action='store_true', default=False,
 		help="""Don't store {} analysis files alongside the subject files""".format(ANALYSIS_EXTENSION) )
+	_parser.add_argument( "--store",
+		default=None, metavar="PATH",
+		help="""Keep all subjects' results in the single SQLite database
+		%(metavar)s (created if necessary) instead of in {} files alongside
+		them. Results are reused only while a subject's size and
+		modification time are unchanged.""".format(ANALYSIS_EXTENSION) )
+	_parser.add_argument( "--dedup",
+		action='store_true', default=False,
+		help="""Analyze identical content once. Subjects are identified by
+		digests of their content (a partial digest of their ends, and a
+		full digest only if partial digests collide) and the results of
+		intrinsic plugins are shared, through the store, among all subjects
+		with identical content, in this run and later ones. Requires
+		--store. Ignored with --clobber, which reruns everything.""" )
 	_parser.add_argument( "--dryrun", "-D",
 		action='store_true',
 		help="""Don't actually run. Just describe what would be done.""")
@@ -487,6 +962,19 @@ if __name__=="__main__":
 		action='store_true', default=False,
 		help="""Skip all optimizations intended to minimize work;
 		rerun everything (default:%(default)s).""" )
+	_parser.add_argument('-j', '--jobs',
+		type=int, default=1,
+		help="""Number of worker processes among which to distribute
+		subjects. Results are still accumulated and reported in subject
+		order. Unless DECOMPRESSION_THREADS is set, the workers divide the
+		processors among them to inflate BGZF files (default:%(default)s).""" )
+	_parser.add_argument( "--cache-policy",
+		choices=bdqc.pagecache.POLICIES, default=bdqc.pagecache.KEEP,
+		help="""Whether the subjects' pages are kept in the page cache
+		after they're read. "drop" releases them as they're read, so that
+		scanning a large collection doesn't evict everything else cached;
+		the bytes read from storage per file are logged at level info
+		(default:%(default)s).""" )
 	_parser.add_argument('-A', '--accum',
 		type=str, default="",
 		help="""The name of a file in which to accumulate results.
@@ -520,6 +1008,8 @@ if __name__=="__main__":
 		by \"@\" on the command line.""" )
 
 	_args = _parser.parse_args()
+	if _args.dedup and not _args.store:
+		_parser.error( "--dedup requires --store" )
 
 	# Set up logging before ANYTHING else.
 
@@ -0,0 +1,288 @@
+
+"""
+A central store of plugins' results: an alternative to the .bdqc JSON
+files otherwise written alongside each subject.
+
+The store is a single SQLite database (in WAL mode, so any number of
+readers, e.g. an Executor's pool workers, may proceed concurrently with
+the one writer). It holds one row per subject per plugin. A row records
+the size and modification time (in ns) of the subject and the version of
+the plugin when the result was computed, and results are only returned
+for a subject whose size and modification time are unchanged.
+
+For each subject the store also records a fingerprint (size, mtime_ns,
+inode and device) and the versions of all the plugins that ran on it.
+While both match, the subject needn't be read at all (see is_current).
+
+Finally, for content deduplication (see bdqc.digest), the store records
+subjects' content digests and the results of intrinsic plugins under the
+full digest of the content they were computed from, the plugin, its
+version and a "context" (whatever else the results depend on).
+
+Writes are queued and committed in batches, so the per-subject cost of
+updating the store is a fraction of one transaction.
+"""
+
+import sqlite3
+import json
+import os
+
+# Subjects queued by put before they are committed in one transaction.
+DEFAULT_BATCH_SIZE = 512
+# Seconds a connection waits for another's lock before failing.
+_TIMEOUT = 60.0
+# The key under which results carry their plugin's version (see
+# bdqc.scan._CACHE_VERSION).
+_VERSION = "version"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS result (
+	path     TEXT NOT NULL,
+	plugin   TEXT NOT NULL,
+	size     INTEGER NOT NULL,
+	mtime_ns INTEGER NOT NULL,
+	version  INTEGER,
+	data     TEXT NOT NULL,
+	PRIMARY KEY ( path, plugin ) );
+CREATE TABLE IF NOT EXISTS subject (
+	path     TEXT NOT NULL PRIMARY KEY,
+	size     INTEGER NOT NULL,
+	mtime_ns INTEGER NOT NULL,
+	inode    INTEGER NOT NULL,
+	device   INTEGER NOT NULL,
+	versions TEXT NOT NULL );
+CREATE TABLE IF NOT EXISTS content (
+	path     TEXT NOT NULL PRIMARY KEY,
+	size     INTEGER NOT NULL,
+	mtime_ns INTEGER NOT NULL,
+	partial  TEXT NOT NULL,
+	digest   TEXT );
+CREATE INDEX IF NOT EXISTS content_partial ON content ( partial );
+CREATE TABLE IF NOT EXISTS shared (
+	digest   TEXT NOT NULL,
+	plugin   TEXT NOT NULL,
+	version  INTEGER NOT NULL,
+	context  TEXT NOT NULL,
+	data     TEXT NOT NULL,
+	PRIMARY KEY ( digest, plugin, version, context ) );
+"""
+
+class Store(object):
+	"""
+	Results of plugins keyed by subject path, size, mtime_ns and plugin
+	version. Subjects' paths are made absolute so that runs from any
+	working directory share results.
+	"""
+
+	def __init__( self, filename, batch_size=DEFAULT_BATCH_SIZE ):
+		self.filename = filename
+		self.batch_size = batch_size
+		# Queued results by subject, so that get finds them before they're
+		# committed, as the other queues below.
+		self._pending = {}
+		self._pending_subjects = []
+		# Queued content rows by partial digest and shared results by
+		# digest, so that they are found before they're committed.
+		self._pending_content = {}
+		self._pending_shared = {}
+		self._db = sqlite3.connect( filename, timeout=_TIMEOUT )
+		self._db.execute( "PRAGMA journal_mode=WAL" )
+		# In WAL mode NORMAL is safe from corruption; a crash may only
+		# lose the last transactions, which are merely recomputed.
+		self._db.execute( "PRAGMA synchronous=NORMAL" )
+		with self._db:
+			self._db.executescript( _SCHEMA )
+
+	@staticmethod
+	def key( path ):
+		return os.path.abspath( path )
+
+	@staticmethod
+	def fingerprint( st ):
+		return ( st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev )
+
+	@staticmethod
+	def _versions( versions ):
+		"""
+		Canonical text of a dict mapping plugin names to versions.
+		"""
+		return json.dumps( versions, sort_keys=True, separators=(',',':') )
+
+	def is_current( self, path, st, versions ):
+		"""
+		Returns True if the subject <path> had the fingerprint of <st> when
+		results were last put for it and the plugins that produced them
+		are exactly those (with the same versions) in <versions>, a dict.
+		That is, if running the plugins again could change nothing.
+		"""
+		row = self._db.execute(
+			"SELECT 1 FROM subject WHERE path=? AND size=? AND mtime_ns=? AND inode=? AND device=? AND versions=?",
+			( self.key(path), ) + self.fingerprint(st) + ( self._versions(versions), ) ).fetchone()
+		return row is not None
+
+	def versions( self, path, st ):
+		"""
+		Returns the <versions> (see is_current) last put, with complete
+		results, for the subject <path> if it had the size and mtime of
+		<st>, otherwise None.
+		"""
+		KEY = self.key( path )
+		for r in reversed( self._pending_subjects ):
+			if r[0] == KEY:
+				row = ( r[1], r[2], r[-1] )
+				break
+		else:
+			row = self._db.execute(
+				"SELECT size,mtime_ns,versions FROM subject WHERE path=?",
+				( KEY, ) ).fetchone()
+		if row is None or row[2] is None \
+			or ( row[0], row[1] ) != ( st.st_size, st.st_mtime_ns ):
+			return None
+		return json.loads( row[2] )
+
+	def get( self, path, st ):
+		"""
+		Returns a dict mapping plugin names to results for the subject
+		<path> whose current os.stat_result is <st>, containing only
+		results computed when the subject had the same size and mtime.
+		Results' "version" is that of the plugin that computed them.
+		"""
+		KEY = self.key( path )
+		if KEY in self._pending:
+			size,mtime_ns,rows = self._pending[ KEY ]
+			if ( size, mtime_ns ) != ( st.st_size, st.st_mtime_ns ):
+				rows = []
+		else:
+			rows = self._db.execute(
+				"SELECT plugin,version,data FROM result WHERE path=? AND size=? AND mtime_ns=?",
+				( KEY, st.st_size, st.st_mtime_ns ) )
+		cache = {}
+		for plugin,version,data in rows:
+			d = json.loads( data )
+			if version is not None:
+				d[_VERSION] = version
+			cache[ plugin ] = d
+		return cache
+
+	def put( self, path, st, cache, versions=None ):
+		"""
+		Queue every plugin's result in <cache> (a dict as returned by get)
+		for the subject <path> whose os.stat_result is <st>. If <versions>
+		(see is_current) is given, the results are complete: the subject
+		is current until it or any plugin changes. Results are committed
+		once batch_size subjects are queued, or by flush.
+		"""
+		KEY = self.key( path )
+		rows = []
+		for plugin,d in cache.items():
+			d = dict( d )
+			version = d.pop( _VERSION, None )
+			rows.append( ( plugin, version,
+				json.dumps( d, sort_keys=True, separators=(',',':') ) ) )
+		self._pending[ KEY ] = ( st.st_size, st.st_mtime_ns, rows )
+		self._pending_subjects.append( ( KEY, ) + self.fingerprint(st)
+			+ ( None if versions is None else self._versions(versions), ) )
+		if len(self._pending_subjects) >= self.batch_size:
+			self.flush()
+
+	def others_with_partial( self, path, partial ):
+		"""
+		Returns a list of ( path, size, mtime_ns, digest ) of the subjects
+		other than <path> whose content had the <partial> digest when they
+		were last put. digest is None if it was never needed.
+		"""
+		KEY = self.key( path )
+		others = { r[0]:r[1:] for r in self._db.execute(
+			"SELECT path,size,mtime_ns,digest FROM content WHERE partial=?",
+			( partial, ) ) }
+		others.update( self._pending_content.get( partial, {} ) )
+		others.pop( KEY, None )
+		return [ (k,)+v for k,v in others.items() ]
+
+	def content_of( self, path, st ):
+		"""
+		Returns ( partial, digest ) as last put for the subject <path> if
+		it had the size and mtime of <st>, otherwise None.
+		"""
+		KEY = self.key( path )
+		for partial,paths in self._pending_content.items():
+			if KEY in paths:
+				size,mtime_ns,digest = paths[ KEY ]
+				break
+		else:
+			row = self._db.execute(
+				"SELECT size,mtime_ns,partial,digest FROM content WHERE path=?",
+				( KEY, ) ).fetchone()
+			if row is None:
+				return None
+			size,mtime_ns,partial,digest = row
+		if ( size, mtime_ns ) != ( st.st_size, st.st_mtime_ns ):
+			return None
+		return ( partial, digest )
+
+	def shared( self, digest ):
+		"""
+		Returns a dict mapping ( plugin, version, context ) to the results
+		computed from content with the (full) <digest>.
+		"""
+		shared = { (plugin,version,context):json.loads( data )
+			for plugin,version,context,data in self._db.execute(
+				"SELECT plugin,version,context,data FROM shared WHERE digest=?",
+				( digest, ) ) }
+		shared.update( self._pending_shared.get( digest, {} ) )
+		return shared
+
+	def put_content( self, path, size, mtime_ns, partial, digest=None ):
+		self._pending_content.setdefault( partial, {} )[ self.key(path) ] \
+			= ( size, mtime_ns, digest )
+
+	def put_shared( self, digest, plugin, version, context, d ):
+		d = dict( d )
+		d.pop( _VERSION, None )
+		self._pending_shared.setdefault( digest, {} )[ (plugin,version,context) ] = d
+
+	def flush( self ):
+		"""
+		Commit all queued results in one transaction.
+		"""
+		if self._pending_subjects or self._pending_content or self._pending_shared:
+			with self._db:
+				self._db.executemany(
+					"INSERT OR REPLACE INTO result VALUES (?,?,?,?,?,?)",
+					[ (path,plugin,size,mtime_ns,version,data)
+						for path,(size,mtime_ns,rows) in self._pending.items()
+						for plugin,version,data in rows ] )
+				# Incomplete results leave their subject not current.
+				self._db.executemany(
+					"DELETE FROM subject WHERE path=?",
+					[ (r[0],) for r in self._pending_subjects if r[-1] is None ] )
+				self._db.executemany(
+					"INSERT OR REPLACE INTO subject VALUES (?,?,?,?,?,?)",
+					[ r for r in self._pending_subjects if r[-1] is not None ] )
+				self._db.executemany(
+					"INSERT OR REPLACE INTO content VALUES (?,?,?,?,?)",
+					[ (path,size,mtime_ns,partial,digest)
+						for partial,paths in self._pending_content.items()
+						for path,(size,mtime_ns,digest) in paths.items() ] )
+				self._db.executemany(
+					"INSERT OR REPLACE INTO shared VALUES (?,?,?,?,?)",
+					[ (digest,)+k+( json.dumps( d, sort_keys=True, separators=(',',':') ), )
+						for digest,results in self._pending_shared.items()
+						for k,d in results.items() ] )
+		self._pending = {}
+		self._pending_subjects = []
+		self._pending_content = {}
+		self._pending_shared = {}
+
+	def close( self ):
+		self.flush()
+		self._db.close()
+
+# Unit test
+if __name__=="__main__":
+	import sys
+	# Dump the (current) results for the named subjects.
+	store = Store( sys.argv[1] )
+	for name in sys.argv[2:]:
+		print( name, json.dumps( store.get( name, os.stat( name ) ), sort_keys=True, indent=4 ) )
+	store.close()
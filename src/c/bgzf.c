@@ -0,0 +1,808 @@
+
+/**
+  * Parallel decompression of BGZF (blocked gzip) files.
+  *
+  * BGZF is a series of gzip members of at most 64KiB (compressed and
+  * uncompressed) each of which records its own compressed size in a "BC"
+  * extra subfield. Block boundaries are therefore known without inflating
+  * anything, so blocks can be inflated independently and concurrently.
+  *
+  * The calling thread reads raw blocks into a ring of slots (the bounded
+  * read-ahead window); a pool of worker threads inflates them in order of
+  * arrival; the calling thread consumes the inflated slots strictly in
+  * order through an ordinary FILE*.
+  *
+  * Ordinary multi-member gzip records no member sizes, so its members
+  * cannot be found without inflating; such files remain with the
+  * sequential decoder in fopenx.c. So, too, does the remainder of a BGZF
+  * file from the first thing in it that is not a whole, sound BGZF block
+  * (another gzip member, padding, a truncated or corrupt block): content
+  * and errors are those of the sequential decoder, whatever the number of
+  * threads.
+  */
+
+#define _GNU_SOURCE // ...for fopencookie and _SC_NPROCESSORS_ONLN.
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdbool.h>
+#include <string.h>
+#include <errno.h>
+#include <unistd.h>
+#include <pthread.h>
+#include <sys/types.h>
+
+#include <zlib.h>
+
+#include "bgzf.h"
+#include "fopenx.h"
+
+/**
+  * Both the compressed and uncompressed size of a BGZF block are bounded
+  * by this.
+  */
+#define BGZF_MAX_BLOCK (64*1024)
+
+/**
+  * Length of the fixed part of a gzip header, and of the gzip trailer.
+  */
+#define GZ_HEADER_SIZE  (12)
+#define GZ_TRAILER_SIZE (8)
+
+/**
+  * Read-ahead is bounded to this many blocks per worker.
+  */
+#define SLOTS_PER_WORKER (4)
+
+#define MAX_DEFAULT_THREADS (8)
+
+enum BlockRead {
+	BLOCK_ERROR = -1,
+	BLOCK_EOF = 0,
+	BLOCK_WHOLE,
+	BLOCK_OTHER
+};
+
+enum SlotStatus {
+	SLOT_PENDING = 0,
+	SLOT_READY,
+	SLOT_FAILED
+};
+
+struct slot {
+	int status;
+	off_t offset; // ...of the block in fp.
+	size_t rawlen;
+	size_t outlen;
+	unsigned char raw[ BGZF_MAX_BLOCK ];
+	unsigned char out[ BGZF_MAX_BLOCK ];
+};
+
+struct bgzf {
+
+	FILE *fp;
+
+	pthread_mutex_t lock;
+	pthread_cond_t job_ready;
+	pthread_cond_t block_ready;
+
+	pthread_t *worker;
+	int workers;
+
+	struct slot *slot;
+	unsigned window;
+
+	/**
+	  * Sequence numbers of blocks. Slot i holds block i % window.
+	  * head      is the block being consumed;
+	  * next_job  is the next block a worker will inflate;
+	  * next_fill is the next block to be read from fp.
+	  * head <= next_job <= next_fill <= head + window always.
+	  */
+	unsigned long head;
+	unsigned long next_job;
+	unsigned long next_fill;
+
+	/**
+	  * Offset into the head slot's inflated content.
+	  */
+	size_t pos;
+
+	/**
+	  * Offset in fp of block next_fill.
+	  */
+	off_t offset;
+
+	/**
+	  * Set, with the offset at which to resume, when reading found
+	  * something other than a whole BGZF block.
+	  */
+	bool foreign;
+	off_t resume_at;
+
+	/**
+	  * The sequential decoder of fp from the first block that could not be
+	  * read or inflated as BGZF on. Once it exists, all further content is
+	  * its.
+	  */
+	FILE *tail;
+
+	bool input_eof;
+	bool quit;
+
+	/**
+	  * The offset of fp below which the page cache has been released.
+	  */
+	off_t dropped;
+
+	/**
+	  * errno of a failed read of fp, delivered after all preceding
+	  * content has been consumed.
+	  */
+	int error;
+};
+
+
+static unsigned _le16( const unsigned char *p ) {
+	return p[0] | (p[1] << 8);
+}
+
+static unsigned long _le32( const unsigned char *p ) {
+	return (unsigned long)p[0]
+		| ((unsigned long)p[1] << 8)
+		| ((unsigned long)p[2] << 16)
+		| ((unsigned long)p[3] << 24);
+}
+
+
+/**
+  * Returns the total size of the block whose header, of which len bytes are
+  * at h, is at h, or 0 if the header is not a BGZF one. Only subfields
+  * wholly within those len bytes are examined.
+  */
+static size_t _block_size( const unsigned char *h, size_t len ) {
+
+	const unsigned XLEN = _le16( h + 10 );
+	const unsigned char *x = h + GZ_HEADER_SIZE;
+	const size_t AVAIL = len - GZ_HEADER_SIZE;
+	unsigned i = 0;
+
+	// ID1, ID2, CM=deflate, FLG=FEXTRA only.
+	if( h[0] != 0x1F || h[1] != 0x8B || h[2] != 8 || h[3] != 4 )
+		return 0;
+
+	while( i + 4 <= XLEN && i + 4 <= AVAIL ) {
+		const unsigned SLEN = _le16( x + i + 2 );
+		if( x[i] == 'B' && x[i+1] == 'C' && SLEN == 2 && i + 6 <= XLEN && i + 6 <= AVAIL ) {
+			const size_t BSIZE = _le16( x + i + 4 ) + 1;
+			return BSIZE >= GZ_HEADER_SIZE + XLEN + GZ_TRAILER_SIZE
+				? BSIZE
+				: 0;
+		}
+		i += 4 + SLEN;
+	}
+	return 0;
+}
+
+
+bool bgzf_identify( FILE *fp ) {
+
+	unsigned char h[ GZ_HEADER_SIZE + 6 ];
+	size_t n;
+
+	const long POS
+		= ftell( fp );
+	if( POS < 0 )
+		return false;
+
+	fseek( fp, 0, SEEK_SET );
+	n = fread( h, sizeof(unsigned char), sizeof(h), fp );
+	if( fseek( fp, POS, SEEK_SET ) < 0 )
+		return false;
+
+	// The BC subfield must be the first (and is, in practice, the only)
+	// subfield for the short read above to see it.
+	return n == sizeof(h) && _block_size( h, n ) > 0;
+}
+
+
+/**
+  * Read the next block from fp into s->raw. Returns BLOCK_WHOLE on success,
+  * BLOCK_EOF at end of file, BLOCK_ERROR on a read error and BLOCK_OTHER,
+  * leaving fp positioned anywhere, if what's next is not a whole BGZF block.
+  */
+static int _read_block( FILE *fp, struct slot *s ) {
+
+	unsigned XLEN;
+	size_t n = fread( s->raw, sizeof(unsigned char), GZ_HEADER_SIZE, fp );
+
+	if( n == 0 && feof( fp ) )
+		return BLOCK_EOF;
+	if( n < GZ_HEADER_SIZE )
+		goto short_read;
+
+	// A gzip member's extra field may be too large for any BGZF block
+	// (and for s->raw).
+	XLEN = _le16( s->raw + 10 );
+	if( GZ_HEADER_SIZE + XLEN + GZ_TRAILER_SIZE > BGZF_MAX_BLOCK )
+		return BLOCK_OTHER;
+	if( fread( s->raw + GZ_HEADER_SIZE, sizeof(unsigned char), XLEN, fp ) < XLEN )
+		goto short_read;
+
+	s->rawlen = _block_size( s->raw, GZ_HEADER_SIZE + XLEN );
+	if( s->rawlen == 0 || s->rawlen > BGZF_MAX_BLOCK )
+		return BLOCK_OTHER; // ...not, or no longer, BGZF.
+
+	n = s->rawlen - GZ_HEADER_SIZE - XLEN;
+	if( fread( s->raw + GZ_HEADER_SIZE + XLEN, sizeof(unsigned char), n, fp ) < n )
+		goto short_read;
+
+	return BLOCK_WHOLE;
+
+short_read:
+	return ferror( fp ) ? BLOCK_ERROR : BLOCK_OTHER; // ...truncated
+}
+
+
+/**
+  * Inflate s->raw into s->out, verifying length and CRC.
+  */
+static bool _inflate_block( z_stream *z, struct slot *s ) {
+
+	const size_t DATA
+		= GZ_HEADER_SIZE + _le16( s->raw + 10 );
+	const unsigned char *trailer
+		= s->raw + s->rawlen - GZ_TRAILER_SIZE;
+	const unsigned long CRC   = _le32( trailer );
+	const unsigned long ISIZE = _le32( trailer + 4 );
+
+	if( ISIZE > BGZF_MAX_BLOCK || inflateReset( z ) != Z_OK )
+		return false;
+
+	z->next_in   = s->raw + DATA;
+	z->avail_in  = s->rawlen - DATA - GZ_TRAILER_SIZE;
+	z->next_out  = s->out;
+	z->avail_out = BGZF_MAX_BLOCK;
+
+	if( inflate( z, Z_FINISH ) != Z_STREAM_END )
+		return false;
+
+	s->outlen = BGZF_MAX_BLOCK - z->avail_out;
+	return s->outlen == ISIZE
+		&& crc32( crc32( 0L, Z_NULL, 0 ), s->out, s->outlen ) == CRC;
+}
+
+
+static void *_worker( void *arg ) {
+
+	struct bgzf *b = (struct bgzf *)arg;
+	z_stream z;
+	bool usable;
+
+	memset( &z, 0, sizeof(z) );
+	usable = inflateInit2( &z, -15 /* raw deflate */ ) == Z_OK;
+
+	pthread_mutex_lock( &b->lock );
+	while( true ) {
+		struct slot *s;
+		bool ok;
+		while( ! b->quit && b->next_job == b->next_fill )
+			pthread_cond_wait( &b->job_ready, &b->lock );
+		if( b->quit )
+			break;
+		s = b->slot + ( b->next_job++ % b->window );
+		pthread_mutex_unlock( &b->lock );
+
+		ok = usable && _inflate_block( &z, s );
+
+		pthread_mutex_lock( &b->lock );
+		s->status = ok ? SLOT_READY : SLOT_FAILED;
+		pthread_cond_broadcast( &b->block_ready );
+	}
+	pthread_mutex_unlock( &b->lock );
+
+	if( usable )
+		inflateEnd( &z );
+	return NULL;
+}
+
+
+/**
+  * Top up the read-ahead window. Only the consuming thread calls this, and
+  * the slots it fills are not visible to workers until next_fill advances.
+  */
+static void _fill( struct bgzf *b ) {
+
+	while( ! b->input_eof && b->next_fill - b->head < b->window ) {
+
+		struct slot *s
+			= b->slot + ( b->next_fill % b->window );
+		int rc;
+
+		s->offset = b->offset;
+		rc = _read_block( b->fp, s );
+
+		if( rc != BLOCK_WHOLE ) {
+			b->input_eof = true;
+			if( rc == BLOCK_ERROR )
+				b->error = errno;
+			if( rc == BLOCK_OTHER ) {
+				b->foreign = true;
+				b->resume_at = s->offset;
+			}
+			break;
+		}
+
+		b->offset += s->rawlen;
+		fopenx_consumed( b->fp, & b->dropped );
+
+		pthread_mutex_lock( &b->lock );
+		s->status = SLOT_PENDING;
+		b->next_fill += 1;
+		pthread_cond_signal( &b->job_ready );
+		pthread_mutex_unlock( &b->lock );
+	}
+}
+
+
+/**
+  * Hand fp, from the block at offset on, to the sequential decoder. All
+  * the blocks preceding it (b->head of them) have been consumed; any read
+  * ahead of it are abandoned.
+  */
+static bool _resume( struct bgzf *b, off_t offset ) {
+	b->input_eof = true;
+	if( fseeko( b->fp, offset, SEEK_SET ) == 0 )
+		b->tail = codec_resume( b->fp, CODEC_GZIP, b->head );
+	return b->tail != NULL;
+}
+
+
+static ssize_t _bgzf_read( void *cookie, char *buf, size_t size ) {
+
+	struct bgzf *b = (struct bgzf *)cookie;
+	size_t n = 0;
+
+	while( n < size ) {
+
+		struct slot *s;
+		int status;
+		size_t len;
+
+		if( b->tail ) {
+			n += fread( buf + n, sizeof(char), size - n, b->tail );
+			if( n == 0 && ferror( b->tail ) )
+				return -1; // ...with the decoder's errno.
+			break;
+		}
+
+		if( b->head == b->next_fill ) {
+			_fill( b );
+			if( b->head == b->next_fill ) {
+				if( b->foreign ) {
+					if( _resume( b, b->resume_at ) )
+						continue;
+					if( n == 0 )
+						return -1;
+					break;
+				}
+				if( b->error && n == 0 ) {
+					errno = b->error;
+					return -1;
+				}
+				break; // EOF (or error deferred to the next call).
+			}
+		}
+
+		s = b->slot + ( b->head % b->window );
+
+		pthread_mutex_lock( &b->lock );
+		while( s->status == SLOT_PENDING )
+			pthread_cond_wait( &b->block_ready, &b->lock );
+		status = s->status;
+		pthread_mutex_unlock( &b->lock );
+
+		if( status == SLOT_FAILED ) {
+			// The sequential decoder determines what, if anything, is
+			// wrong with the block (and everything following it).
+			if( _resume( b, s->offset ) )
+				continue;
+			if( n == 0 )
+				return -1;
+			break; // ...and the next call tries again.
+		}
+
+		len = s->outlen - b->pos;
+		if( len > size - n )
+			len = size - n;
+		memcpy( buf + n, s->out + b->pos, len );
+		b->pos += len;
+		n += len;
+
+		if( b->pos == s->outlen ) {
+			b->head += 1;
+			b->pos = 0;
+			_fill( b );
+		}
+	}
+	return n;
+}
+
+
+static void _bgzf_free( struct bgzf *b ) {
+
+	pthread_mutex_lock( &b->lock );
+	b->quit = true;
+	pthread_cond_broadcast( &b->job_ready );
+	pthread_mutex_unlock( &b->lock );
+
+	for(int i = 0; i < b->workers; i++ )
+		pthread_join( b->worker[i], NULL );
+
+	pthread_cond_destroy( &b->block_ready );
+	pthread_cond_destroy( &b->job_ready );
+	pthread_mutex_destroy( &b->lock );
+
+	free( b->worker );
+	free( b->slot );
+	free( b );
+}
+
+
+static int _bgzf_close( void *cookie ) {
+	struct bgzf *b = (struct bgzf *)cookie;
+	int status;
+	if( b->tail ) {
+		status = fclose( b->tail ); // ...which closes (and releases) fp.
+	} else {
+		fopenx_release( b->fp );
+		status = fclose( b->fp );
+	}
+	_bgzf_free( b );
+	return status;
+}
+
+
+#ifdef __GLIBC__
+
+static FILE *_bgzf_stream( struct bgzf *b ) {
+	static const cookie_io_functions_t FXNS = {
+		.read  = _bgzf_read,
+		.write = NULL,
+		.seek  = NULL,
+		.close = _bgzf_close
+	};
+	return fopencookie( b, "r", FXNS );
+}
+
+#else // BSD and MacOS
+
+static int _funopen_read( void *cookie, char *buf, int size ) {
+	return _bgzf_read( cookie, buf, size );
+}
+
+static FILE *_bgzf_stream( struct bgzf *b ) {
+	return funopen( b, _funopen_read, NULL, NULL, _bgzf_close );
+}
+
+#endif
+
+
+int bgzf_default_threads( void ) {
+
+	const char *env
+		= getenv("DECOMPRESSION_THREADS");
+	long n;
+
+	if( env )
+		return atoi( env );
+
+	n = sysconf( _SC_NPROCESSORS_ONLN );
+	if( n < 1 )
+		return 1;
+	return n < MAX_DEFAULT_THREADS ? n : MAX_DEFAULT_THREADS;
+}
+
+
+FILE *bgzf_open( FILE *fp, int threads ) {
+
+	struct bgzf *b;
+	FILE *stream = NULL;
+
+	if( threads < 1 ) {
+		errno = EINVAL;
+		return NULL;
+	}
+
+	b = calloc( 1, sizeof(struct bgzf) );
+	if( b == NULL )
+		return NULL;
+
+	b->fp     = fp;
+	b->window = SLOTS_PER_WORKER * threads;
+	b->slot   = calloc( b->window, sizeof(struct slot) );
+	b->worker = calloc( threads, sizeof(pthread_t) );
+	if( b->slot == NULL || b->worker == NULL ) {
+		free( b->worker );
+		free( b->slot );
+		free( b );
+		errno = ENOMEM;
+		return NULL;
+	}
+
+	pthread_mutex_init( &b->lock, NULL );
+	pthread_cond_init( &b->job_ready, NULL );
+	pthread_cond_init( &b->block_ready, NULL );
+
+	rewind( fp );
+
+	while( b->workers < threads ) {
+		if( pthread_create( b->worker + b->workers, NULL, _worker, b ) )
+			break;
+		b->workers += 1;
+	}
+
+	if( b->workers > 0 )
+		stream = _bgzf_stream( b );
+
+	if( stream == NULL ) {
+		const int e = errno;
+		_bgzf_free( b );
+		errno = e ? e : EAGAIN;
+	}
+	return stream;
+}
+
+
+#ifdef _UNIT_TEST_BGZF_
+
+/**
+  * Regression cases: synthetic BGZF files, some with something other than
+  * BGZF blocks in them, on each of which the parallel reader must yield
+  * what the sequential decoder does, content and error alike.
+  */
+
+#define TEST_BLOCK  (60000)
+#define TEST_BLOCKS (40) // ...more than the window of 4 threads.
+#define TEST_THREADS (4)
+
+enum TestCase {
+	CASE_BGZF = 0,
+	CASE_GZIP_TAIL,
+	CASE_ZERO_TAIL,
+	CASE_LARGE_XLEN,
+	CASE_TRUNCATED,
+	CASE_CORRUPT,
+	CASE_COUNT
+};
+
+static const char *_case_name[] = {
+	"bgzf",
+	"gzip member after EOF block",
+	"zeros after EOF block",
+	"member with 65535-byte extra field",
+	"truncated",
+	"bad CRC"
+};
+
+
+/**
+  * Write a gzip member containing data to fp: a BGZF block if xlen is 6,
+  * a member with no extra field if xlen is 0, and otherwise one with an
+  * xlen-byte extra field that is not BGZF's.
+  */
+static void _member( FILE *fp, const unsigned char *data, size_t len, unsigned xlen ) {
+
+	static unsigned char raw[ 2*BGZF_MAX_BLOCK ];
+	const unsigned char H[ GZ_HEADER_SIZE ] = {
+		0x1F, 0x8B, 8, xlen ? 4 : 0, 0, 0, 0, 0, 0, 0xFF, xlen & 0xFF, xlen >> 8 };
+	const unsigned long CRC
+		= crc32( crc32( 0L, Z_NULL, 0 ), data, len );
+	z_stream z;
+	size_t n;
+
+	memset( &z, 0, sizeof(z) );
+	deflateInit2( &z, 6, Z_DEFLATED, -15 /* raw deflate */, 8, Z_DEFAULT_STRATEGY );
+	z.next_in   = (unsigned char *)data;
+	z.avail_in  = len;
+	z.next_out  = raw;
+	z.avail_out = sizeof(raw);
+	deflate( &z, Z_FINISH );
+	n = sizeof(raw) - z.avail_out;
+	deflateEnd( &z );
+
+	// Only with FEXTRA does the header include XLEN.
+	fwrite( H, sizeof(unsigned char), xlen ? sizeof(H) : sizeof(H) - 2, fp );
+	if( xlen == 6 ) {
+		const size_t BSIZE = GZ_HEADER_SIZE + 6 + n + GZ_TRAILER_SIZE - 1;
+		fputc( 'B', fp ); fputc( 'C', fp ); fputc( 2, fp ); fputc( 0, fp );
+		fputc( BSIZE & 0xFF, fp ); fputc( BSIZE >> 8, fp );
+	} else
+	if( xlen > 0 ) {
+		fputc( 'X', fp ); fputc( 'Y', fp );
+		fputc( (xlen-4) & 0xFF, fp ); fputc( (xlen-4) >> 8, fp );
+		for(unsigned i = 4; i < xlen; i++ )
+			fputc( 0, fp );
+	}
+	fwrite( raw, sizeof(unsigned char), n, fp );
+	for(int i = 0; i < 4; i++ )
+		fputc( ( CRC >> (8*i) ) & 0xFF, fp );
+	for(int i = 0; i < 4; i++ )
+		fputc( ( len >> (8*i) ) & 0xFF, fp );
+}
+
+
+/**
+  * Write BGZF blocks of text to fp and the text to expect.
+  */
+static void _blocks( FILE *fp, FILE *expect, int count ) {
+	static unsigned char text[ TEST_BLOCK ];
+	while( count-- > 0 ) {
+		for(size_t i = 0; i < sizeof(text); i++ )
+			text[i] = i % 61 == 60 ? '\n' : "ACGT\t0123456789"[ rand() % 15 ];
+		_member( fp, text, sizeof(text), 6 );
+		fwrite( text, sizeof(unsigned char), sizeof(text), expect );
+	}
+}
+
+
+/**
+  * Write the named case to fp and its content to expect.
+  */
+static void _build( int which, FILE *fp, FILE *expect ) {
+
+	static const unsigned char TAIL[] = "x\ty\n";
+	long offset;
+
+	srand( 17 );
+	switch( which ) {
+	case CASE_BGZF:
+	case CASE_GZIP_TAIL:
+	case CASE_ZERO_TAIL:
+		_blocks( fp, expect, TEST_BLOCKS );
+		_member( fp, NULL, 0, 6 ); // EOF block
+		if( which == CASE_GZIP_TAIL ) {
+			_member( fp, TAIL, sizeof(TAIL)-1, 0 );
+			fwrite( TAIL, sizeof(unsigned char), sizeof(TAIL)-1, expect );
+		} else
+		if( which == CASE_ZERO_TAIL ) {
+			for(int i = 0; i < 100; i++ )
+				fputc( 0, fp );
+		}
+		break;
+	case CASE_LARGE_XLEN:
+		_blocks( fp, expect, TEST_BLOCKS/2 );
+		_member( fp, TAIL, sizeof(TAIL)-1, 0xFFFF );
+		fwrite( TAIL, sizeof(unsigned char), sizeof(TAIL)-1, expect );
+		_blocks( fp, expect, TEST_BLOCKS/2 );
+		_member( fp, NULL, 0, 6 );
+		break;
+	case CASE_TRUNCATED:
+		_blocks( fp, expect, TEST_BLOCKS );
+		fflush( fp );
+		if( ftruncate( fileno( fp ), ftell( fp ) - 1000 ) )
+			perror( "ftruncate" );
+		break;
+	case CASE_CORRUPT:
+		_blocks( fp, expect, TEST_BLOCKS/2 );
+		offset = ftell( fp );
+		_blocks( fp, expect, TEST_BLOCKS/2 );
+		// Invert the first byte of the CRC of the block before offset.
+		fseek( fp, offset - GZ_TRAILER_SIZE, SEEK_SET );
+		offset = fgetc( fp );
+		fseek( fp, -1, SEEK_CUR );
+		fputc( ~offset & 0xFF, fp );
+		break;
+	}
+	fflush( fp );
+}
+
+
+/**
+  * Inflate the named file with the parallel reader or, if threads is 1,
+  * the sequential decoder, into a new buffer at *out. Returns whether the
+  * stream reported an error.
+  */
+static bool _inflate_file( const char *name, int threads, char **out, size_t *len ) {
+
+	FILE *m = open_memstream( out, len );
+	FILE *fp = fopen( name, "r" );
+	FILE *dfp = threads > 1
+		? bgzf_open( fp, threads )
+		: codec_open( fp, CODEC_GZIP );
+	char buf[ 8192 ];
+	size_t n;
+	bool failed;
+
+	while( ( n = fread( buf, 1, sizeof(buf), dfp ) ) > 0 )
+		fwrite( buf, 1, n, m );
+	failed = ferror( dfp );
+	fclose( dfp );
+	fclose( m );
+	return failed;
+}
+
+
+static bool _prefix( const char *p, size_t plen, const char *s, size_t slen ) {
+	return plen <= slen && memcmp( p, s, plen ) == 0;
+}
+
+
+static int _regression( void ) {
+
+	int failures = 0;
+
+	for(int which = 0; which < CASE_COUNT; which++ ) {
+
+		char name[] = "/tmp/ut-bgzf-XXXXXX";
+		const int FD = mkstemp( name );
+		FILE *fp = fdopen( FD, "w+" );
+		char *expect, *seq, *par;
+		size_t elen, slen, plen;
+		FILE *m = open_memstream( &expect, &elen );
+		bool seq_failed, par_failed, ok;
+
+		_build( which, fp, m );
+		fclose( m );
+		fclose( fp );
+
+		seq_failed = _inflate_file( name, 1, &seq, &slen );
+		par_failed = _inflate_file( name, TEST_THREADS, &par, &plen );
+		unlink( name );
+
+		ok = seq_failed == par_failed;
+		switch( which ) {
+		case CASE_TRUNCATED:
+		case CASE_CORRUPT:
+			// How much of the bad block's content precedes the error
+			// depends on reads' sizes.
+			ok = ok && par_failed
+				&& _prefix( seq, slen, expect, elen )
+				&& _prefix( par, plen, expect, elen )
+				&& plen >= (TEST_BLOCKS/2 - 1)*TEST_BLOCK;
+			break;
+		default:
+			ok = ok && ! par_failed
+				&& slen == elen && memcmp( seq, expect, elen ) == 0
+				&& plen == elen && memcmp( par, expect, elen ) == 0;
+		}
+		printf( "%s: %s (sequential %zu bytes%s, parallel %zu bytes%s)\n",
+			ok ? "ok" : "FAILED", _case_name[ which ],
+			slen, seq_failed ? ", error" : "",
+			plen, par_failed ? ", error" : "" );
+		if( ! ok )
+			failures += 1;
+
+		free( expect );
+		free( seq );
+		free( par );
+	}
+	return failures ? EXIT_FAILURE : EXIT_SUCCESS;
+}
+
+
+/**
+  * ut-bgzf <file> [ <threads> ] inflates a BGZF file to stdout;
+  * ut-bgzf alone runs the regression cases.
+  */
+int main( int argc, char *argv[] ) {
+
+	if( argc < 2 )
+		return _regression();
+
+	FILE *fp = fopen( argv[1], "r" );
+	if( fp && bgzf_identify( fp ) ) {
+		FILE *dfp = bgzf_open( fp,
+			argc > 2 ? atoi( argv[2] ) : bgzf_default_threads() );
+		if( dfp ) {
+			char buf[ 8192 ];
+			size_t n;
+			while( ( n = fread( buf, 1, sizeof(buf), dfp ) ) > 0 )
+				fwrite( buf, 1, n, stdout );
+			n = ferror( dfp );
+			fclose( dfp );
+			return n ? EXIT_FAILURE : EXIT_SUCCESS;
+		}
+	}
+	return EXIT_FAILURE;
+}
+#endif
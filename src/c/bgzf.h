@@ -0,0 +1,9 @@
+#ifndef _bgzf_h_
+#define _bgzf_h_
+
+bool bgzf_identify( FILE * );
+int  bgzf_default_threads( void );
+FILE *bgzf_open( FILE *, int threads );
+
+#endif
+
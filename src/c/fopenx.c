@@ -1,37 +1,52 @@
 
+/**
+  * Transparent decompression of input files.
+  *
+  * Compressed files are decoded in-process by zlib, libbz2 or liblzma
+  * behind an ordinary FILE* (see fopencookie(3)/funopen(3)), so callers
+  * need not know or care whether a file was compressed. This avoids a
+  * fork+exec (and a shell) per file and any dependence on the presence of
+  * gunzip et al.
+  */
+
+#define _GNU_SOURCE // ...for fopencookie.
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdbool.h>
 #include <string.h>
 #include <errno.h>
 #include <assert.h>
+#include <fcntl.h>
+#include <sys/types.h>
+
+#include <zlib.h>
+#include <bzlib.h>
+#include <lzma.h>
+
 #include "fopenx.h"
+#include "bgzf.h"
 
-enum Codec {
-	CODEC_NONE = 0,
-	CODEC_GZIP,
-	CODEC_BZIP,
-	CODEC_XZ,
-	CODEC_COUNT,
-	CODEC_UNKNOWN = CODEC_COUNT
-};
+/**
+  * Size of the buffer of compressed input held by each decoder.
+  */
+#define CODEC_BUFFER_SIZE (128*1024)
 
 /**
-  * Following must correspond to CODEC_x constants.
+  * Following must correspond to CODEC_x constants. These are the more-or-
+  * less standard file extensions.
   */
-static const char *_decompress_cmd[] = {
-	"",
-	"gunzip --decompress --stdout",
-	"bunzip2 --decompress --stdout --keep",
-	"unxz  --decompress --stdout --keep"
+static const char *_codec_name[] = {
+	NULL,
+	"gz",
+	"bz2",
+	"xz"
 };
 
-/*
-static const char *codec_system_exe( int type ) {
-	return ( 0 < type && type < CODEC_COUNT )
-		? _decompress_cmd[ type ]
-		: "UNKNOWN";
+const char *codec_name( int codec ) {
+	return ( 0 < codec && codec < CODEC_COUNT )
+		? _codec_name[ codec ]
+		: NULL;
 }
-*/
 
 /**
   * GZIP: 1F 8B
@@ -45,7 +60,7 @@ const unsigned char SIG_XZ[]   = { 0xFD, 0x37, 0x7A, 0x58, 0x5A, 0x00 };
 /**
   * Return < 0 implies error in determining the signature.
   */
-static int codec_identify_by_sig( FILE *fp ) {
+int codec_identify_by_sig( FILE *fp ) {
 
 	char buf[6];
 	int n, type = -1;
@@ -116,58 +131,476 @@ static int codec_identify( const char *fname ) {
 }
 #endif
 
-#ifdef _DEBUG
-static int compressed = 0;
+/***************************************************************************
+  * Page cache advice
+  */
+
+static int _cache_policy = CACHE_KEEP;
+
+void fopenx_set_cache_policy( int policy ) {
+	if( 0 <= policy && policy < CACHE_POLICY_COUNT )
+		_cache_policy = policy;
+}
+
+
+int fopenx_cache_policy( void ) {
+	return _cache_policy;
+}
+
+
+/**
+  * posix_fadvise is only advice, so its absence (e.g. on MacOS) and its
+  * failures (e.g. on pipes) are both ignored.
+  */
+static void _advise( FILE *fp, off_t offset, off_t len, int advice ) {
+#ifdef POSIX_FADV_SEQUENTIAL
+	const int FD = fileno( fp );
+	if( FD >= 0 )
+		posix_fadvise( FD, offset, len, advice );
+#endif
+}
+
+
+void fopenx_consumed( FILE *fp, off_t *dropped ) {
+#ifdef POSIX_FADV_DONTNEED
+	if( _cache_policy == CACHE_DROP ) {
+		const off_t POS = ftello( fp );
+		if( POS - *dropped >= CACHE_DROP_INTERVAL ) {
+			_advise( fp, *dropped, POS - *dropped, POSIX_FADV_DONTNEED );
+			*dropped = POS;
+		}
+	}
+#endif
+}
+
+
+void fopenx_release( FILE *fp ) {
+#ifdef POSIX_FADV_DONTNEED
+	if( _cache_policy == CACHE_DROP )
+		_advise( fp, 0, 0, POSIX_FADV_DONTNEED );
 #endif
+}
+
+
+/***************************************************************************
+  * Decoders
+  */
+
+struct decoder {
+
+	int codec;
+
+	/**
+	  * The compressed stream, owned by the decoder.
+	  */
+	FILE *fp;
+
+	/**
+	  * Count of complete compressed streams ("members" in gzip parlance)
+	  * decoded so far. All three formats allow concatenation.
+	  */
+	int members;
+
+	/**
+	  * Set when no more decompressed content will be produced.
+	  */
+	bool eof;
+
+	/**
+	  * Set when the compressed stream ended within a member, so that only
+	  * what the decompressor holds remains to be produced; the stream is
+	  * truncated unless that completes the member.
+	  */
+	bool drained;
+
+	/**
+	  * The offset of fp below which the page cache has been released.
+	  */
+	off_t dropped;
+
+	union {
+		z_stream    gz;
+		bz_stream   bz;
+		lzma_stream xz;
+	} u;
+
+	unsigned char in[ CODEC_BUFFER_SIZE ];
+};
+
+
+/**
+  * Returns the count of bytes now available in d->in, 0 at end of file
+  * and -1 on read error.
+  */
+static ssize_t _fill( struct decoder *d ) {
+	const size_t n
+		= fread( d->in, sizeof(unsigned char), CODEC_BUFFER_SIZE, d->fp );
+	if( n == 0 && ferror( d->fp ) )
+		return -1;
+	fopenx_consumed( d->fp, & d->dropped );
+	return n;
+}
+
+
+static ssize_t _gz_read( struct decoder *d, char *buf, size_t size ) {
+
+	z_stream *z = & d->u.gz;
+
+	z->next_out  = (Bytef*)buf;
+	z->avail_out = size;
+
+	while( z->avail_out > 0 && ! d->eof ) {
+
+		int rc;
+
+		if( z->avail_in == 0 && ! d->drained ) {
+			const ssize_t N = _fill( d );
+			if( N < 0 )
+				return -1;
+			if( N == 0 ) {
+				if( z->total_in == 0 ) {
+					d->eof = true; // ...between members.
+					break;
+				}
+				d->drained = true;
+			}
+			z->next_in  = d->in;
+			z->avail_in = N;
+		}
+
+		rc = inflate( z, Z_NO_FLUSH );
+
+		if( rc == Z_STREAM_END ) {
+			// Another member may follow.
+			d->members += 1;
+			inflateReset( z );
+			d->eof = d->drained;
+		} else
+		if( rc == Z_BUF_ERROR && d->drained ) {
+			// Truncated: deliver what precedes the truncation first.
+			if( z->avail_out < size )
+				break;
+			errno = EIO;
+			return -1;
+		} else
+		if( rc == Z_DATA_ERROR && d->members > 0 && z->total_out == 0 ) {
+			// Trailing garbage after the last member, which gunzip also
+			// ignores.
+			d->eof = true;
+		} else
+		if( rc != Z_OK && rc != Z_BUF_ERROR ) {
+			errno = EIO;
+			return -1;
+		}
+	}
+	return size - z->avail_out;
+}
+
+
+static ssize_t _bz_read( struct decoder *d, char *buf, size_t size ) {
+
+	bz_stream *bz = & d->u.bz;
+
+	bz->next_out  = buf;
+	bz->avail_out = size;
+
+	while( bz->avail_out > 0 && ! d->eof ) {
+
+		int rc;
+
+		unsigned avail_out;
+
+		if( bz->avail_in == 0 && ! d->drained ) {
+			const ssize_t N = _fill( d );
+			if( N < 0 )
+				return -1;
+			if( N == 0 ) {
+				if( bz->total_in_lo32 == 0 && bz->total_in_hi32 == 0 ) {
+					d->eof = true; // ...between streams.
+					break;
+				}
+				d->drained = true;
+			}
+			bz->next_in  = (char*)d->in;
+			bz->avail_in = N;
+		}
+
+		avail_out = bz->avail_out;
+		rc = BZ2_bzDecompress( bz );
+
+		if( rc == BZ_STREAM_END ) {
+			// Another stream may follow. Reinitialization must preserve
+			// the unconsumed input.
+			char *next_in = bz->next_in;
+			const unsigned avail_in = bz->avail_in;
+			d->members += 1;
+			BZ2_bzDecompressEnd( bz );
+			if( BZ2_bzDecompressInit( bz, 0, 0 ) != BZ_OK ) {
+				errno = ENOMEM;
+				return -1;
+			}
+			bz->next_in   = next_in;
+			bz->avail_in  = avail_in;
+			bz->next_out  = buf + (size - bz->avail_out);
+			d->eof = d->drained;
+		} else
+		if( rc == BZ_OK && d->drained && bz->avail_out == avail_out ) {
+			// Truncated: deliver what precedes the truncation first.
+			if( bz->avail_out < size )
+				break;
+			errno = EIO;
+			return -1;
+		} else
+		if( rc == BZ_DATA_ERROR_MAGIC && d->members > 0 ) {
+			d->eof = true; // trailing garbage
+		} else
+		if( rc != BZ_OK ) {
+			errno = EIO;
+			return -1;
+		}
+	}
+	return size - bz->avail_out;
+}
+
+
+static ssize_t _xz_read( struct decoder *d, char *buf, size_t size ) {
+
+	lzma_stream *xz = & d->u.xz;
+	lzma_action action = LZMA_RUN;
+
+	xz->next_out  = (uint8_t*)buf;
+	xz->avail_out = size;
+
+	while( xz->avail_out > 0 && ! d->eof ) {
+
+		lzma_ret rc;
+
+		if( xz->avail_in == 0 && action == LZMA_RUN ) {
+			const ssize_t N = _fill( d );
+			if( N < 0 )
+				return -1;
+			if( N == 0 )
+				action = LZMA_FINISH;
+			xz->next_in  = d->in;
+			xz->avail_in = N;
+		}
+
+		// LZMA_CONCATENATED (see _open_decoder) handles multiple streams.
+		rc = lzma_code( xz, action );
+
+		if( rc == LZMA_STREAM_END ) {
+			d->eof = true;
+		} else
+		if( rc == LZMA_BUF_ERROR && action == LZMA_FINISH ) {
+			// Truncated: deliver what precedes the truncation first.
+			if( xz->avail_out < size )
+				break;
+			errno = EIO;
+			return -1;
+		} else
+		if( rc != LZMA_OK ) {
+			errno = EIO;
+			return -1;
+		}
+	}
+	return size - xz->avail_out;
+}
+
+
+static ssize_t _decoder_read( void *cookie, char *buf, size_t size ) {
+
+	struct decoder *d = (struct decoder *)cookie;
+
+	switch( d->codec ) {
+	case CODEC_GZIP:
+		return _gz_read( d, buf, size );
+	case CODEC_BZIP:
+		return _bz_read( d, buf, size );
+	case CODEC_XZ:
+		return _xz_read( d, buf, size );
+	default:
+		errno = EINVAL;
+		return -1;
+	}
+}
+
+
+static void _decoder_free( struct decoder *d ) {
+
+	switch( d->codec ) {
+	case CODEC_GZIP:
+		inflateEnd( & d->u.gz );
+		break;
+	case CODEC_BZIP:
+		BZ2_bzDecompressEnd( & d->u.bz );
+		break;
+	case CODEC_XZ:
+		lzma_end( & d->u.xz );
+		break;
+	}
+	free( d );
+}
+
+
+static int _decoder_close( void *cookie ) {
+	struct decoder *d = (struct decoder *)cookie;
+	int status;
+	fopenx_release( d->fp );
+	status = fclose( d->fp );
+	_decoder_free( d );
+	return status;
+}
+
+
+/**
+  * Allocate and initialize a decoder of the given type for fp.
+  */
+static struct decoder *_open_decoder( FILE *fp, int codec ) {
+
+	struct decoder *d
+		= calloc( 1, sizeof(struct decoder) );
+	int failed = 1;
+
+	if( d == NULL )
+		return NULL;
+
+	d->codec = codec;
+	d->fp    = fp;
+
+	switch( codec ) {
+	case CODEC_GZIP:
+		// 15 (max window) + 16 accepts only the gzip wrapper.
+		failed = inflateInit2( & d->u.gz, 15 + 16 ) != Z_OK;
+		break;
+	case CODEC_BZIP:
+		failed = BZ2_bzDecompressInit( & d->u.bz, 0, 0 ) != BZ_OK;
+		break;
+	case CODEC_XZ:
+		d->u.xz = (lzma_stream)LZMA_STREAM_INIT;
+		failed = lzma_stream_decoder( & d->u.xz, UINT64_MAX, LZMA_CONCATENATED ) != LZMA_OK;
+		break;
+	}
+
+	if( failed ) {
+		free( d );
+		errno = codec < CODEC_COUNT ? ENOMEM : EINVAL;
+		return NULL;
+	}
+	return d;
+}
+
+
+#ifdef __GLIBC__
+
+static FILE *_decoder_stream( struct decoder *d ) {
+	static const cookie_io_functions_t FXNS = {
+		.read  = _decoder_read,
+		.write = NULL,
+		.seek  = NULL,
+		.close = _decoder_close
+	};
+	return fopencookie( d, "r", FXNS );
+}
+
+#else // BSD and MacOS
+
+static int _funopen_read( void *cookie, char *buf, int size ) {
+	return _decoder_read( cookie, buf, size );
+}
+
+static FILE *_decoder_stream( struct decoder *d ) {
+	return funopen( d, _funopen_read, NULL, NULL, _decoder_close );
+}
+
+#endif
+
+
+/**
+  * Wrap an open compressed stream in a stream that yields its decompressed
+  * content. Ownership of fp passes to the returned stream; it is closed
+  * when the returned stream is closed. On failure NULL is returned and fp
+  * is left open.
+  */
+FILE *codec_open( FILE *fp, int codec ) {
+	// The signature check above may have moved the stream.
+	rewind( fp );
+	return codec_resume( fp, codec, 0 );
+}
+
+
+/**
+  * As codec_open, but decoding from fp's current position as the
+  * continuation of a stream of which <members> members have already been
+  * decoded (so, e.g., garbage following is ignored as it would have been).
+  */
+FILE *codec_resume( FILE *fp, int codec, int members ) {
+
+	struct decoder *d
+		= _open_decoder( fp, codec );
+	FILE *stream = NULL;
+
+	if( d ) {
+		d->members = members;
+		stream = _decoder_stream( d );
+		if( stream == NULL ) {
+			const int e = errno;
+			_decoder_free( d );
+			errno = e;
+		}
+	}
+	return stream;
+}
+
 
 /**
   * Open a file, implicitly decompressing it if it's on of the three
-  * recognized types of compression.
+  * recognized types of compression. BGZF files are inflated on a pool of
+  * DECOMPRESSION_THREADS (default: the number of online processors, at
+  * most 8) threads; setting it to 1 selects the sequential decoder.
   */
 FILE *fopenx( const char *fname, const char *mode ) {
 
 	FILE *fp = fopen( fname, mode );
 	if( fp ) {
-		char *cmd = NULL;
+		FILE *dfp = NULL;
+#ifdef POSIX_FADV_SEQUENTIAL
+		_advise( fp, 0, 0, POSIX_FADV_SEQUENTIAL );
+#endif
 		const int CODEC
 		   = codec_identify_by_sig( fp );
-		if( CODEC < 0 ) {
-			int e = errno; // preserve current errno across fclose.
-			fclose( fp );
-			errno = e;
-			return NULL;
-		} else
 		if( CODEC == CODEC_UNKNOWN ) {
 			return fp; // ASSUMING it's plaintext
 		}
-		fclose( fp );
-		fp = NULL;
-		assert( CODEC < CODEC_COUNT );
-		cmd = malloc( FILENAME_MAX+32 );
-		if( cmd ) {
-			sprintf( cmd, "%s \"%s\"", _decompress_cmd[CODEC], fname );
-			fp = popen( cmd, "r" );
-			if( NULL == fp ) {
-				fprintf( stderr, "popen( \"%s\", \"r\" ): %s", cmd, strerror(errno) );
+		if( CODEC > 0 ) {
+			assert( CODEC < CODEC_COUNT );
+			// BGZF is gzip, but its blocks can be inflated in parallel.
+			if( CODEC == CODEC_GZIP && bgzf_identify( fp ) ) {
+				const int THREADS = bgzf_default_threads();
+				if( THREADS > 1 )
+					dfp = bgzf_open( fp, THREADS );
 			}
-#ifdef _DEBUG
-			compressed = 1;
-#endif
-			free( cmd );
+			if( dfp == NULL )
+				dfp = codec_open( fp, CODEC );
+		}
+		if( dfp == NULL ) {
+			int e = errno; // preserve current errno across fclose.
+			fclose( fp );
+			errno = e;
 		}
-		return fp;
+		return dfp;
 	}
 	return NULL; // ...and leave errno alone.
 }
 
 
+/**
+  * Closing a decoding stream also closes (and, under CACHE_DROP, releases)
+  * the underlying file. A plain file is released here since, if it was
+  * mapped, its pages could not have been released while it was.
+  */
 int fclosex( FILE *fp ) {
-	// This is a possibly dangerous way to detect whether or not we need
-	// to use pclose or fclose.
-	const int ISPIPE
-	   = ( ftell(fp) < 0 ) && ( errno == ESPIPE );
-	assert( compressed == ISPIPE );
-	return ISPIPE ? pclose( fp ) : fclose( fp );
+	fopenx_release( fp );
+	return fclose( fp );
 }
 
 #ifdef _UNIT_TEST_FOPENX_
@@ -178,15 +611,18 @@ int main( int argc, char *argv[] ) {
 		if( fp ) {
 			char *line = NULL;
 			size_t n = 0;
+			int failed;
 			while( getline( &line, &n, fp ) > 0 )
 				fputs( line, stdout );
 			if( line )
 				free( line );
+			failed = ferror( fp );
+			if( failed )
+				perror( argv[1] );
 			fclosex( fp );
-			return EXIT_SUCCESS;
+			return failed ? EXIT_FAILURE : EXIT_SUCCESS;
 		}
 	}
 	return EXIT_FAILURE;
 }
 #endif
-
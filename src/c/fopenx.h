@@ -1,8 +1,51 @@
 #ifndef _fopenx_h_
 #define _fopenx_h_
 
+enum Codec {
+	CODEC_NONE = 0,
+	CODEC_GZIP,
+	CODEC_BZIP,
+	CODEC_XZ,
+	CODEC_COUNT,
+	CODEC_UNKNOWN = CODEC_COUNT
+};
+
+int codec_identify_by_sig( FILE * );
+const char *codec_name( int codec );
+FILE *codec_open( FILE *, int codec );
+FILE *codec_resume( FILE *, int codec, int members );
+
 FILE *fopenx( const char *, const char * );
 int fclosex( FILE * );
 
+/**
+  * Whether pages of files read through fopenx are left in the page cache
+  * (the default) or released as they are consumed. Every file is opened
+  * with POSIX_FADV_SEQUENTIAL (where available) whatever the policy.
+  */
+enum CachePolicy {
+	CACHE_KEEP = 0,
+	CACHE_DROP,
+	CACHE_POLICY_COUNT
+};
+
+void fopenx_set_cache_policy( int policy );
+int  fopenx_cache_policy( void );
+
+/**
+  * Under CACHE_DROP, release the pages of the file underlying <fp> that
+  * precede its current position, though only once at least
+  * CACHE_DROP_INTERVAL bytes have accumulated since *<dropped>, which is
+  * updated. Decoders call this as they read compressed input.
+  */
+#define CACHE_DROP_INTERVAL (8*1024*1024)
+void fopenx_consumed( FILE *fp, off_t *dropped );
+
+/**
+  * Under CACHE_DROP, release all the pages of the file underlying <fp>.
+  * This is called as the file is closed.
+  */
+void fopenx_release( FILE *fp );
+
 #endif
 
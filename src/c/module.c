@@ -1,8 +1,15 @@
+#define PY_SSIZE_T_CLEAN
 
 #include <Python.h>
 #include <stdbool.h>
 
 #include "tabular/tabular.h"
+#include "tabular/strset.h"
+#include "tabular/column.h"
+#include "tabular/tdigest.h"
+#include "tabular/environ.h"
+#include "tabular/jsonl.h"
+#include "sequence/sequence.h"
 #include "stats/quantile.h"
 #include "stats/density.h"
 
@@ -34,21 +41,24 @@ static void dump_buffer( const Py_buffer *v, FILE *fp ) {
 	v->internal );
 }
 
+#include "fopenx.h"
+
 // TODO: Revisit following extern decls; here only so I don't have to
 // figure out how to get distutils to handle private headers.
-extern FILE *fopenx( const char *, const char * );
-extern int fclosex( FILE * );
-
 extern double medcouple_naive( double *values, int n );
 
 // forward decl
-static PyObject * _tabular_scan( PyObject *self, PyObject *args);
+static PyObject * _tabular_scan( PyObject *self, PyObject *args, PyObject *kwds );
+static PyObject * _jsonl_scan( PyObject *self, PyObject *args);
+static PyObject * _sequence_scan( PyObject *self, PyObject *args);
+static PyObject * _file_signature( PyObject *self, PyObject *args);
+static PyObject * _set_cache_policy( PyObject *self, PyObject *args);
 static PyObject * _robust_bounds( PyObject *self, PyObject *args);
 static PyObject * _gaussian_kde( PyObject *self, PyObject *args);
 
 
 static PyMethodDef CharCompMethods[] = {
-	{"tabular_scan",  _tabular_scan, METH_VARARGS,
+	{"tabular_scan",  (PyCFunction)_tabular_scan, METH_VARARGS | METH_KEYWORDS,
 	"Analyzes a file that is a priori assumed:\n"
 	"1. to contain only UTF-8 text, and\n"
 	"2. to contain a data table or matrix.\n"
@@ -80,12 +90,105 @@ static PyMethodDef CharCompMethods[] = {
 	"TABLE/MATRIX ANALYSIS (TODO)\n"
 	"============================\n"
 	"\n"
+	"RESULTS\n"
+	"=======\n"
+	"Results are returned as a dict with keys:\n"
+	"offending_byte: 0, or the ordinal of the first byte that is not valid\n"
+	"  UTF-8, in which case both histograms are None.\n"
+	"character_histogram: counts of lf, cr, ascii, utf8-2, utf8-3 and\n"
+	"  utf8-4 characters.\n"
+	"transition_histogram: {lf,cr,oc} -> {lf,cr,oc} -> count.\n"
+	"sampled_fraction: the fraction of the file's bytes scanned (1.0\n"
+	"  unless sampled; see OPTIONS).\n"
+	"table: present only if the file was scanned as a table, a dict of\n"
+	"  metadata_prefix, column_separator, separator_is_regex,\n"
+	"  separator_is_quoted, line_terminator, column_count, the line counts\n"
+	"  empty_lines, meta_lines, data_lines and aberrant_lines, and columns,\n"
+	"  a list with for each column a dict of\n"
+	"  inferred_class, votes (counts of empty, integer, float and string\n"
+	"  fields), stats (mean, stddev), extrema (min, max), quantiles (keyed\n"
+	"  by probability), max_field_length, long_field_count,\n"
+	"  distinct_values, labels and max_labels_exceeded.\n"
+	"Each numeric column's quantiles (by default the 0.05, 0.25, 0.5, 0.75\n"
+	"and 0.95; a comma-separated list in the environment variable QUANTILES\n"
+	"overrides them) are estimated from a t-digest of fixed size.\n"
+	"Each column's distinct_values is exact while its labels are; otherwise\n"
+	"(e.g. if max_labels_exceeded) it is estimated by a HyperLogLog to\n"
+	"within about 2%.\n"
+	"\n"
 	"IMPLEMENTATION NOTES\n"
 	"====================\n"
 	"This function combines capabilities which arguably ought to be\n"
 	"factored between multiple functions. They are integrated for the\n"
 	"sake of performance--specifically, in order to infer as much as\n"
-	"possible about a file in *one pass*.\n",
+	"possible about a file in *one pass*.\n"
+	"The GIL is released while the file is read, so many files may be\n"
+	"scanned concurrently from a pool of threads.\n"
+	"Input that is not in a file (e.g. the members of an archive) can be\n"
+	"scanned with a TabularScanner instead.\n"
+	"\n"
+	"OPTIONS\n"
+	"=======\n"
+	"These apply only to large regular (uncompressed) files and only to the\n"
+	"part of the file following the lines from which the table format is\n"
+	"inferred.\n"
+	"threads (default 1): if greater than 1, that part is split at line\n"
+	"  boundaries and its parts scanned concurrently. Results are the same\n"
+	"  except that means and standard deviations may differ in their last\n"
+	"  digits, quantiles are (slightly different) estimates, label order may\n"
+	"  differ and, if max_labels_exceeded, so may which labels are retained.\n"
+	"sample_tolerance (default 0, meaning scan everything): if positive,\n"
+	"  that part is sampled in randomly-chosen, line-aligned blocks until\n"
+	"  no column's mean, variance or type vote proportions change by more\n"
+	"  than this (relative to its standard deviation, variance and 1) from\n"
+	"  one batch of blocks to the next. All results, including character\n"
+	"  counts, then describe only the sample; sampled_fraction in the\n"
+	"  result is the fraction of the file's bytes scanned.\n"
+	"seed (default 0): the same seed always selects the same sample.\n"
+	"format (default None): the \"table\" dict of an earlier result (or\n"
+	"  any dict with its column_separator, separator_is_regex,\n"
+	"  separator_is_quoted, column_count, metadata_prefix and\n"
+	"  line_terminator). Unlike the options above this applies to any file.\n"
+	"  If the file's first lines are consistent with it, header detection\n"
+	"  and format inference are skipped and it is used instead; otherwise\n"
+	"  the file is scanned as if it had not been given.\n"
+	},
+	{"jsonl_scan", _jsonl_scan, METH_VARARGS,
+	"jsonl_scan( filename ) -> dict\n"
+	"Analyzes a JSON Lines (NDJSON) file, each line of which should be a\n"
+	"JSON object. Each distinct key is treated as a table's column is, and\n"
+	"the result's \"columns\" have the same content as tabular_scan's with\n"
+	"the addition of the \"key\" and the count of records \"missing\" it.\n"
+	"Keys of nested objects are joined to their parents' by '.'; deeper\n"
+	"objects and arrays are treated as strings of their JSON text. Strings,\n"
+	"true and false are strings, numbers are integers or floats and null is\n"
+	"empty. Lines that are not JSON objects are counted as aberrant and\n"
+	"otherwise ignored, and at most MAX_RECORD_KEYS keys are analyzed.\n"
+	"Compressed files are read as tabular_scan reads them.\n"
+	},
+	{"sequence_scan", _sequence_scan, METH_VARARGS,
+	"sequence_scan( filename ) -> dict or None\n"
+	"Summarizes a FASTQ, FASTA or SAM file (identified by its first line)\n"
+	"in one streaming pass in bounded memory, returning None if the file is\n"
+	"none of these. The result includes the count of reads (SAM primary\n"
+	"alignments), their length distribution, the GC fraction and N rate of\n"
+	"all bases, the fraction of each base at each of the first positions of\n"
+	"reads and (FASTQ and SAM) the moments of Phred+33 quality scores.\n"
+	"Compressed files are read as tabular_scan reads them.\n"
+	},
+	{"file_signature", _file_signature, METH_VARARGS,
+	"file_signature( filename [, size=8 ] ) -> ( compression, bytes )\n"
+	"Identifies the compression (\"gz\", \"bz2\", \"xz\" or None) of a\n"
+	"file by its magic number and returns it with (at most) the first size\n"
+	"bytes of the file's *decompressed* content. Decompression uses the same\n"
+	"codecs as tabular_scan.\n",
+	},
+	{"set_cache_policy", _set_cache_policy, METH_VARARGS,
+	"set_cache_policy( policy )\n"
+	"Sets the page cache policy (\"keep\" or \"drop\") of all subsequent\n"
+	"scans in this process. Under \"drop\" each file's pages are released\n"
+	"from the page cache (by posix_fadvise) as they are consumed and when\n"
+	"the file is closed. Files are always read with sequential advice.\n",
 	},
 	{"robust_bounds", _robust_bounds, METH_VARARGS,
 	"This function identifies the bounds of non-outlier data using the\n"
@@ -112,78 +215,637 @@ static struct PyModuleDef _moduledef = {
 };
 
 
+/**
+  * The following build the Python representation of a table_description
+  * directly. It has exactly the structure of the (exhaustive) JSON emitted
+  * by tabular_as_json for the command line tool, but numbers are not
+  * rounded by formatting.
+  */
+
+static PyObject *_labels_as_list( const struct strset *set ) {
+
+	PyObject *labels
+		= PyList_New( 0 );
+	void *cookie;
+
+	if( labels && set_iter( set, &cookie ) ) {
+		const char *sz;
+		while( set_next( set, &cookie, &sz ) ) {
+			PyObject *label
+				= PyUnicode_DecodeUTF8( sz, strlen(sz), "replace" );
+			if( label == NULL || PyList_Append( labels, label ) ) {
+				Py_XDECREF( label );
+				Py_DECREF( labels );
+				return NULL;
+			}
+			Py_DECREF( label );
+		}
+	}
+	return labels;
+}
+
+
+/**
+  * Returns a dict mapping each configured quantile (formatted as in the
+  * JSON output) to its estimate from <sketch>, or None if there is no
+  * sketch (e.g. the column had no numeric fields) or no quantiles are
+  * configured.
+  */
+static PyObject *_quantiles_as_object( struct tdigest *sketch ) {
+
+	PyObject *quantiles;
+
+	if( sketch == NULL || QUANTILE_COUNT == 0 )
+		Py_RETURN_NONE;
+
+	quantiles = PyDict_New();
+	if( quantiles == NULL )
+		return NULL;
+
+	for(int i = 0; i < QUANTILE_COUNT; i++ ) {
+		char key[32];
+		PyObject *value
+			= PyFloat_FromDouble( tdigest_quantile( sketch, QUANTILES[i] ) );
+		snprintf( key, sizeof(key), "%g", QUANTILES[i] );
+		if( value == NULL || PyDict_SetItemString( quantiles, key, value ) ) {
+			Py_XDECREF( value );
+			Py_DECREF( quantiles );
+			return NULL;
+		}
+		Py_DECREF( value );
+	}
+	return quantiles;
+}
+
+
+static PyObject *_column_as_object( const struct column *c ) {
+
+	PyObject *quantiles;
+	PyObject *labels
+		= _labels_as_list( & c->value_set );
+
+	if( labels == NULL )
+		return NULL;
+
+	quantiles = _quantiles_as_object( c->sketch );
+	if( quantiles == NULL ) {
+		Py_DECREF( labels );
+		return NULL;
+	}
+
+	return Py_BuildValue(
+		"{s:s,s:{s:i,s:i,s:i,s:i},s:{s:d,s:d},s:{s:d,s:d},s:N,s:I,s:I,s:k,s:N,s:O}",
+		"inferred_class", STAT_CLASS_NAME[ c->stat_class ],
+		"votes",
+			"empty",   c->type_vote[FTY_EMPTY],
+			"integer", c->type_vote[FTY_INTEGER],
+			"float",   c->type_vote[FTY_FLOAT],
+			"string",  c->type_vote[FTY_STRING],
+		"stats",
+			"mean",    c->statistics[0],
+			"stddev",  c->statistics[1],
+		"extrema",
+			"min",     c->extrema[0],
+			"max",     c->extrema[1],
+		"quantiles", quantiles,
+		"max_field_length", c->max_field_len,
+		"long_field_count", c->long_field_count,
+		"distinct_values",  column_distinct_values( c ),
+		"labels", labels,
+		"max_labels_exceeded", c->excess_values ? Py_True : Py_False );
+}
+
+
+static PyObject *_table_as_object( const struct table_description *a ) {
+
+	const int NC
+		= a->table.column_count;
+	PyObject *columns
+		= PyList_New( NC );
+
+	if( columns == NULL )
+		return NULL;
+
+	for(int i = 0; i < NC; i++ ) {
+		PyObject *column
+			= _column_as_object( a->column + i );
+		if( column == NULL ) {
+			Py_DECREF( columns );
+			return NULL;
+		}
+		PyList_SET_ITEM( columns, i, column );
+	}
+
+	return Py_BuildValue( "{s:s,s:s,s:O,s:O,s:s,s:i,s:I,s:I,s:I,s:I,s:N}",
+		"metadata_prefix",    a->table.metadata_line_prefix,
+		"column_separator",   a->table.column_separator,
+		"separator_is_regex", a->table.column_separator_is_regex ? Py_True : Py_False,
+		"separator_is_quoted", a->table.quoted ? Py_True : Py_False,
+		"line_terminator",    a->table.line_terminator,
+		"column_count",       NC,
+		"empty_lines",        a->rows.empty,
+		"meta_lines",         a->rows.meta,
+		"data_lines",         a->rows.data,
+		"aberrant_lines",     a->rows.aberrant,
+		"columns",            columns );
+}
+
+
+static PyObject *_table_description_as_object( const struct table_description *a ) {
+
+	PyObject *result = NULL;
+
+	/**
+	  * Any error entirely precludes histograms.
+	  */
+
+	if( a->status == E_UTF8_PREFIX || a->status == E_UTF8_SUFFIX ) {
+
+		result = Py_BuildValue( "{s:l,s:O,s:O,s:d}",
+			"offending_byte",       a->ordinal,
+			"character_histogram",  Py_None,
+			"transition_histogram", Py_None,
+			"sampled_fraction",     a->sampled_fraction );
+
+	} else {
+
+		const unsigned long *C
+			= a->char_class_counts;
+		const unsigned long *T
+			= a->char_class_transition_matrix;
+
+		result = Py_BuildValue(
+			"{s:i,s:{s:k,s:k,s:k,s:k,s:k,s:k},s:{s:{s:k,s:k,s:k},s:{s:k,s:k,s:k},s:{s:k,s:k,s:k}},s:d}",
+			"offending_byte", 0,
+			"character_histogram",
+				"lf",     C[ CC_LF ],
+				"cr",     C[ CC_CR ],
+				"ascii",  C[ CC_ASCII ],
+				"utf8-2", C[ CC_UTF8_2 ],
+				"utf8-3", C[ CC_UTF8_3 ],
+				"utf8-4", C[ CC_UTF8_4 ],
+			"transition_histogram",
+				"lf", "lf", T[0], "cr", T[1], "oc", T[2],
+				"cr", "lf", T[3], "cr", T[4], "oc", T[5],
+				"oc", "lf", T[6], "cr", T[7], "oc", T[8],
+			"sampled_fraction", a->sampled_fraction );
+	}
+
+	if( result && a->column != NULL ) {
+		PyObject *table
+			= _table_as_object( a );
+		if( table == NULL || PyDict_SetItemString( result, "table", table ) ) {
+			Py_XDECREF( table );
+			Py_DECREF( result );
+			return NULL;
+		}
+		Py_DECREF( table );
+	}
+
+	return result;
+}
+
+
+static int _copy_str( char *dst, size_t size, PyObject *dict, const char *key ) {
+	PyObject *o
+		= PyDict_GetItemString( dict, key );
+	const char *s;
+	Py_ssize_t len;
+	if( o == NULL || ! PyUnicode_Check( o ) ) {
+		PyErr_Format( PyExc_TypeError, "format[\"%s\"] must be a str", key );
+		return -1;
+	}
+	if( (s = PyUnicode_AsUTF8AndSize( o, &len )) == NULL )
+		return -1;
+	if( (size_t)len >= size ) {
+		PyErr_Format( PyExc_ValueError, "format[\"%s\"] is too long", key );
+		return -1;
+	}
+	memcpy( dst, s, len+1 );
+	return 0;
+}
+
+/**
+  * Fill <f> from a dict with (at least) the format keys of a result's
+  * "table" dict. Returns 0 on success, or -1 with an exception set.
+  */
+static int _format_from_object( PyObject *dict, struct format *f ) {
+
+	PyObject *o;
+	long n;
+
+	if( ! PyDict_Check( dict ) ) {
+		PyErr_SetString( PyExc_TypeError, "format must be a dict or None" );
+		return -1;
+	}
+	memset( f, 0, sizeof(struct format) );
+
+	if( _copy_str( f->column_separator, sizeof(f->column_separator), dict, "column_separator" )
+	 || _copy_str( f->metadata_line_prefix, sizeof(f->metadata_line_prefix), dict, "metadata_prefix" )
+	 || _copy_str( f->line_terminator, sizeof(f->line_terminator), dict, "line_terminator" ) )
+		return -1;
+
+	o = PyDict_GetItemString( dict, "separator_is_regex" );
+	f->column_separator_is_regex = o && PyObject_IsTrue( o ) == 1;
+	o = PyDict_GetItemString( dict, "separator_is_quoted" );
+	f->quoted = o && PyObject_IsTrue( o ) == 1;
+
+	o = PyDict_GetItemString( dict, "column_count" );
+	if( o == NULL || ! PyLong_Check( o ) ) {
+		PyErr_SetString( PyExc_TypeError, "format[\"column_count\"] must be an int" );
+		return -1;
+	}
+	n = PyLong_AsLong( o );
+	if( n == -1 && PyErr_Occurred() )
+		return -1;
+	if( n < 1 || n > INT_MAX ) {
+		PyErr_SetString( PyExc_ValueError, "format[\"column_count\"] must be positive" );
+		return -1;
+	}
+	f->column_count = n;
+
+	if( tabular_resolve_format( f ) ) {
+		PyErr_SetString( PyExc_ValueError, "format is not one tabular_scan infers" );
+		return -1;
+	}
+	return 0;
+}
+
+
+/**
+  * We can produce results for any termination status except file I/O
+  * errors. <filename> may be NULL.
+  */
+static PyObject *_scan_result( const struct table_description *results, int failed, const char *filename ) {
+
+	if( ! failed )
+		return _table_description_as_object( results );
+
+	switch( results->status ) {
+
+	case E_UNINITIALIZED_OUTPUT:
+		PyErr_SetString( PyExc_RuntimeError,
+			"tabular_scan received uninitialized output struct" );
+		break;
+
+	case E_FILE_IO:
+		PyErr_SetFromErrnoWithFilename( PyExc_IOError, filename );
+		break;
+
+	default:
+		PyErr_SetString( PyExc_RuntimeError,
+			"unhandled error (unfinished code?) in " __FILE__ );
+	}
+	return NULL;
+}
+
+
 static PyObject *
-_tabular_scan(PyObject *self, PyObject *args) {
+_tabular_scan(PyObject *self, PyObject *args, PyObject *kwds ) {
 
+	static char *KEYWORDS[] = {
+		"filename", "threads", "sample_tolerance", "seed", "format", NULL };
 	FILE *fp = NULL;
 	const char *filename = NULL;
-	PyObject *json = NULL;
+	PyObject *format = Py_None;
+	PyObject *result = NULL;
+	struct format hint;
+	struct scan_options options;
+	struct table_description results;
+	int failed = 0;
 
-	if( ! PyArg_ParseTuple(args, "s", &filename ) )
+	memset( &options, 0, sizeof(options) );
+	options.threads = 1;
+	options.drop_cache = fopenx_cache_policy() == CACHE_DROP;
+
+	if( ! PyArg_ParseTupleAndKeywords( args, kwds, "s|idIO", KEYWORDS,
+			&filename, &options.threads, &options.sample_tolerance, &options.sample_seed, &format ) )
 	    return NULL;
 
+	if( format != Py_None ) {
+		if( _format_from_object( format, &hint ) )
+			return NULL;
+		options.hint = &hint;
+	}
+
+	memset( &results, 0, sizeof(results) );
+
+	/**
+	  * Nothing below touches Python objects until the scan completes, so
+	  * the GIL is released for the whole file read. tabular_scan keeps all
+	  * its state in its own frame and in results, so other threads may
+	  * concurrently scan other files.
+	  */
+
+	Py_BEGIN_ALLOW_THREADS
 	fp = fopenx( filename, "r" );
 	if( fp ) {
+		failed = tabular_scan_ex( fp, &options, &results );
+		if( failed ) {
+			const int e = errno; // ...which _scan_result reports.
+			fclosex( fp );
+			errno = e;
+		} else
+			fclosex( fp );
+	}
+	Py_END_ALLOW_THREADS
+
+	if( fp ) {
+		result = _scan_result( &results, failed, filename );
+		tabular_free( &results );
+	} else
+		PyErr_SetFromErrnoWithFilename( PyExc_IOError, filename );
 
-		struct table_description results;
-		int failed = 0;
-	
-		memset( &results, 0, sizeof(results) );
-		failed = tabular_scan( fp, &results );
+	return result;
+}
+
+
+static PyObject *_records_as_object( const struct record_description *d ) {
+
+	PyObject *columns
+		= PyList_New( d->key_count );
+
+	if( columns == NULL )
+		return NULL;
+
+	for(int i = 0; i < d->key_count; i++ ) {
+		PyObject *key, *missing;
+		PyObject *column
+			= _column_as_object( d->column + i );
+		if( column == NULL ) {
+			Py_DECREF( columns );
+			return NULL;
+		}
+		PyList_SET_ITEM( columns, i, column );
+		key = PyUnicode_DecodeUTF8( d->key[i].name, d->key[i].len, "replace" );
+		missing = PyLong_FromUnsignedLong( jsonl_missing( d, i ) );
+		if( key == NULL || missing == NULL
+				|| PyDict_SetItemString( column, "key", key )
+				|| PyDict_SetItemString( column, "missing", missing ) ) {
+			Py_XDECREF( key );
+			Py_XDECREF( missing );
+			Py_DECREF( columns );
+			return NULL;
+		}
+		Py_DECREF( key );
+		Py_DECREF( missing );
+	}
+
+	return Py_BuildValue( "{s:k,s:k,s:k,s:i,s:k,s:N}",
+		"records",           d->records,
+		"empty_lines",       d->empty,
+		"aberrant_lines",    d->aberrant,
+		"key_count",         d->key_count,
+		"max_keys_exceeded", d->keys_exceeded,
+		"columns",           columns );
+}
+
+
+static PyObject *
+_jsonl_scan( PyObject *self, PyObject *args ) {
+
+	FILE *fp = NULL;
+	const char *filename = NULL;
+	PyObject *result = NULL;
+	struct record_description results;
+	int failed = 0;
+	int error = 0;
+
+	if( ! PyArg_ParseTuple( args, "s", &filename ) )
+	    return NULL;
+
+	memset( &results, 0, sizeof(results) );
+
+	Py_BEGIN_ALLOW_THREADS
+	fp = fopenx( filename, "r" );
+	if( fp ) {
+		failed = jsonl_scan( fp, &results );
+		error = errno;
 		fclosex( fp );
+	} else
+		error = errno;
+	Py_END_ALLOW_THREADS
 
-		/**
-		  * We can produce JSON results for any termination status
-		  * except file I/O errors.
-		  */
+	if( fp && ! failed )
+		result = _records_as_object( &results );
+	else {
+		errno = error;
+		PyErr_SetFromErrnoWithFilename( PyExc_IOError, filename );
+	}
+	jsonl_free( &results );
 
-		if( ! failed ) {
+	return result;
+}
 
-			FILE *json_fp = tmpfile();
-			if( json_fp ) {
-				void *buf;
-				size_t len;
-				tabular_as_json( &results, json_fp );
-				len = ftell( json_fp );
-				buf = calloc( len + 1, sizeof(char) );
-				if( buf ) {
-					rewind( json_fp );
-					if( fread( buf, sizeof(char), len, json_fp ) == len )
-						json = PyUnicode_FromString( buf );
-					free( buf ); // TODO: verify safe!
-				}
-				fclose( json_fp );
-			}
 
-			if( json == NULL )
-				PyErr_SetString( PyExc_RuntimeError,
-					"failed encoding table analysis as JSON" );
+static PyObject *_sequence_as_object( const struct sequence_summary *s ) {
 
-		} else {
+	unsigned long long count[ BASE_COUNT ], bases = 0, acgt;
+	double qmean, qstddev;
+	PyObject *quality, *composition, *quantiles;
 
-			switch( results.status ) {
+	for(int b = 0; b < BASE_COUNT; b++ ) {
+		count[b] = sequence_base_count( s, b );
+		bases += count[b];
+	}
+	acgt = count[BASE_A] + count[BASE_C] + count[BASE_G] + count[BASE_T];
 
-			case E_UNINITIALIZED_OUTPUT:
-				PyErr_SetString( PyExc_RuntimeError,
-					"tabular_scan received uninitialized output struct" );
-				break;
+	if( sequence_quality_stats( s, &qmean, &qstddev ) > 0 ) {
+		int lo = 0, hi = 255;
+		while( s->quality[lo] == 0 ) lo++;
+		while( s->quality[hi] == 0 ) hi--;
+		quality = Py_BuildValue( "{s:d,s:d,s:i,s:i}",
+			"mean",   qmean,
+			"stddev", qstddev,
+			"min",    lo - 33,
+			"max",    hi - 33 );
+	} else {
+		quality = Py_None;
+		Py_INCREF( quality );
+	}
+	if( quality == NULL )
+		return NULL;
 
-			case E_FILE_IO:
-				PyErr_SetFromErrnoWithFilename( PyExc_IOError, filename );
+	/**
+	  * Each base's fraction of the bases at each position.
+	  */
+	composition = PyDict_New();
+	for(int b = 0; composition && b < BASE_COUNT; b++ ) {
+		PyObject *fractions
+			= PyList_New( s->positions );
+		if( fractions == NULL || PyDict_SetItemString( composition, BASE_NAME[b], fractions ) ) {
+			Py_XDECREF( fractions );
+			Py_CLEAR( composition );
+			break;
+		}
+		Py_DECREF( fractions );
+		for(int i = 0; i < s->positions; i++ ) {
+			unsigned long total = 0;
+			PyObject *f;
+			for(int c = 0; c < BASE_COUNT; c++ )
+				total += s->composition[i][c];
+			f = PyFloat_FromDouble( total > 0 ? (double)s->composition[i][b] / total : 0.0 );
+			if( f == NULL ) {
+				Py_CLEAR( composition );
 				break;
-
-			default:
-				PyErr_SetString( PyExc_RuntimeError,
-					"unhandled error (unfinished code?) in " __FILE__ );
 			}
+			PyList_SET_ITEM( fractions, i, f );
 		}
-	
-		tabular_free( &results );
+	}
+	if( composition == NULL ) {
+		Py_DECREF( quality );
+		return NULL;
+	}
+
+	quantiles = _quantiles_as_object( s->lengths > 0 ? s->length_sketch : NULL );
+	if( quantiles == NULL ) {
+		Py_DECREF( quality );
+		Py_DECREF( composition );
+		return NULL;
+	}
+
+	return Py_BuildValue(
+		"{s:s,s:k,s:k,s:k,s:K,s:{s:k,s:k,s:d,s:d,s:N},s:d,s:d,s:N,s:O,s:N}",
+		"format", SEQ_FORMAT_NAME[ s->format ],
+		"reads",               s->reads,
+		"malformed_records",   s->malformed,
+		"secondary_alignments", s->secondary,
+		"bases",               bases,
+		"length",
+			"min",       s->min_length,
+			"max",       s->max_length,
+			"mean",      s->length_stats[0],
+			"stddev",    s->length_stats[1],
+			"quantiles", quantiles,
+		"gc_fraction", acgt > 0 ? (double)( count[BASE_C] + count[BASE_G] ) / acgt : 0.0,
+		"n_rate",      bases > 0 ? (double)count[BASE_N] / bases : 0.0,
+		"quality", quality,
+		"positions_truncated", s->max_length > SEQ_MAX_POSITIONS ? Py_True : Py_False,
+		"composition", composition );
+}
+
+
+static PyObject *
+_sequence_scan( PyObject *self, PyObject *args ) {
+
+	FILE *fp = NULL;
+	const char *filename = NULL;
+	PyObject *result = NULL;
+	struct sequence_summary *summary;
+	int failed = 0;
+	int error = 0;
+
+	if( ! PyArg_ParseTuple( args, "s", &filename ) )
+	    return NULL;
+
+	// ...too large (for the per-position tallies) to be stack-resident.
+	summary = calloc( 1, sizeof(struct sequence_summary) );
+	if( summary == NULL )
+		return PyErr_NoMemory();
+
+	Py_BEGIN_ALLOW_THREADS
+	fp = fopenx( filename, "r" );
+	if( fp ) {
+		failed = sequence_scan( fp, summary );
+		error = errno;
+		fclosex( fp );
+	} else
+		error = errno;
+	Py_END_ALLOW_THREADS
+
+	if( fp && ! failed ) {
+		if( summary->format == SEQ_UNKNOWN ) {
+			result = Py_None;
+			Py_INCREF( result );
+		} else
+			result = _sequence_as_object( summary );
+	} else {
+		errno = error;
+		PyErr_SetFromErrnoWithFilename( PyExc_IOError, filename );
+	}
+	sequence_free( summary );
+	free( summary );
+
+	return result;
+}
 
+
+static PyObject *
+_file_signature( PyObject *self, PyObject *args ) {
+
+	const char *filename = NULL;
+	Py_ssize_t size = 8;
+	PyObject *result = NULL;
+	char *buf;
+	FILE *fp;
+	size_t n = 0;
+	int codec = -1;
+	int failed = 0;
+
+	if( ! PyArg_ParseTuple( args, "s|n", &filename, &size ) )
+		return NULL;
+	if( size < 0 ) {
+		PyErr_SetString( PyExc_ValueError, "size must be non-negative" );
+		return NULL;
+	}
+
+	buf = PyMem_Malloc( size > 0 ? size : 1 );
+	if( buf == NULL )
+		return PyErr_NoMemory();
+
+	Py_BEGIN_ALLOW_THREADS
+	fp = fopen( filename, "r" );
+	if( fp ) {
+		codec = codec_identify_by_sig( fp );
+		if( 0 < codec && codec < CODEC_COUNT ) {
+			FILE *dfp = codec_open( fp, codec );
+			if( dfp )
+				fp = dfp;
+			else
+				failed = 1;
+		}
+		if( ! failed ) {
+			n = fread( buf, sizeof(char), size, fp );
+			failed = ferror( fp );
+		}
+		if( failed ) {
+			const int e = errno;
+			fclosex( fp );
+			errno = e;
+		} else
+			fclosex( fp );
+	} else
+		failed = 1;
+	Py_END_ALLOW_THREADS
+
+	if( ! failed ) {
+		const char *name = codec_name( codec );
+		result = Py_BuildValue( "(zy#)", name, buf, (Py_ssize_t)n );
 	} else
 		PyErr_SetFromErrnoWithFilename( PyExc_IOError, filename );
 
-	return json;
+	PyMem_Free( buf );
+	return result;
+}
+
+
+static PyObject *
+_set_cache_policy( PyObject *self, PyObject *args ) {
+
+	static const char *POLICY[ CACHE_POLICY_COUNT ] = { "keep", "drop" };
+	const char *policy = NULL;
+	int i;
+
+	if( ! PyArg_ParseTuple( args, "s", &policy ) )
+		return NULL;
+	for(i = 0; i < CACHE_POLICY_COUNT; i++ ) {
+		if( strcmp( policy, POLICY[i] ) == 0 ) {
+			fopenx_set_cache_policy( i );
+			Py_RETURN_NONE;
+		}
+	}
+	PyErr_Format( PyExc_ValueError, "unknown cache policy \"%s\"", policy );
+	return NULL;
 }
 
 
@@ -273,6 +935,170 @@ _gaussian_kde( PyObject *self, PyObject *args) {
 }
 
 
+/**
+  * TabularScanner: tabular_scan of input fed in buffers rather than read
+  * from a file.
+  */
+
+typedef struct {
+	PyObject_HEAD
+	struct tabular_scanner *scanner; // NULL once finished.
+	struct table_description results;
+	bool busy; // ...feeding (without the GIL) in some thread.
+} TabularScanner;
+
+
+static void _scanner_reset( TabularScanner *self ) {
+	if( self->scanner ) {
+		tabular_scanner_destroy( self->scanner );
+		self->scanner = NULL;
+	}
+	tabular_free( & self->results );
+	memset( & self->results, 0, sizeof(self->results) );
+}
+
+
+static int _scanner_init( TabularScanner *self, PyObject *args, PyObject *kwds ) {
+
+	static char *KEYWORDS[] = { "format", NULL };
+	PyObject *format = Py_None;
+	struct format hint;
+	struct scan_options options;
+
+	if( ! PyArg_ParseTupleAndKeywords( args, kwds, "|O", KEYWORDS, &format ) )
+		return -1;
+
+	memset( &options, 0, sizeof(options) );
+	if( format != Py_None ) {
+		if( _format_from_object( format, &hint ) )
+			return -1;
+		options.hint = &hint;
+	}
+
+	if( self->busy ) {
+		PyErr_SetString( PyExc_RuntimeError, "TabularScanner is in use" );
+		return -1;
+	}
+	_scanner_reset( self );
+	if( (self->scanner = tabular_scanner_create( &options, & self->results )) == NULL ) {
+		PyErr_NoMemory();
+		return -1;
+	}
+	return 0;
+}
+
+
+static void _scanner_dealloc( TabularScanner *self ) {
+	_scanner_reset( self );
+	Py_TYPE( self )->tp_free( (PyObject *)self );
+}
+
+
+static int _scanner_check( TabularScanner *self ) {
+	if( self->scanner == NULL ) {
+		PyErr_SetString( PyExc_ValueError, "TabularScanner is finished" );
+		return -1;
+	}
+	if( self->busy ) {
+		PyErr_SetString( PyExc_RuntimeError, "TabularScanner is in use" );
+		return -1;
+	}
+	return 0;
+}
+
+
+static PyObject *_scanner_feed( TabularScanner *self, PyObject *args ) {
+
+	Py_buffer view;
+	int failed;
+
+	if( ! PyArg_ParseTuple( args, "y*", &view ) )
+		return NULL;
+
+	if( _scanner_check( self ) ) {
+		PyBuffer_Release( &view );
+		return NULL;
+	}
+
+	/**
+	  * The buffer is scanned in place; the scanner retains no reference
+	  * to it once the feed returns.
+	  */
+
+	self->busy = true;
+	Py_BEGIN_ALLOW_THREADS
+	failed = tabular_scanner_feed( self->scanner, view.buf, view.len );
+	Py_END_ALLOW_THREADS
+	self->busy = false;
+
+	PyBuffer_Release( &view );
+
+	// Only I/O errors (on the scanner's cache) are exceptional.
+	if( failed && self->results.status >= E_FILE_IO )
+		return PyErr_SetFromErrno( PyExc_IOError );
+
+	Py_RETURN_NONE;
+}
+
+
+static PyObject *_scanner_finish( TabularScanner *self, PyObject *unused ) {
+
+	PyObject *result;
+	int failed;
+
+	if( _scanner_check( self ) )
+		return NULL;
+
+	self->busy = true;
+	Py_BEGIN_ALLOW_THREADS
+	failed = tabular_scanner_finish( self->scanner );
+	Py_END_ALLOW_THREADS
+	self->busy = false;
+
+	result = _scan_result( & self->results, failed, NULL );
+	_scanner_reset( self );
+	return result;
+}
+
+
+static PyMethodDef _scanner_methods[] = {
+	{"feed", (PyCFunction)_scanner_feed, METH_VARARGS,
+	"feed( buffer ) -> None\n"
+	"Scans the bytes of any (C-contiguous) object supporting the buffer\n"
+	"protocol, e.g. bytes, bytearray, memoryview or mmap, without copying\n"
+	"them. Buffers may be of any size and split lines or characters\n"
+	"anywhere. The GIL is released while the buffer is scanned.\n"
+	},
+	{"finish", (PyCFunction)_scanner_finish, METH_NOARGS,
+	"finish() -> dict\n"
+	"Signals the end of input and returns the results, exactly as\n"
+	"tabular_scan would for a file of all the bytes fed. The scanner\n"
+	"cannot be fed thereafter (unless reinitialized with __init__).\n"
+	},
+	{NULL}
+};
+
+
+static PyTypeObject TabularScannerType = {
+	PyVarObject_HEAD_INIT( NULL, 0 )
+	.tp_name      = "compiled.TabularScanner",
+	.tp_basicsize = sizeof(TabularScanner),
+	.tp_flags     = Py_TPFLAGS_DEFAULT,
+	.tp_new       = PyType_GenericNew,
+	.tp_init      = (initproc)_scanner_init,
+	.tp_dealloc   = (destructor)_scanner_dealloc,
+	.tp_methods   = _scanner_methods,
+	.tp_doc       =
+	"TabularScanner( format=None )\n"
+	"Carries out tabular_scan incrementally on input fed to it in buffers,\n"
+	"e.g. from a pipe, a Python decompressor or the members of a tar or\n"
+	"zip archive, so that it need not be written to a file first. All\n"
+	"state is kept in the scanner between calls to feed. format is as for\n"
+	"tabular_scan; the other options of tabular_scan apply only to files.\n"
+	"A scanner may be used by any thread, but by only one at a time.\n",
+};
+
+
 /**
   * From python-3.3.2-docs-html/extending/extending.html#a-simple-example:
   * "The initialization function must be named PyInit_name(), where name is
@@ -282,10 +1108,21 @@ _gaussian_kde( PyObject *self, PyObject *args) {
 
 PyMODINIT_FUNC PyInit_compiled(void) {
 
-	PyObject *m
-		= PyModule_Create( &_moduledef );
+	PyObject *m;
+
+	if( PyType_Ready( &TabularScannerType ) < 0 )
+		return NULL;
+
+	m = PyModule_Create( &_moduledef );
 	if (m == NULL)
 	    return NULL;
+
+	Py_INCREF( &TabularScannerType );
+	if( PyModule_AddObject( m, "TabularScanner", (PyObject *)&TabularScannerType ) < 0 ) {
+		Py_DECREF( &TabularScannerType );
+		Py_DECREF( m );
+		return NULL;
+	}
 /*
 	CharCompError = PyErr_NewException("text.error", NULL, NULL);
 	Py_INCREF(CharCompError);
@@ -0,0 +1,550 @@
+
+/**
+  * Input is read in large blocks and split into lines with memchr. Each
+  * line (or, if a line is longer than the block, each fragment of it) is
+  * passed to a per-format state machine, so memory is bounded by the
+  * block size, the fixed per-position tallies and the length sketch,
+  * however long the file or its sequences.
+  *
+  * The per-base work is a table lookup and an increment of the tally for
+  * the base's position, so the scan should be limited by I/O (or by
+  * decompression) rather than by computation.
+  */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdbool.h>
+#include <string.h>
+#include <errno.h>
+#include <math.h>
+
+#include "../tabular/tdigest.h"
+#include "sequence.h"
+
+#ifndef SEQ_BLOCK_SIZE
+#define SEQ_BLOCK_SIZE (1024*1024)
+#endif
+
+/**
+  * FASTA and FASTQ lines longer than the block are processed in fragments,
+  * but a SAM line must be entire; the buffer grows to hold SAM lines up to
+  * this long, and longer ones are malformed.
+  */
+#ifndef SEQ_MAX_SAM_LINE
+#define SEQ_MAX_SAM_LINE (64*1024*1024)
+#endif
+
+#define SAM_FIELDS (11)
+#define SAM_SECONDARY_OR_SUPPLEMENTARY (0x100|0x800)
+#define SAM_REVERSE (0x10)
+
+const char *SEQ_FORMAT_NAME[ SEQ_FORMAT_COUNT ] = {
+	"unknown",
+	"fasta",
+	"fastq",
+	"sam"
+};
+
+const char *BASE_NAME[ BASE_COUNT ] = {
+	"other",
+	"A",
+	"C",
+	"G",
+	"T",
+	"N"
+};
+
+static const unsigned char _base[ 256 ] = {
+	['A'] = BASE_A, ['a'] = BASE_A,
+	['C'] = BASE_C, ['c'] = BASE_C,
+	['G'] = BASE_G, ['g'] = BASE_G,
+	['T'] = BASE_T, ['t'] = BASE_T,
+	['U'] = BASE_T, ['u'] = BASE_T,
+	['N'] = BASE_N, ['n'] = BASE_N,
+};
+
+static const unsigned char _complement[ BASE_COUNT ] = {
+	[BASE_OTHER] = BASE_OTHER,
+	[BASE_A] = BASE_T,
+	[BASE_C] = BASE_G,
+	[BASE_G] = BASE_C,
+	[BASE_T] = BASE_A,
+	[BASE_N] = BASE_N,
+};
+
+enum {
+	FASTA_SEQUENCE = 0,
+	FASTA_HEADER,
+	FASTA_COMMENT
+};
+
+enum {
+	FASTQ_HEADER = 0,
+	FASTQ_SEQUENCE,
+	FASTQ_SEPARATOR,
+	FASTQ_QUALITY
+};
+
+struct parser {
+
+	struct sequence_summary *s;
+
+	int state;
+
+	/**
+	  * Set after a malformed record until the start of the next.
+	  */
+	bool lost;
+
+	/**
+	  * In a FASTA record, whether one is open and the length so far; in a
+	  * FASTQ record, the sequence's length and its quality's length so far.
+	  */
+	bool open;
+	unsigned long length;
+	unsigned long qlength;
+};
+
+
+/**
+  * Tally the bases seq[0,len) as positions [offset,offset+len) of a read.
+  */
+static void _tally_bases( struct sequence_summary *s, const char *seq, unsigned long len, unsigned long offset ) {
+
+	const unsigned char *pc = (const unsigned char *)seq;
+	const unsigned long LAST = SEQ_MAX_POSITIONS - 1;
+	unsigned long i = 0;
+
+	if( offset < LAST ) {
+		unsigned long (*pos)[ BASE_COUNT ] = s->composition + offset;
+		const unsigned long N
+			= len < LAST - offset ? len : LAST - offset;
+		for(; i < N; i++ )
+			pos[i][ _base[ pc[i] ] ] += 1;
+	}
+	for(; i < len; i++ )
+		s->composition[ LAST ][ _base[ pc[i] ] ] += 1;
+
+	if( offset + len > (unsigned long)s->positions )
+		s->positions = offset + len <= LAST ? offset + len : LAST + 1;
+}
+
+
+/**
+  * Tally the bases of a reverse-strand alignment in sequencing order.
+  */
+static void _tally_reversed( struct sequence_summary *s, const char *seq, unsigned long len ) {
+
+	const unsigned char *pc = (const unsigned char *)seq;
+	const unsigned long LAST = SEQ_MAX_POSITIONS - 1;
+
+	for(unsigned long j = 0; j < len; j++ ) {
+		const int B = _complement[ _base[ pc[ len - 1 - j ] ] ];
+		s->composition[ j < LAST ? j : LAST ][ B ] += 1;
+	}
+	if( len > (unsigned long)s->positions )
+		s->positions = len <= LAST ? len : LAST + 1;
+}
+
+
+static void _tally_quality( struct sequence_summary *s, const char *qual, unsigned long len ) {
+	const unsigned char *pc = (const unsigned char *)qual;
+	for(unsigned long i = 0; i < len; i++ )
+		s->quality[ pc[i] ] += 1;
+}
+
+
+static void _tally_length( struct sequence_summary *s, unsigned long len ) {
+
+	const double X = len;
+	const double DELTA = X - s->length_stats[0];
+
+	s->lengths += 1;
+	s->length_stats[0] += DELTA / s->lengths;
+	s->length_stats[1] += DELTA * ( X - s->length_stats[0] );
+	if( s->lengths == 1 || s->min_length > len )
+		s->min_length = len;
+	if( s->max_length < len )
+		s->max_length = len;
+	if( s->length_sketch )
+		tdigest_add( s->length_sketch, X );
+}
+
+
+static void _malformed( struct parser *p ) {
+	if( ! p->lost ) {
+		p->s->malformed += 1;
+		p->lost = true;
+	}
+}
+
+
+/**
+  * Each of the following receives a line (or a fragment of one) that
+  * begins a line if <first> and ends it if <last>.
+  */
+
+static void _fasta( struct parser *p, const char *line, unsigned long len, bool first, bool last ) {
+
+	struct sequence_summary *s = p->s;
+
+	if( first ) {
+		if( len > 0 && line[0] == '>' ) {
+			if( p->open )
+				_tally_length( s, p->length );
+			s->reads += 1;
+			p->open = true;
+			p->lost = false;
+			p->length = 0;
+			p->state = FASTA_HEADER;
+		} else
+		if( len > 0 && line[0] == ';' ) {
+			p->state = FASTA_COMMENT;
+		} else
+			p->state = FASTA_SEQUENCE;
+	}
+
+	if( p->state == FASTA_SEQUENCE ) {
+		if( p->open ) {
+			_tally_bases( s, line, len, p->length );
+			p->length += len;
+		} else
+		if( len > 0 )
+			_malformed( p ); // ...sequence preceding any header.
+	}
+}
+
+
+static void _fastq( struct parser *p, const char *line, unsigned long len, bool first, bool last ) {
+
+	struct sequence_summary *s = p->s;
+
+	switch( p->state ) {
+
+	case FASTQ_HEADER:
+		if( first ) {
+			if( len == 0 )
+				return; // ...e.g. trailing blank lines.
+			if( line[0] != '@' ) {
+				_malformed( p );
+				return;
+			}
+			p->lost = false;
+		} else
+		if( p->lost )
+			return;
+		if( last ) {
+			s->reads += 1;
+			p->length = 0;
+			p->state = FASTQ_SEQUENCE;
+		}
+		break;
+
+	case FASTQ_SEQUENCE:
+		_tally_bases( s, line, len, p->length );
+		p->length += len;
+		if( last ) {
+			_tally_length( s, p->length );
+			p->state = FASTQ_SEPARATOR;
+		}
+		break;
+
+	case FASTQ_SEPARATOR:
+		if( first && ( len == 0 || line[0] != '+' ) ) {
+			_malformed( p );
+			p->state = FASTQ_HEADER;
+			return;
+		}
+		if( last ) {
+			p->qlength = 0;
+			p->state = FASTQ_QUALITY;
+		}
+		break;
+
+	case FASTQ_QUALITY:
+		_tally_quality( s, line, len );
+		p->qlength += len;
+		if( last ) {
+			if( p->qlength != p->length )
+				s->malformed += 1;
+			p->state = FASTQ_HEADER;
+		}
+		break;
+	}
+}
+
+
+static void _sam( struct parser *p, const char *line, unsigned long len, bool first, bool last ) {
+
+	struct sequence_summary *s = p->s;
+	const char *field[ SAM_FIELDS+1 ];
+	const char *const END = line + len;
+	const char *pc = line;
+	unsigned long flag, seqlen, quallen;
+	int n = 0;
+
+	if( ! ( first && last ) ) {
+		// ...a fragment of an over-long line.
+		if( first )
+			s->malformed += 1;
+		return;
+	}
+
+	if( len == 0 || line[0] == '@' )
+		return; // ...a header line.
+
+	while( n < SAM_FIELDS ) {
+		const char *tab = memchr( pc, '\t', END - pc );
+		field[ n++ ] = pc;
+		if( tab == NULL ) {
+			pc = END + 1;
+			break;
+		}
+		pc = tab + 1;
+	}
+	field[ n ] = pc;
+	if( n < SAM_FIELDS ) {
+		s->malformed += 1;
+		return;
+	}
+
+	flag = strtoul( field[1], NULL, 10 );
+	if( flag & SAM_SECONDARY_OR_SUPPLEMENTARY ) {
+		s->secondary += 1;
+		return;
+	}
+	s->reads += 1;
+
+	seqlen  = field[10] - field[9]  - 1;
+	quallen = field[11] - field[10] - 1;
+	if( seqlen == 1 && field[9][0] == '*' )
+		return;
+	if( flag & SAM_REVERSE )
+		_tally_reversed( s, field[9], seqlen );
+	else
+		_tally_bases( s, field[9], seqlen, 0 );
+	_tally_length( s, seqlen );
+	if( quallen == 1 && field[10][0] == '*' )
+		return;
+	if( quallen != seqlen )
+		s->malformed += 1;
+	_tally_quality( s, field[10], quallen );
+}
+
+
+/**
+  * Infer the format from the first non-empty line: FASTA begins with '>'
+  * (or a ';' comment), and FASTQ with '@' except that SAM's header lines
+  * begin with '@' and a two-letter record type (e.g. "@HD\t"). A SAM file
+  * without a header is recognized by its count of fields.
+  */
+static int _identify( const char *line, unsigned long len ) {
+	if( line[0] == '>' || line[0] == ';' )
+		return SEQ_FASTA;
+	if( line[0] == '@' ) {
+		if( len >= 4 && line[3] == '\t'
+				&& 'A' <= line[1] && line[1] <= 'Z'
+				&& 'A' <= line[2] && line[2] <= 'Z' )
+			return SEQ_SAM;
+		return SEQ_FASTQ;
+	} else {
+		int tabs = 0;
+		const char *pc = line;
+		const char *const END = line + len;
+		while( tabs < SAM_FIELDS - 1 && ( pc = memchr( pc, '\t', END - pc ) ) ) {
+			tabs++;
+			pc++;
+		}
+		return tabs == SAM_FIELDS - 1 ? SEQ_SAM : SEQ_UNKNOWN;
+	}
+}
+
+
+/**
+  * Returns false once the format is known to be unknown.
+  */
+static bool _line( struct parser *p, const char *line, unsigned long len, bool first, bool last ) {
+
+	if( last && len > 0 && line[ len - 1 ] == '\r' )
+		len -= 1;
+
+	if( p->s->format == SEQ_UNKNOWN ) {
+		if( len == 0 )
+			return true;
+		p->s->format = _identify( line, len );
+	}
+
+	switch( p->s->format ) {
+	case SEQ_FASTA:
+		_fasta( p, line, len, first, last );
+		break;
+	case SEQ_FASTQ:
+		_fastq( p, line, len, first, last );
+		break;
+	case SEQ_SAM:
+		_sam( p, line, len, first, last );
+		break;
+	default:
+		return false;
+	}
+	return true;
+}
+
+
+int sequence_scan( FILE *fp, struct sequence_summary *s ) {
+
+	struct parser p;
+	char *buf;
+	size_t cap = SEQ_BLOCK_SIZE, len = 0, pos = 0;
+	bool first = true; // ...the next byte begins a line.
+	bool eof = false;
+	bool known = true;
+
+	memset( &p, 0, sizeof(p) );
+	p.s = s;
+
+	s->length_sketch = tdigest_create();
+	buf = malloc( cap );
+	if( s->length_sketch == NULL || buf == NULL ) {
+		free( buf );
+		errno = ENOMEM;
+		return -1;
+	}
+
+	while( known ) {
+		char *nl = memchr( buf + pos, '\n', len - pos );
+		if( nl ) {
+			known = _line( &p, buf + pos, nl - buf - pos, first, true );
+			first = true;
+			pos = nl - buf + 1;
+			continue;
+		}
+		if( eof ) {
+			if( pos < len || ! first )
+				known = _line( &p, buf + pos, len - pos, first, true );
+			break;
+		}
+		if( pos > 0 ) {
+			memmove( buf, buf + pos, len - pos );
+			len -= pos;
+			pos = 0;
+		} else
+		if( len == cap ) {
+			// The buffer holds part of a single line.
+			if( s->format == SEQ_SAM && cap < SEQ_MAX_SAM_LINE ) {
+				char *b = realloc( buf, 2*cap );
+				if( b == NULL ) {
+					free( buf );
+					errno = ENOMEM;
+					return -1;
+				}
+				buf = b;
+				cap *= 2;
+			} else {
+				// ...holding back a CR that may precede the LF.
+				const size_t N
+					= buf[ len - 1 ] == '\r' ? len - 1 : len;
+				known = _line( &p, buf, N, first, false );
+				first = false;
+				memmove( buf, buf + N, len - N );
+				len -= N;
+			}
+		}
+		len += fread( buf + len, 1, cap - len, fp );
+		if( len < cap ) {
+			if( ferror( fp ) )
+				break;
+			eof = feof( fp );
+		}
+	}
+	free( buf );
+
+	if( ferror( fp ) )
+		return -1;
+
+	if( s->format == SEQ_FASTA && p.open )
+		_tally_length( s, p.length );
+	if( s->format == SEQ_FASTQ && p.state != FASTQ_HEADER )
+		s->malformed += 1; // ...a truncated final record.
+
+	// Convert variance to standard deviation
+	s->length_stats[1]
+		= s->lengths > 1 ? sqrt( s->length_stats[1] / ( s->lengths - 1 ) ) : 0.0;
+	return 0;
+}
+
+
+void sequence_free( struct sequence_summary *s ) {
+	tdigest_destroy( s->length_sketch );
+	s->length_sketch = NULL;
+}
+
+
+unsigned long long sequence_base_count( const struct sequence_summary *s, int b ) {
+	unsigned long long n = 0;
+	for(int i = 0; i < s->positions; i++ )
+		n += s->composition[i][b];
+	return n;
+}
+
+
+unsigned long long sequence_quality_stats( const struct sequence_summary *s, double *mean, double *stddev ) {
+
+	unsigned long long n = 0;
+	double sum = 0, ss = 0;
+
+	for(int c = 0; c < 256; c++ ) {
+		n   += s->quality[c];
+		sum += (double)s->quality[c] * ( c - 33 );
+	}
+	*mean = n > 0 ? sum / n : NAN;
+	for(int c = 0; c < 256; c++ ) {
+		const double D = ( c - 33 ) - *mean;
+		ss += s->quality[c] * D * D;
+	}
+	*stddev = n > 1 ? sqrt( ss / ( n - 1 ) ) : 0.0;
+	return n;
+}
+
+
+#ifdef UNIT_TEST_SEQUENCE
+
+/**
+  * Summarizes the sequence file named by the argument (or stdin).
+  */
+int main( int argc, char *argv[] ) {
+
+	static struct sequence_summary s;
+	FILE *fp = argc > 1 ? fopen( argv[1], "r" ) : stdin;
+	double mean, sd;
+
+	if( fp == NULL ) {
+		perror( argv[1] );
+		return EXIT_FAILURE;
+	}
+	if( sequence_scan( fp, &s ) ) {
+		perror( "sequence_scan" );
+		return EXIT_FAILURE;
+	}
+	printf( "format\t%s\nreads\t%lu\nmalformed\t%lu\nsecondary\t%lu\n",
+		SEQ_FORMAT_NAME[ s.format ], s.reads, s.malformed, s.secondary );
+	printf( "length\t%lu..%lu\tmean=%g\tsd=%g\tmedian=%g\n",
+		s.min_length, s.max_length, s.length_stats[0], s.length_stats[1],
+		tdigest_quantile( s.length_sketch, 0.5 ) );
+	for(int b = 0; b < BASE_COUNT; b++ )
+		printf( "%s\t%llu\n", BASE_NAME[b], sequence_base_count( &s, b ) );
+	printf( "quality\tn=%llu", sequence_quality_stats( &s, &mean, &sd ) );
+	printf( "\tmean=%g\tsd=%g\n", mean, sd );
+	for(int i = 0; i < s.positions && i < 8; i++ ) {
+		printf( "%d", i );
+		for(int b = 0; b < BASE_COUNT; b++ )
+			printf( "\t%lu", s.composition[i][b] );
+		putchar( '\n' );
+	}
+	sequence_free( &s );
+	if( fp != stdin )
+		fclose( fp );
+	return EXIT_SUCCESS;
+}
+#endif
+
@@ -0,0 +1,106 @@
+
+#ifndef _sequence_h_
+#define _sequence_h_
+
+/**
+  * Summaries of nucleotide sequence files (FASTQ, FASTA and SAM) computed
+  * in a single streaming pass in memory independent of the file's size.
+  */
+
+enum SequenceFormat {
+	SEQ_UNKNOWN = 0,
+	SEQ_FASTA,
+	SEQ_FASTQ,
+	SEQ_SAM,
+	SEQ_FORMAT_COUNT
+};
+
+extern const char *SEQ_FORMAT_NAME[ SEQ_FORMAT_COUNT ];
+
+/**
+  * Every byte of a sequence is one of these. BASE_OTHER includes IUPAC
+  * ambiguity codes other than N and anything that is not a nucleotide.
+  */
+enum Base {
+	BASE_OTHER = 0,
+	BASE_A,
+	BASE_C,
+	BASE_G,
+	BASE_T, // ...including U.
+	BASE_N,
+	BASE_COUNT
+};
+
+extern const char *BASE_NAME[ BASE_COUNT ];
+
+/**
+  * Base composition is tallied separately for each of the first
+  * SEQ_MAX_POSITIONS-1 positions of reads; the last position accumulates
+  * all the positions beyond.
+  */
+#ifndef SEQ_MAX_POSITIONS
+#define SEQ_MAX_POSITIONS (512)
+#endif
+
+struct tdigest;
+
+struct sequence_summary {
+
+	int format;
+
+	/**
+	  * Records (reads, or SAM primary alignments), those that were
+	  * malformed (which may be partially tallied), and SAM secondary and
+	  * supplementary alignments (which are not otherwise tallied).
+	  */
+	unsigned long reads;
+	unsigned long malformed;
+	unsigned long secondary;
+
+	/**
+	  * Sequence lengths: extrema, mean and variance (standard deviation
+	  * once the scan is complete), and a sketch of their distribution.
+	  * SAM records without a sequence ('*') have no length.
+	  */
+	unsigned long lengths;
+	unsigned long min_length, max_length;
+	double length_stats[2];
+	struct tdigest *length_sketch;
+
+	/**
+	  * composition[i][b] is the count of base b at (0-based) position i
+	  * of reads (in sequencing order, so reverse-strand SAM alignments are
+	  * reverse complemented). positions is the count of positions in use,
+	  * at most SEQ_MAX_POSITIONS.
+	  */
+	int positions;
+	unsigned long composition[ SEQ_MAX_POSITIONS ][ BASE_COUNT ];
+
+	/**
+	  * Count of each quality character (FASTQ and SAM only).
+	  */
+	unsigned long quality[ 256 ];
+};
+
+/**
+  * <summary> must be zeroed and later released with sequence_free. The
+  * format is inferred from the first non-empty line; if it is none of the
+  * above summary->format is SEQ_UNKNOWN and nothing more is read.
+  * Returns 0 on success or -1 (with errno set) on failure.
+  */
+int  sequence_scan( FILE *fp, struct sequence_summary *summary );
+void sequence_free( struct sequence_summary * );
+
+/**
+  * Total of base <b> over all positions.
+  */
+unsigned long long sequence_base_count( const struct sequence_summary *, int b );
+
+/**
+  * Mean and standard deviation of quality scores, taking quality
+  * characters as Phred+33. Returns the count of scores.
+  */
+unsigned long long sequence_quality_stats( const struct sequence_summary *, double *mean, double *stddev );
+
+#endif
+
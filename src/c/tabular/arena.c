@@ -0,0 +1,64 @@
+
+#include <stdlib.h>
+#include <string.h>
+
+#include "arena.h"
+
+struct arena_block {
+	struct arena_block *next;
+	size_t size;
+	size_t used;
+	char data[];
+};
+
+
+struct arena *arena_create( void ) {
+	return calloc( 1, sizeof(struct arena) );
+}
+
+
+void arena_destroy( struct arena *a ) {
+	if( a ) {
+		struct arena_block *b = a->head;
+		while( b ) {
+			struct arena_block *next = b->next;
+			free( b );
+			b = next;
+		}
+		free( a );
+	}
+}
+
+
+char *arena_strndup( struct arena *a, const char *str, size_t len ) {
+
+	struct arena_block *b
+		= a->head;
+	char *copy;
+
+	if( b == NULL || b->size - b->used < len + 1 ) {
+		const size_t SIZE
+			= len + 1 > ARENA_BLOCK_SIZE ? len + 1 : ARENA_BLOCK_SIZE;
+		b = malloc( sizeof(struct arena_block) + SIZE );
+		if( b == NULL )
+			return NULL;
+		b->size = SIZE;
+		b->used = 0;
+		// An oversized block is full as soon as it is used, so keep
+		// allocating from the current block.
+		if( a->head && SIZE > ARENA_BLOCK_SIZE ) {
+			b->next = a->head->next;
+			a->head->next = b;
+		} else {
+			b->next = a->head;
+			a->head = b;
+		}
+	}
+
+	copy = b->data + b->used;
+	memcpy( copy, str, len );
+	copy[ len ] = '\0';
+	b->used += len + 1;
+	return copy;
+}
+
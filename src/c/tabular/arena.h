@@ -0,0 +1,37 @@
+
+#ifndef _arena_h_
+#define _arena_h_
+
+/**
+  * A bump-pointer allocator for strings that all live exactly as long as
+  * the arena: there is no way to free an individual allocation, and
+  * arena_destroy releases everything at once. Memory is obtained in blocks
+  * of ARENA_BLOCK_SIZE (or larger for oversized requests), so many small
+  * strings cost few calls to malloc and fragment nothing.
+  * An arena is not thread-safe; each thread should have its own.
+  */
+
+#ifndef ARENA_BLOCK_SIZE
+#define ARENA_BLOCK_SIZE (64*1024)
+#endif
+
+struct arena_block;
+
+/**
+  * NONE OF THIS STRUCT SHOULD BE USED DIRECTLY.
+  */
+struct arena {
+	struct arena_block *head; // ...the block currently allocated from.
+};
+
+struct arena *arena_create( void );
+void   arena_destroy( struct arena * );
+
+/**
+  * Copy the <len> bytes at <str> into the arena, NUL-terminating the copy.
+  * Returns NULL only if memory is exhausted.
+  */
+char  *arena_strndup( struct arena *, const char *str, size_t len );
+
+#endif
+
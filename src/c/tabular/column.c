@@ -17,13 +17,23 @@
 #include <math.h>
 #include <regex.h>
 #include <alloca.h>
+#include <pthread.h>
 #include <assert.h>
 
 #include "strset.h"
 #include "column.h"
+#include "tdigest.h"
+#include "hll.h"
 #include "util.h"
 #include "environ.h"
 
+const char *STAT_CLASS_NAME[ STC_COUNT ] = {
+	"unknown",
+	"categorical",
+	"quantitative",
+	"ordinal"
+};
+
 /**
   * Compile regular expressions to identify special string values:
   * 1. missing data placeholders
@@ -69,19 +79,34 @@ void fini_column_analysis() {
 }
 
 
-int init_column_analysis() {
+/**
+  * The compiled patterns and environment overrides are process-wide and
+  * read-only once initialized, so they are initialized exactly once (no
+  * matter how many threads are scanning) and released at exit.
+  */
+static pthread_once_t _init_once = PTHREAD_ONCE_INIT;
+static int _init_status = -1;
+
+static void _init_once_routine( void ) {
 
 	const int FLAGS
 	   = REG_EXTENDED | REG_NOSUB | REG_ICASE | REG_NEWLINE;
 
 	if( _compile( _pattern_NA,   &_compiled_re_NA,   FLAGS ) )
-		return -1;
+		return;
 #ifdef HAVE_BOOLEAN_DETECTION
 	if( _compile( _pattern_BOOL, &_compiled_re_BOOL, FLAGS ) )
-		return -1;
+		return;
 #endif
 	read_environment_overrides();
-	return 0;
+	atexit( fini_column_analysis );
+	_init_status = 0;
+}
+
+
+int init_column_analysis() {
+	pthread_once( &_init_once, _init_once_routine );
+	return _init_status;
 }
 
 
@@ -318,3 +343,146 @@ void analyze_column( struct column *c ) {
 	} // > 1 type observed.
 }
 
+
+
+/**
+  * The value set is exact while it contains every distinct value, which
+  * excludes floats and long fields; otherwise fall back to the estimate.
+  */
+unsigned long column_distinct_values( const struct column *c ) {
+	if( c->excess_values == 0
+			&& c->type_vote[ FTY_FLOAT ] == 0
+			&& c->long_field_count == 0 )
+		return set_count( & c->value_set );
+	return c->cardinality
+		? (unsigned long)round( hll_estimate( c->cardinality ) )
+		: 0;
+}
+
+
+/**
+  * Fold the accumulators of <from> into <into> as if the values observed
+  * in <from> had been observed by <into> after its own. This supports
+  * scanning parts of a file concurrently. <from> must not have been
+  * analyzed yet (statistics[1] must still be a variance).
+  * <line_offset> is the count of table lines that precede those <from>
+  * observed; it makes <from>'s excess_values a line number of the whole
+  * table. If the merged value set overflows although neither set did on
+  * its own, the line on which it would have is unknown, and the first
+  * line of <from> is recorded.
+  */
+void merge_column( struct column *into, const struct column *from, int line_offset ) {
+
+	const double NA
+		= into->type_vote[ FTY_INTEGER ] + into->type_vote[ FTY_FLOAT ];
+	const double NB
+		= from->type_vote[ FTY_INTEGER ] + from->type_vote[ FTY_FLOAT ];
+
+	if( NB > 0 ) {
+
+		/**
+		  * Chan et al.'s pairwise combination of means and sums of
+		  * squared deviations, M2 = (N-1)*variance:
+		  * M2 = M2_A + M2_B + delta^2 * N_A*N_B / N
+		  */
+
+		const double N
+			= NA + NB;
+		const double delta
+			= from->statistics[0] - into->statistics[0];
+		const double M2
+			= ( NA > 1 ? (NA-1.0)*into->statistics[1] : 0.0 )
+			+ ( NB > 1 ? (NB-1.0)*from->statistics[1] : 0.0 )
+			+ delta*delta * NA*NB / N;
+
+		into->statistics[0] += delta * NB / N;
+		into->statistics[1]  = N > 1 ? M2 / (N-1.0) : 0.0;
+
+		if( NA > 0 ) {
+			if( into->extrema[0] > from->extrema[0] )
+				into->extrema[0] = from->extrema[0];
+			if( into->extrema[1] < from->extrema[1] )
+				into->extrema[1] = from->extrema[1];
+		} else {
+			into->extrema[0] = from->extrema[0];
+			into->extrema[1] = from->extrema[1];
+		}
+	}
+
+	if( from->cardinality ) {
+		if( into->cardinality == NULL )
+			into->cardinality = hll_create();
+		if( into->cardinality )
+			hll_merge( into->cardinality, from->cardinality );
+	}
+
+	if( from->sketch ) {
+		if( into->sketch == NULL )
+			into->sketch = tdigest_create();
+		if( into->sketch )
+			tdigest_merge( into->sketch, from->sketch );
+	}
+
+	for(int i = 0; i < FTY_COUNT; i++ )
+		into->type_vote[i] += from->type_vote[i];
+
+	if( into->max_field_len < from->max_field_len )
+		into->max_field_len = from->max_field_len;
+	into->long_field_count += from->long_field_count;
+
+	into->has_negative_integers
+		= into->has_negative_integers
+		|| from->has_negative_integers;
+	into->integer_magnitudes |= from->integer_magnitudes;
+
+	if( into->excess_values == 0 ) {
+		void *cookie;
+		const char *value;
+		if( set_iter( & from->value_set, &cookie ) ) {
+			while( set_next( & from->value_set, &cookie, &value ) ) {
+				if( set_insert( & into->value_set, value ) == SZS_TABLE_FULL ) {
+					into->excess_values
+						= line_offset + from->excess_values;
+					break;
+				}
+			}
+		}
+		if( into->excess_values == 0 && from->excess_values )
+			into->excess_values = line_offset + from->excess_values;
+	}
+}
+
+
+/**
+  * Decide whether the statistics of <c> are indistinguishable, within
+  * <tolerance>, from those of <prior>, an earlier copy of the same column:
+  * the mean may not have moved by more than tolerance standard deviations,
+  * the variance by more than tolerance of itself, and no type's share of
+  * the votes by more than tolerance.
+  */
+bool column_converged( const struct column *prior, const struct column *c, double tolerance ) {
+
+	double T0 = 0, T1 = 0;
+
+	for(int i = 0; i < FTY_COUNT; i++ ) {
+		T0 += prior->type_vote[i];
+		T1 += c->type_vote[i];
+	}
+	if( T0 == 0 || T1 == 0 )
+		return T0 == T1;
+
+	for(int i = 0; i < FTY_COUNT; i++ ) {
+		if( fabs( c->type_vote[i]/T1 - prior->type_vote[i]/T0 ) > tolerance )
+			return false;
+	}
+
+	if( c->type_vote[ FTY_INTEGER ] + c->type_vote[ FTY_FLOAT ] > 0 ) {
+		const double V
+			= c->statistics[1];
+		if( fabs( c->statistics[0] - prior->statistics[0] ) > tolerance*sqrt( V ) )
+			return false;
+		if( fabs( V - prior->statistics[1] ) > tolerance*V )
+			return false;
+	}
+	return true;
+}
@@ -10,6 +10,11 @@ enum STATISTICAL_CLASS {
 	STC_COUNT
 };
 
+/**
+  * Names of the statistical classes as they appear in output.
+  */
+extern const char *STAT_CLASS_NAME[ STC_COUNT ];
+
 enum FIELD_TYPE {
 	FTY_EMPTY = 0,
 	FTY_STRING,
@@ -72,6 +77,21 @@ struct column {
 	  */
 	double extrema[2];
 
+	/**
+	  * A sketch of the distribution of all numeric fields from which
+	  * quantiles are estimated. It is allocated on the first numeric field
+	  * (so it remains NULL in non-numeric columns) and is of fixed size
+	  * thereafter.
+	  */
+	struct tdigest *sketch;
+
+	/**
+	  * Estimates the count of distinct non-empty values of every type
+	  * (unlike value_set, which saturates). Allocated on the first
+	  * non-empty field.
+	  */
+	struct hll *cardinality;
+
 	/**
 	  * Presence of negative numbers argues against the categorical
 	  * statistical class...unless the value set is very small.
@@ -81,7 +101,7 @@ struct column {
 	/**
 	  * Integers of multiple magnitudes strongly argue against the
 	  * categorical statistical class...
-	  * Bits are set by floorf(log10f(1.0+abs(value)))
+	  * Bit floor(log10(1+|value|)) is set for each value.
 	  */
 	unsigned int integer_magnitudes;
 
@@ -107,9 +127,24 @@ struct column {
 	int excess_values;
 };
 
+/**
+  * init_column_analysis may be called any number of times from any thread;
+  * only the first call does anything. fini_column_analysis is registered
+  * with atexit by that first call.
+  */
 int  init_column_analysis( void );
 void fini_column_analysis( void );
 void analyze_column( struct column *c );
 
+/**
+  * Tally one NUL-terminated field of the <line>th (0-based) line into <c>,
+  * classifying it as a table's fields are unless <as_string>. The column's
+  * value set must have been initialized (with set_init).
+  */
+void column_tally( struct column *c, const char *field, int line, bool as_string );
+unsigned long column_distinct_values( const struct column *c );
+void merge_column( struct column *into, const struct column *from, int line_offset );
+bool column_converged( const struct column *prior, const struct column *c, double tolerance );
+
 #endif
 
@@ -1,13 +1,21 @@
 
 /**
-  * This faithfully implements RFC4180 with one exception:
-  * lines may be termined by any of { CR, LF, CRLF, LFCR }.
+  * This faithfully implements RFC4180 with two exceptions:
+  * 1. lines may be termined by any of { CR, LF, CRLF, LFCR }, and
+  * 2. line terminators may not occur inside quoted fields since lines are
+  *    delimited before they are split (such lines will be aberrant).
+  * Fields are tokenized in place: separators and closing quotes are
+  * overwritten with NULs and escaped ("") quotes are compacted, so no field
+  * content is ever copied out of the line buffer.
   */
 
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdbool.h>
 #include <string.h>
 
+#include "tabular.h"
+
 /**
   * CSV state machine
   */
@@ -17,171 +25,119 @@ enum {
 	CSV_IN_QUOTED_FIELD,
 	CSV_IN_BARE_FIELD,
 	CSV_POSSIBLE_EXIT,
-#ifdef HAVE_ALLOW_WS_TRAILING_QUOTED_FIELD
 	CSV_EXITED,
-#endif
 	CSV_COUNT
 };
 
-struct csv_state_machine {
-
-	int state;
-
-	char *field;
-	int cap; // maximum char content of field
-	int len; // number of chars in field
-
-	char lineterm[4];
-};
-
-static void _accum( struct csv_state_machine *sm, const char *utf8, int L ) {
-	if( ! ( sm->len + L < sm->cap ) ) {
-		void *p = realloc( sm->field, 2 * sm->cap );
-		if( p ) {
-			sm->field = p;
-			sm->cap *= 2;
-		} else {
-			abort();
-		}
-	}
-	strncpy( sm->field + sm->len, utf8, L );
-	sm->len += L;
-}
-
-
-static void _flush( struct csv_state_machine *sm ) {
-	fprintf( stdout, "%s\n", sm->field );
-	memset( sm->field, 0, sm->cap );
-	sm->len = 0;
-}
-
-
-struct csv_state_machine *csv_state_create( int initial_field_capacity ) {
-
-	struct csv_state_machine *sm
-		= calloc( 1, sizeof(struct csv_state_machine) );
-	if( sm ) {
-		sm->field
-			= calloc( initial_field_capacity, sizeof(char) );
-		if( sm->field ) {
-			sm->cap = initial_field_capacity;
-			return sm;
-		}
-		free( sm );
-		sm = NULL;
-	}
-	return sm;
-}
-
-
-/**
-  * Returns positive value when line is complete
-  */
-int csv_state_update( struct csv_state_machine *sm, const char *utf8, int len, char *lineterm ) {
-
 #define QUOTE '"'
 #define COMMA ','
-#define SPACE ' '
 #define ENDSZ '\0'
-#define LF    0x0A
-#define CR    0x0D
-
-	const int C = *utf8;
-
-	switch( sm->state ) {
-
-	case CSV_ENTRY:
-		if( C == QUOTE ) {
-			sm->state = CSV_IN_QUOTED_FIELD;
-		} else
-		if( C == COMMA ) {
-			_flush( sm );            // ...an empty field.
-		} else
-			_accum( sm, utf8, len ); // ...start of non-empty field.
-		break;
-
-	case CSV_IN_QUOTED_FIELD:
-		if( C == QUOTE ) {
-			sm->state = CSV_POSSIBLE_EXIT;
-		} else
-		if( C == ENDSZ ) {
-			goto error; // end-of-string/line inside quote field!
-		} else
-			_accum( sm, utf8, len );
-		break;
-
-	case CSV_IN_BARE_FIELD:
-		if( C == COMMA ) {
-			_flush( sm );
-			sm->state = CSV_ENTRY;
-		} else
-		if( C == ENDSZ ) {
-			_flush( sm );
-		} else
-		if( C == LF || C == CR ) {
-		} else
-			_accum( sm, utf8, len );
-		break;
-
-	case CSV_POSSIBLE_EXIT:
-		if( C == QUOTE ) {
-			_accum( sm, "\"", 1 );
-			// Not an exit. It was an escaped double-quote, so reenter...
-			sm->state = CSV_IN_QUOTED_FIELD;
-		} else
-		if( C == COMMA ) {
-			_flush( sm );
-			sm->state = CSV_ENTRY;
-		} else
-		if( C == ENDSZ ) {
-			_flush( sm );
-#ifdef HAVE_ALLOW_WS_TRAILING_QUOTED_FIELD
-		} else
-		if( C == SPACE ) {
-			_flush( sm );
-			sm->state = CSV_EXITED;
-#endif
-		} else
-			goto error; // end-of-string/line inside quote field!
-		break;
-
-#ifdef HAVE_ALLOW_WS_TRAILING_QUOTED_FIELD
-	/**
-	  * This case permits whitespace after a closing quote.
-	  * This is not specified by RFC4180. In any even, as a
-	  * corner case it should be last in the switch for performance.
-	  */
-	case CSV_EXITED:
-		if( C == COMMA ) {
-			// _flush already happened.
-			sm->state = CSV_ENTRY;
-		} else
-		if( C != SPACE ) {
-			abort(); // error
+
+/**
+  * Splits the NUL-terminated line pc into RFC4180 fields, passing each to
+  * process_field. Returns the number of fields in the line or -1 if the
+  * line is malformed (an unterminated quoted field or content following a
+  * closing quote). Fields beyond pf->column_count are counted but not
+  * processed.
+  */
+int csv_split_line( char *pc, struct format *pf,
+		FIELD_PARSER process_field, void *context ) {
+
+	int state = CSV_ENTRY;
+	int foff = 0;
+	char *token = pc;
+	char *out = NULL; // End of the (compacted) content of a quoted field.
+
+	while( true ) {
+
+		switch( state ) {
+
+		case CSV_ENTRY:
+			if( *pc == QUOTE ) {
+				token = ++pc;
+				out = NULL;
+				state = CSV_IN_QUOTED_FIELD;
+			} else {
+				token = pc;
+				state = CSV_IN_BARE_FIELD;
+			}
+			break;
+
+		case CSV_IN_BARE_FIELD:
+			while( *pc && *pc != COMMA ) pc++;
+			out = pc;
+			state = CSV_EXITED;
+			break;
+
+		case CSV_IN_QUOTED_FIELD:
+			{
+				const char *run = pc;
+				while( *pc && *pc != QUOTE ) pc++;
+				// Once an escaped quote has been seen, content shifts left.
+				if( out ) {
+					memmove( out, run, pc - run );
+					out += pc - run;
+				} else
+					out = pc;
+			}
+			if( *pc == ENDSZ )
+				return -1; // end-of-line inside quoted field!
+			pc++;
+			state = CSV_POSSIBLE_EXIT;
+			break;
+
+		case CSV_POSSIBLE_EXIT:
+			if( *pc == QUOTE ) {
+				// Not an exit. It was an escaped double-quote, so reenter...
+				*out++ = *pc++;
+				state = CSV_IN_QUOTED_FIELD;
+			} else
+			if( *pc == COMMA || *pc == ENDSZ ) {
+				state = CSV_EXITED;
+			} else
+				return -1; // content after closing quote!
+			break;
+
+		case CSV_EXITED:
+			/**
+			  * pc is at the field's separator or the line's end; out is
+			  * at the end of the field's content.
+			  */
+			{
+				const bool EOL = (*pc == ENDSZ);
+				*out = ENDSZ;
+				if( foff < pf->column_count )
+					process_field( token, foff, context );
+				foff++;
+				if( EOL )
+					return foff;
+				pc++;
+				state = CSV_ENTRY;
+			}
+			break;
+
+		default:
+			abort(); // Something's really bloody wrong!
 		}
-		break;
-#endif
-	default:
-		abort(); // Something's really bloody wrong!
 	}
-
-	return 0;
-
-error:
-	abort();
 }
 
 
 #ifdef UNIT_TEST_CSV
+
+static void _print_field( const char *field, int offset, void *context ) {
+	printf( "%d\t[%s]\n", offset, field );
+}
+
 int main( int argc, char *argv[] ) {
-	struct csv_state_machine *sm
-		= csv_state_create( 8 );
-	const char *pc = argv[1];
-	do {
-		csv_state_update( sm, pc, 1, NULL );
-	} while( *pc++ );
-	free( sm );
+	struct format f;
+	memset( &f, 0, sizeof(f) );
+	f.column_count = 1024;
+	for(int i = 1; i < argc; i++ ) {
+		char *line = strdup( argv[i] );
+		printf( "%d field(s)\n", csv_split_line( line, &f, _print_field, NULL ) );
+		free( line );
+	}
 	return EXIT_SUCCESS;
 }
 #endif
-
@@ -10,6 +10,10 @@
 int MAX_CATEGORY_CARDINALITY       = 32;
 int MAX_ABSOLUTE_CATEGORICAL_VALUE = 16;
 int MAXLEN_CATEGORY_LABEL          = 63;
+int MAX_RECORD_KEYS                = 256;
+
+int    QUANTILE_COUNT = 5;
+double QUANTILES[ MAX_QUANTILES ] = { 0.05, 0.25, 0.5, 0.75, 0.95 };
 
 void read_environment_overrides() {
 	if( getenv("MAX_CATEGORY_CARDINALITY") )
@@ -21,5 +25,23 @@ void read_environment_overrides() {
 	if( getenv("MAX_ABSOLUTE_CATEGORICAL_VALUE") )
 		MAX_ABSOLUTE_CATEGORICAL_VALUE
 			= atoi(getenv("MAX_ABSOLUTE_CATEGORICAL_VALUE"));
+	if( getenv("MAX_RECORD_KEYS") )
+		MAX_RECORD_KEYS
+			= atoi(getenv("MAX_RECORD_KEYS"));
+	if( getenv("QUANTILES") ) {
+		const char *pc = getenv("QUANTILES");
+		char *end;
+		QUANTILE_COUNT = 0;
+		while( QUANTILE_COUNT < MAX_QUANTILES ) {
+			const double Q = strtod( pc, &end );
+			if( end == pc )
+				break;
+			if( 0 <= Q && Q <= 1 )
+				QUANTILES[ QUANTILE_COUNT++ ] = Q;
+			pc = end;
+			while( *pc == ',' || *pc == ' ' )
+				pc++;
+		}
+	}
 }
 
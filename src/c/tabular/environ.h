@@ -13,6 +13,19 @@ extern int MAX_ABSOLUTE_CATEGORICAL_VALUE;
   */
 extern int MAXLEN_CATEGORY_LABEL;
 
+/**
+  * The most distinct keys of JSON Lines records analyzed (see jsonl.h).
+  */
+extern int MAX_RECORD_KEYS;
+
+/**
+  * The quantiles reported for numeric columns, overridable by a comma-
+  * separated list of probabilities, e.g. QUANTILES="0.05,0.5,0.95".
+  */
+#define MAX_QUANTILES (16)
+extern int    QUANTILE_COUNT;
+extern double QUANTILES[ MAX_QUANTILES ];
+
 void read_environment_overrides( void );
 
 #endif
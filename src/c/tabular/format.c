@@ -34,8 +34,8 @@
   * 1. Whitespace separation, whether by TABs or space clusters, always take
   *    priority since whitspace is never used--at least, I've never seen
   *    whitespace used--as an internal separator of subfields.
-  * 2. Space clusters SHOULD never co-occur with TABs, so the question of
-  *    precedence of TABs versus space clusters should never arise.
+  * 2. Space clusters SHOULD never co-occur with TABs, but when both are
+  *    consistent TABs take precedence (fields of a TSV may contain spaces).
   * 3. Assuming the first field (often a row identifier) rarely contains
   *    subfields then the first separator on the line is likely the primary
   *    field separator when multiple candidate graphical separators exist.
@@ -128,16 +128,26 @@ static int _id_qcq( const char *line, const int N, unsigned *count ) {
 	return 0;
 }
 
-#define P_QCQ           (129)
-#define SEPARATOR_COUNT (130)
-
-#else
+#endif
 
-#define SEPARATOR_COUNT (129)
+/**
+  * Pseudo-characters for multi-character (or context-sensitive) separator
+  * candidates follow the 128 ASCII characters in the histogram.
+  * P_SPC_GROUP counts / +/ clusters between non-space content;
+  * P_CSV_COMMA counts commas outside of (RFC4180) double-quoted fields.
+  */
+#define P_SPC_GROUP     (128)
+#define P_CSV_COMMA     (129)
 
+#ifdef HAVE_QUOTE_COMMA_QUOTE
+#define P_QCQ           (130)
+#define SEPARATOR_COUNT (131)
+#else
+#define SEPARATOR_COUNT (130)
 #endif
 
-#define P_SPC_GROUP     (128)
+extern int csv_split_line( char *pc, struct format *pf,
+		FIELD_PARSER process_field, void *context );
 
 /**
   * This is currently ASCII-only.
@@ -151,6 +161,8 @@ int _count_candidate_separators( const char *line, const int len, unsigned *coun
 
 	const char *pc = line;
 	int last = 0;
+	bool content = false; // ...true after the first non-space character.
+	bool quoted = false;
 
 #ifdef HAVE_QUOTE_COMMA_QUOTE
 	if( _id_qcq( line, len, count + P_QCQ ) )
@@ -169,14 +181,26 @@ int _count_candidate_separators( const char *line, const int len, unsigned *coun
 
 		// Transitions from space to non-space signal ends of / +/ patterns.
 		// No need to use the regular expression API for these; it is simple
-		// to count transitions.
+		// to count transitions. Leading and trailing spaces separate nothing
+		// (and right-aligned columns produce them irregularly), so only
+		// clusters preceded by content are counted.
+
+		if( C != 0x20 ) {
+			if( last == 0x20 && content )
+				count[ P_SPC_GROUP ] += 1;
+			content = true;
+		}
 
-		if( last == 0x20 && C != 0x20 ) count[ P_SPC_GROUP ] += 1;
+		// Escaped quotes ("") toggle twice, so this tracks RFC4180 quoting.
+
+		if( C == '"' )
+			quoted = ! quoted;
+		else
+		if( C == ',' && ! quoted )
+			count[ P_CSV_COMMA ] += 1;
 
 		last = C;
 	}
-	if( last == 0x20 )
-		count[ P_SPC_GROUP ] += 1;
 
 	return 0;
 }
@@ -223,19 +247,40 @@ static int _split_line_simple_sep( char *pc, struct format *pf,
 }
 
 
-static int _split_line_coalesce_ws( char *line, struct format *pf, 
-		FIELD_PARSER process_field, void *arg ) {
-	fputs( "TODO: unimplemented: parsing of coalescable whitespace.\n", stderr ); abort();
-	return -1;
-}
+/**
+  * Fields are separated by clusters of one or more spaces. Leading and
+  * trailing spaces are ignored (consistent with _count_candidate_separators)
+  * so right-aligned columns split as expected.
+  */
+static int _split_line_coalesce_ws( char *pc, struct format *pf,
+		FIELD_PARSER process_field, void *context ) {
+
+	int foff = 0;
+	const char *token;
+
+	while( *pc == ' ' ) pc++;
+
+	while( *pc ) {
 
-/*
-static int _split_line_csv( char *line, struct format *pf, 
-		FIELD_PARSER process_field, void *arg ) {
-	fputs( "TODO: unimplemented: parsing of RFC4180 CSV files.\n", stderr ); abort();
-	return -1;
+		token = pc;
+
+		while( *pc && (*pc != ' ') ) pc++;
+
+		/**
+		  * NUL terminate the field and skip the rest of the cluster.
+		  */
+		if( *pc ) {
+			*pc++ = '\0';
+			while( *pc == ' ' ) pc++;
+		}
+
+		if( foff < pf->column_count )
+			process_field( token, foff, context );
+
+		foff++;
+	}
+	return foff;
 }
-*/
 
 /**
   * Localizes the decision making re: what constitutes an admissable
@@ -274,6 +319,7 @@ int _format_infer( FILE *fp, int delim, int nlines, struct format *table ) {
 	unsigned *charcount
 		= reference + SEPARATOR_COUNT;
 	unsigned candidate_count = 0; // ...only on 1st and possibly final iter.
+	bool quoted = false; // ...true if any sampled data line contains '"'.
 
 	// Just verify caller has initialized.
 
@@ -311,6 +357,12 @@ int _format_infer( FILE *fp, int delim, int nlines, struct format *table ) {
 		memset( charcount, 0, SEPARATOR_COUNT*sizeof(unsigned) );
 		_count_candidate_separators( LINE, llen, charcount );
 
+		/**
+		  * Until a quote is seen P_CSV_COMMA merely duplicates the comma
+		  * count, so it is not counted as a distinct candidate.
+		  */
+		quoted = quoted || charcount['"'] > 0;
+
 		/**
 		  * Following is the core algorithm.
 		  */
@@ -330,9 +382,10 @@ int _format_infer( FILE *fp, int delim, int nlines, struct format *table ) {
 			candidate_count = 0;
 			while( i-- > 0 ) {
 				if( reference[i] > 0 /* Is sep_i still a candidate? */ ) {
-					if( charcount[i] == reference[i] )
-						candidate_count += 1;
-					else
+					if( charcount[i] == reference[i] ) {
+						if( i != P_CSV_COMMA || quoted )
+							candidate_count += 1;
+					} else
 						reference[i] = 0; // sep_i is no longer a candidate.
 				}
 			}
@@ -341,6 +394,9 @@ int _format_infer( FILE *fp, int delim, int nlines, struct format *table ) {
 		}
 	}
 
+	if( ! quoted )
+		reference[ P_CSV_COMMA ] = 0;
+
 	/**
 	  * If exactly 1 candidate remains, it wins if it's admissable.
 	  * If multiple candidates remain, choose the winner based on
@@ -353,6 +409,20 @@ int _format_infer( FILE *fp, int delim, int nlines, struct format *table ) {
 		// Find the non-zero count, and...
 		while( c-- > 0 ) { if( reference[c] > 0 ) break; }
 		// ...if it's an admissable separator, make it official!
+		if( c == P_CSV_COMMA ) {
+			table->column_separator[0] = ',';
+			table->column_count = reference[ P_CSV_COMMA ] + 1;
+			table->split_line = csv_split_line;
+			table->quoted = true;
+			status = 0;
+		} else
+		if( c == P_SPC_GROUP ) {
+			strcpy( table->column_separator, " +" );
+			table->column_count = reference[ P_SPC_GROUP ] + 1;
+			table->split_line = _split_line_coalesce_ws;
+			table->column_separator_is_regex = true;
+			status = 0;
+		} else
 		if( c > 0 && _is_admissable_separator(c) ) {
 			table->column_separator[0] = c;
 			table->column_count = reference[c] + 1;
@@ -363,8 +433,16 @@ int _format_infer( FILE *fp, int delim, int nlines, struct format *table ) {
 	} else
 	if( candidate_count > 1 ) {
 
-		// Whitespace separation takes priority.
+		// Whitespace separation takes priority, TABs first since fields
+		// of a TSV may contain spaces but space-aligned tables rarely
+		// contain TABs.
 
+		if( reference[ '\t' ] > 0 ) {
+			table->column_separator[0] = '\t';
+			table->column_count = reference[ '\t' ] + 1;
+			table->split_line = _split_line_simple_sep;
+			status = 0;
+		} else
 		if( reference[ P_SPC_GROUP ] > 0 ) {
 			strcpy( table->column_separator, " +" );
 			table->column_count = reference[ P_SPC_GROUP ] + 1;
@@ -372,10 +450,13 @@ int _format_infer( FILE *fp, int delim, int nlines, struct format *table ) {
 			table->column_separator_is_regex = true;
 			status = 0;
 		} else
-		if( reference[ '\t' ] > 0 ) {
-			table->column_separator[0] = '\t';
-			table->column_count = reference[ '\t' ] + 1;
-			table->split_line = _split_line_simple_sep;
+		if( reference[ P_CSV_COMMA ] > 0 ) {
+			// Quoted fields were seen, and commas outside of them
+			// consistently separate fields.
+			table->column_separator[0] = ',';
+			table->column_count = reference[ P_CSV_COMMA ] + 1;
+			table->split_line = csv_split_line;
+			table->quoted = true;
 			status = 0;
 
 		} else { // ...it's a non-whitespace pattern.
@@ -421,6 +502,39 @@ int _format_infer( FILE *fp, int delim, int nlines, struct format *table ) {
 }
 
 
+int tabular_resolve_format( struct format *f ) {
+
+	const char *SEP
+		= f->column_separator;
+
+	if( f->column_count == 0 )
+		return -1;
+
+	if( f->column_separator_is_regex ) {
+		if( strcmp( SEP, " +" ) || f->quoted )
+			return -1;
+		f->split_line = _split_line_coalesce_ws;
+	} else
+	if( f->quoted ) {
+		if( strcmp( SEP, "," ) )
+			return -1;
+		f->split_line = csv_split_line;
+	} else {
+		if( SEP[0] == 0 || SEP[1] != 0 || ! _is_admissable_separator( SEP[0] ) )
+			return -1;
+		f->split_line = _split_line_simple_sep;
+	}
+
+	if( strcmp( f->line_terminator, "\n"   ) && strcmp( f->line_terminator, "\r"   )
+	 && strcmp( f->line_terminator, "\r\n" ) && strcmp( f->line_terminator, "\n\r" ) )
+		return -1;
+
+	f->metadata_line_prefix_len = strlen( f->metadata_line_prefix );
+	f->data_lines_sampled = 0;
+	return 0;
+}
+
+
 #ifdef UNIT_TEST_FORMAT
 
 #include <err.h>
@@ -0,0 +1,94 @@
+
+/**
+  * The leading HLL_PRECISION bits of each hash select a register, which
+  * retains the maximum over its hashes of the position of the first 1 bit
+  * in the remaining bits. The estimator includes the original paper's
+  * small-range (linear counting) and large-range corrections, the latter
+  * needed since hashes are only 32 bits wide.
+  */
+
+#include <stdlib.h>
+#include <stdint.h>
+#include <math.h>
+
+#include "hll.h"
+
+struct hll *hll_create( void ) {
+	return calloc( 1, sizeof(struct hll) );
+}
+
+
+void hll_destroy( struct hll *h ) {
+	free( h );
+}
+
+
+void hll_add( struct hll *h, uint32_t hash ) {
+	const uint32_t W
+		= hash << HLL_PRECISION;
+	const uint8_t RANK
+		= W ? __builtin_clz( W ) + 1 : 32 - HLL_PRECISION + 1;
+	uint8_t *r
+		= h->reg + ( hash >> ( 32 - HLL_PRECISION ) );
+	if( *r < RANK )
+		*r = RANK;
+}
+
+
+void hll_merge( struct hll *into, const struct hll *from ) {
+	for(unsigned i = 0; i < HLL_REGISTERS; i++ ) {
+		if( into->reg[i] < from->reg[i] )
+			into->reg[i] = from->reg[i];
+	}
+}
+
+
+double hll_estimate( const struct hll *h ) {
+
+	const double M = HLL_REGISTERS;
+	const double TWO_32 = 4294967296.0;
+	double sum = 0, estimate;
+	int zeros = 0;
+
+	for(unsigned i = 0; i < HLL_REGISTERS; i++ ) {
+		sum += ldexp( 1.0, -h->reg[i] );
+		if( h->reg[i] == 0 )
+			zeros++;
+	}
+
+	estimate = 0.7213 / ( 1 + 1.079 / M ) * M * M / sum;
+
+	if( estimate <= 2.5 * M ) {
+		if( zeros > 0 )
+			estimate = M * log( M / zeros );
+	} else
+	if( estimate > TWO_32 / 30 )
+		estimate = -TWO_32 * log( 1 - estimate / TWO_32 );
+
+	return estimate;
+}
+
+
+#ifdef UNIT_TEST_HLL
+
+#include <stdio.h>
+#include <string.h>
+#include "murmur3.h"
+
+/**
+  * Reads lines from stdin and prints the estimated number of distinct lines.
+  */
+int main( int argc, char *argv[] ) {
+	struct hll *h = hll_create();
+	char *line = NULL;
+	size_t n = 0;
+	ssize_t len;
+	while( ( len = getline( &line, &n, stdin ) ) > 0 )
+		hll_add( h, murmur3_32( line, len, 0 ) );
+	printf( "%.0f\n", hll_estimate( h ) );
+	free( line );
+	hll_destroy( h );
+	return EXIT_SUCCESS;
+}
+#endif
+
@@ -0,0 +1,48 @@
+
+#ifndef _hll_h_
+#define _hll_h_
+
+/**
+  * A HyperLogLog (Flajolet et al.) estimating the number of distinct
+  * values in a stream in a fixed amount of memory. The standard error of
+  * the estimate is about 1.04/sqrt(HLL_REGISTERS), i.e. 1.6% by default.
+  * HyperLogLogs of disjoint streams (fed with the same seed) can be merged
+  * into that of the union.
+  */
+
+#include <stdint.h>
+
+#ifndef HLL_PRECISION
+#define HLL_PRECISION (12)
+#endif
+#define HLL_REGISTERS (1U << HLL_PRECISION)
+
+/**
+  * HyperLogLogs are only mergeable if fed hashes computed with one seed.
+  */
+#define HLL_SEED (0)
+
+/**
+  * NONE OF THIS STRUCT SHOULD BE USED DIRECTLY.
+  */
+struct hll {
+	uint8_t reg[ HLL_REGISTERS ];
+};
+
+struct hll *hll_create( void );
+void   hll_destroy( struct hll * );
+
+/**
+  * Add a value by its 32-bit hash.
+  */
+void   hll_add( struct hll *, uint32_t hash );
+
+/**
+  * Add all of <from> to <into>.
+  */
+void   hll_merge( struct hll *into, const struct hll *from );
+
+double hll_estimate( const struct hll * );
+
+#endif
+
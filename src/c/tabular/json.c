@@ -10,6 +10,8 @@
 #include "tabular.h"
 #include "strset.h"
 #include "column.h"
+#include "tdigest.h"
+#include "environ.h"
 
 #ifndef EXHAUSTIVE_OUTPUT
 #include "murmur3.h"
@@ -17,19 +19,13 @@
 
 #define MAGIC_TOO_MANY_LABELS (0xFFFFFFFF)
 
-static const char *STAT_CLASS_NAME[] = {
-	"unknown",
-	"categorical",
-	"quantitative",
-	"ordinal"
-};
-
 /**
   * First level items:
   * 1. offending_byte: the ordinal of binary byte, or 0 if file is text.
   * 2. transition_histogram: 3x3 matrix, if file is entirely text
   * 3. character_histogram: 6 character class counts if file entirely text.
-  * 4. table: if file contains a table/matrix
+  * 4. sampled_fraction: fraction of the file's bytes scanned (1 unless sampled)
+  * 5. table: if file contains a table/matrix
 */
 
 static inline const char *_json_bool_value( bool b ) {
@@ -73,6 +69,27 @@ static void _json_encode_ascii( const char *pc, FILE *fp ) {
 }
 
 
+/**
+  * Emit the configured quantiles of a numeric column or null.
+  */
+static int _json_quantiles( const struct column *c, FILE *fp ) {
+
+	if( c->sketch == NULL || QUANTILE_COUNT == 0 )
+		return fputs( "\"quantiles\":null", fp ) < 0 ? -1 : 0;
+
+	if( fputs( "\"quantiles\":{", fp ) < 0 )
+		return -1;
+	for(int i = 0; i < QUANTILE_COUNT; i++ ) {
+		if( fprintf( fp, "\"%g\":%.3e%s",
+				QUANTILES[i],
+				tdigest_quantile( c->sketch, QUANTILES[i] ),
+				i + 1 < QUANTILE_COUNT ? "," : "" ) < 0 )
+			return -1;
+	}
+	return fputc( '}', fp ) < 0 ? -1 : 0;
+}
+
+
 #ifdef EXHAUSTIVE_OUTPUT
 
 /**
@@ -95,7 +112,7 @@ int tabular_as_json( const struct table_description *a, FILE *fp ) {
 		if( fprintf( fp,
 			"\"offending_byte\":%ld,"
 			"\"character_histogram\":null,"
-			"\"transition_histogram\":null,",
+			"\"transition_histogram\":null",
 			a->ordinal ) < 0 )
 			return -1;
 
@@ -133,6 +150,9 @@ int tabular_as_json( const struct table_description *a, FILE *fp ) {
 			return -1;
 	}
 
+	if( fprintf( fp, ",\"sampled_fraction\":%.6f", a->sampled_fraction ) < 0 )
+		return -1;
+
 	if( a->column != NULL ) {
 
 		if( fputs( ",\"table\":{\"metadata_prefix\":\"", fp ) < 0 )
@@ -147,8 +167,15 @@ int tabular_as_json( const struct table_description *a, FILE *fp ) {
 		if( fputs( "\",", fp ) < 0 )
 			return -1;
 
+		if( fputs( "\"line_terminator\":\"", fp ) < 0 )
+			return -1;
+		_json_encode_ascii( a->table.line_terminator, fp );
+		if( fputs( "\",", fp ) < 0 )
+			return -1;
+
 		if( fprintf( fp,
 			"\"separator_is_regex\":%s,"
+			"\"separator_is_quoted\":%s,"
 			"\"column_count\":%d,"
 			"\"empty_lines\":%d,"
 			"\"meta_lines\":%d,"
@@ -156,6 +183,7 @@ int tabular_as_json( const struct table_description *a, FILE *fp ) {
 			"\"aberrant_lines\":%d,"
 			"\"columns\":[",
 			_json_bool_value( a->table.column_separator_is_regex ),
+			_json_bool_value( a->table.quoted ),
 			NC,
 			a->rows.empty,
 			a->rows.meta,
@@ -178,19 +206,28 @@ int tabular_as_json( const struct table_description *a, FILE *fp ) {
 				"\"inferred_class\":\"%s\","
 				"\"votes\":{\"empty\":%d,\"integer\":%d,\"float\":%d,\"string\":%d},"
 				"\"stats\":{\"mean\":%.3e,\"stddev\":%.3e},"
-				"\"extrema\":{\"min\":%f,\"max\":%f},"
-				"\"max_field_length\":%d,"
-				"\"long_field_count\":%d,"
-				"\"labels\":[",
+				"\"extrema\":{\"min\":%f,\"max\":%f},",
 				STAT_CLASS_NAME[ c->stat_class ],
 				c->type_vote[FTY_EMPTY],
 				c->type_vote[FTY_INTEGER],
 				c->type_vote[FTY_FLOAT],
 				c->type_vote[FTY_STRING],
 				c->statistics[0], c->statistics[1],
-				c->extrema[0],    c->extrema[1],
+				c->extrema[0],    c->extrema[1]
+			   	) < 0 )
+				return -1;
+
+			if( _json_quantiles( c, fp ) )
+				return -1;
+
+			if( fprintf( fp, ","
+				"\"max_field_length\":%d,"
+				"\"long_field_count\":%d,"
+				"\"distinct_values\":%lu,"
+				"\"labels\":[",
 				c->max_field_len,
-				c->long_field_count
+				c->long_field_count,
+				column_distinct_values( c )
 			   	) < 0 )
 				return -1;
 
@@ -288,6 +325,7 @@ static const char *_dominant_type_name( const int vote[] ) {
   * metadata_prefix		string   typically "#"
   * non_utf8            integer  ordinal (1-based) of first non-UTF8 byte
   *                              0 if file is entirely UTF8
+  * sampled_fraction    float    fraction of the file's bytes scanned
   *
   * lines_data			integer
   * lines_empty			integer
@@ -298,12 +336,14 @@ static const char *_dominant_type_name( const int vote[] ) {
   *
   * columns/./type		one of {'string','float','int','empty','mixed'}
   * columns/./stat		one of {'unknown','categorical','quantitative','ordinal'}
+  * columns/./distinct_values	integer, estimated if the labels overflowed
   *
   * EITHER
   * columns/./label_set_hash	string
   * ...OR...
   * columns/./mean				float
   * columns/./stddev			float
+  * columns/./quantiles/<p>		float, for each configured quantile p
   */
 int tabular_as_json( const struct table_description *a, FILE *fp ) {
 
@@ -317,8 +357,10 @@ int tabular_as_json( const struct table_description *a, FILE *fp ) {
 	  */
 
 	if( fprintf( fp,
-		"\"non_utf8\":%d",
-		a->status == E_UTF8_PREFIX || a->status == E_UTF8_SUFFIX ) < 0 )
+		"\"non_utf8\":%d,"
+		"\"sampled_fraction\":%.6f",
+		a->status == E_UTF8_PREFIX || a->status == E_UTF8_SUFFIX,
+		a->sampled_fraction ) < 0 )
 		return -1;
 
 	if( a->column != NULL ) {
@@ -353,9 +395,11 @@ int tabular_as_json( const struct table_description *a, FILE *fp ) {
 
 			if( fprintf( fp, "{" /* opening column summary */
 				"\"type\":\"%s\","
-				"\"class\":\"%s\"",
+				"\"class\":\"%s\","
+				"\"distinct_values\":%lu",
 				_dominant_type_name( c->type_vote ),
-				STAT_CLASS_NAME[ c->stat_class ] ) < 0 )
+				STAT_CLASS_NAME[ c->stat_class ],
+				column_distinct_values( c ) ) < 0 )
 				return -1;
 
 			/**
@@ -379,9 +423,11 @@ int tabular_as_json( const struct table_description *a, FILE *fp ) {
 			} else
 			if( c->stat_class == STC_QUA ) {
 				if( fprintf( fp,
-					"\"stats\":{\"mean\":%.3e,\"stddev\":%.3e}",
+					"\"stats\":{\"mean\":%.3e,\"stddev\":%.3e},",
 					c->statistics[0], c->statistics[1] ) < 0 )
 					return -1;
+				if( _json_quantiles( c, fp ) )
+					return -1;
 			}
 
 			fputc( '}' /* closing column summary */ , fp );
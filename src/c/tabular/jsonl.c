@@ -0,0 +1,860 @@
+
+/**
+  * A streaming analysis of JSON Lines. Input is read in large blocks and
+  * split into lines with memchr; each line is parsed (RFC8259) in place.
+  * Strings are unescaped in place, and numbers are copied (so that they can
+  * be NUL-terminated) to a scratch buffer. A line's values are held pending
+  * until the whole line has parsed so that a malformed line contributes
+  * nothing but its count to the analysis. Every value is then tallied into
+  * its key's struct column just as a table's fields are (see column_tally),
+  * so records' keys are characterized exactly as tables' columns are.
+  *
+  * Records written by one program usually present the same keys in the
+  * same order, so the key at each position of a record is first guessed to
+  * be the one at that position in the preceding record, and only hashed if
+  * the guess is wrong.
+  *
+  * Values are tallied according to their JSON type:
+  * 1. numbers are classified as integer or float as a table's fields are,
+  * 2. strings, true and false are strings (whatever they resemble),
+  * 3. null is empty, and
+  * 4. arrays and objects nested deeper than JSONL_MAX_DEPTH are strings
+  *    of their raw JSON text.
+  */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include <string.h>
+#include <errno.h>
+#include <math.h>
+#include <assert.h>
+
+#include "tabular.h"
+#include "strset.h"
+#include "murmur3.h"
+#include "column.h"
+#include "tdigest.h"
+#include "hll.h"
+#include "arena.h"
+#include "environ.h"
+#include "jsonl.h"
+
+/**
+  * Objects nested at most this deep have their keys flattened into the
+  * record's keys.
+  */
+#ifndef JSONL_MAX_DEPTH
+#define JSONL_MAX_DEPTH (4)
+#endif
+
+#ifndef JSONL_BLOCK_SIZE
+#define JSONL_BLOCK_SIZE (256*1024)
+#endif
+
+#define KEY_HASH_SEED (0)
+
+struct pending {
+	/**
+	  * The key's index or, if the key has not been seen before, -1 and the
+	  * offset of a copy of its name in scratch.
+	  */
+	int key;
+	unsigned key_off, key_len, hash;
+	/**
+	  * The value, or NULL if it is in scratch at value_off.
+	  */
+	const char *value;
+	unsigned value_off;
+	bool as_string;
+};
+
+struct parser {
+
+	struct record_description *d;
+
+	char *pc;
+	const char *end;
+
+	/**
+	  * The dotted key of the object being parsed.
+	  */
+	char *path;
+	unsigned path_cap;
+
+	char *scratch;
+	unsigned scratch_len, scratch_cap;
+
+	struct pending *pending;
+	int npending, pending_cap;
+
+	/**
+	  * Index of the key at each position of the preceding record, or -1.
+	  */
+	int *predict;
+	int predict_cap;
+
+	bool oom;
+};
+
+
+/***************************************************************************
+  * Key table
+  */
+
+static int _lookup( const struct record_description *d, const char *name, unsigned len, unsigned hash ) {
+	if( d->index ) {
+		unsigned slot = hash & d->mask;
+		int i;
+		while( ( i = d->index[ slot ] ) >= 0 ) {
+			const struct record_key *k = d->key + i;
+			if( k->hash == hash && k->len == len && memcmp( k->name, name, len ) == 0 )
+				return i;
+			slot = ( slot + 1 ) & d->mask;
+		}
+	}
+	return -1;
+}
+
+
+static int _reindex( struct record_description *d, unsigned size ) {
+	int *index = malloc( size*sizeof(int) );
+	if( index == NULL )
+		return -1;
+	memset( index, 0xFF, size*sizeof(int) ); // ...all -1.
+	free( d->index );
+	d->index = index;
+	d->mask  = size - 1;
+	for(int i = 0; i < d->key_count; i++ ) {
+		unsigned slot = d->key[i].hash & d->mask;
+		while( index[ slot ] >= 0 )
+			slot = ( slot + 1 ) & d->mask;
+		index[ slot ] = i;
+	}
+	return 0;
+}
+
+
+/**
+  * Returns the index of a new key, -1 if MAX_RECORD_KEYS would be exceeded
+  * or -2 if memory is exhausted.
+  */
+static int _add_key( struct record_description *d, const char *name, unsigned len, unsigned hash ) {
+
+	const int I = d->key_count;
+	struct column *c;
+
+	if( I >= MAX_RECORD_KEYS )
+		return -1;
+
+	// Key and column arrays grow by doubling, so their capacity is the
+	// smallest power of 2 (but at least 8) not less than key_count.
+	if( I >= 8 && ( I & ( I - 1 ) ) == 0 ) {
+		struct record_key *k = realloc( d->key, 2*I*sizeof(struct record_key) );
+		if( k == NULL )
+			return -2;
+		d->key = k;
+		c = realloc( d->column, 2*I*sizeof(struct column) );
+		if( c == NULL )
+			return -2;
+		d->column = c;
+	} else
+	if( I == 0 ) {
+		d->key    = calloc( 8, sizeof(struct record_key) );
+		d->column = calloc( 8, sizeof(struct column) );
+		if( d->key == NULL || d->column == NULL )
+			return -2;
+	}
+	if( 2*(unsigned)( I + 1 ) > ( d->index ? d->mask + 1 : 0 ) ) {
+		if( _reindex( d, d->index ? 2*( d->mask + 1 ) : 32 ) )
+			return -2;
+	}
+
+	d->key[I].name = arena_strndup( d->arena, name, len );
+	if( d->key[I].name == NULL )
+		return -2;
+	d->key[I].len  = len;
+	d->key[I].hash = hash;
+	d->key[I].present = 0;
+	d->key[I].last_record = 0;
+
+	c = d->column + I;
+	memset( c, 0, sizeof(struct column) );
+	if( set_init( & c->value_set,
+		MAX_CATEGORY_CARDINALITY,
+		true, /* duplicate strings */
+		murmur3_32,
+		I ) ) // ...seeded as in _init_analysis.
+		return -2;
+	set_use_arena( & c->value_set, d->arena );
+
+	{
+		unsigned slot = hash & d->mask;
+		while( d->index[ slot ] >= 0 )
+			slot = ( slot + 1 ) & d->mask;
+		d->index[ slot ] = I;
+	}
+	d->key_count = I + 1;
+	return I;
+}
+
+
+/***************************************************************************
+  * Parser
+  */
+
+static inline void _skip_ws( struct parser *p ) {
+	while( p->pc < p->end
+		&& ( *p->pc == ' ' || *p->pc == '\t' || *p->pc == '\r' || *p->pc == '\n' ) )
+		p->pc++;
+}
+
+
+/**
+  * Returns the offset in scratch of <len> reserved bytes.
+  */
+static unsigned _reserve( struct parser *p, unsigned len ) {
+	const unsigned OFF = p->scratch_len;
+	if( OFF + len > p->scratch_cap ) {
+		unsigned cap = p->scratch_cap ? 2*p->scratch_cap : 4096;
+		char *s;
+		while( cap < OFF + len )
+			cap *= 2;
+		s = realloc( p->scratch, cap );
+		if( s == NULL ) {
+			p->oom = true;
+			return 0;
+		}
+		p->scratch = s;
+		p->scratch_cap = cap;
+	}
+	p->scratch_len += len;
+	return OFF;
+}
+
+
+static unsigned _stash( struct parser *p, const char *s, unsigned len ) {
+	const unsigned OFF = _reserve( p, len + 1 );
+	if( ! p->oom ) {
+		memcpy( p->scratch + OFF, s, len );
+		p->scratch[ OFF + len ] = '\0';
+	}
+	return OFF;
+}
+
+
+static inline int _hex( int c ) {
+	if( '0' <= c && c <= '9' ) return c - '0';
+	if( 'a' <= c && c <= 'f' ) return c - 'a' + 10;
+	if( 'A' <= c && c <= 'F' ) return c - 'A' + 10;
+	return -1;
+}
+
+
+static long _hex4( const char *pc, const char *end ) {
+	long u = 0;
+	if( end - pc < 4 )
+		return -1;
+	for(int i = 0; i < 4; i++ ) {
+		const int H = _hex( pc[i] );
+		if( H < 0 )
+			return -1;
+		u = ( u << 4 ) | H;
+	}
+	return u;
+}
+
+
+/**
+  * With p->pc just beyond an opening quote, unescape the string in place,
+  * NUL-terminate it and leave p->pc beyond the closing quote. Returns the
+  * string's length or -1 if it is malformed. (An escaped NUL truncates
+  * values but not keys.)
+  */
+static int _string( struct parser *p, char **start ) {
+
+	char *out = p->pc;
+	*start = out;
+
+	while( true ) {
+		const char *run = p->pc;
+		while( p->pc < p->end
+			&& *p->pc != '"' && *p->pc != '\\' && (unsigned char)*p->pc >= 0x20 )
+			p->pc++;
+		if( out != run )
+			memmove( out, run, p->pc - run );
+		out += p->pc - run;
+		if( p->pc == p->end || (unsigned char)*p->pc < 0x20 )
+			return -1;
+		if( *p->pc == '"' ) {
+			*out = '\0';
+			p->pc++;
+			return out - *start;
+		}
+		// ...an escape.
+		if( ++p->pc == p->end )
+			return -1;
+		switch( *p->pc++ ) {
+		case '"':  *out++ = '"';  break;
+		case '\\': *out++ = '\\'; break;
+		case '/':  *out++ = '/';  break;
+		case 'b':  *out++ = '\b'; break;
+		case 'f':  *out++ = '\f'; break;
+		case 'n':  *out++ = '\n'; break;
+		case 'r':  *out++ = '\r'; break;
+		case 't':  *out++ = '\t'; break;
+		case 'u':
+			{
+				long u = _hex4( p->pc, p->end );
+				if( u < 0 )
+					return -1;
+				p->pc += 4;
+				if( 0xD800 <= u && u < 0xDC00 ) {
+					long l;
+					if( p->end - p->pc < 6 || p->pc[0] != '\\' || p->pc[1] != 'u' )
+						return -1;
+					l = _hex4( p->pc + 2, p->end );
+					if( l < 0xDC00 || l >= 0xE000 )
+						return -1;
+					p->pc += 6;
+					u = 0x10000 + ( ( u - 0xD800 ) << 10 ) + ( l - 0xDC00 );
+				} else
+				if( 0xDC00 <= u && u < 0xE000 )
+					return -1; // ...an unpaired low surrogate.
+				// The UTF-8 encoding is never longer than the escape.
+				if( u < 0x80 ) {
+					*out++ = u;
+				} else
+				if( u < 0x800 ) {
+					*out++ = 0xC0 | ( u >> 6 );
+					*out++ = 0x80 | ( u & 0x3F );
+				} else
+				if( u < 0x10000 ) {
+					*out++ = 0xE0 | ( u >> 12 );
+					*out++ = 0x80 | ( ( u >> 6 ) & 0x3F );
+					*out++ = 0x80 | ( u & 0x3F );
+				} else {
+					*out++ = 0xF0 | ( u >> 18 );
+					*out++ = 0x80 | ( ( u >> 12 ) & 0x3F );
+					*out++ = 0x80 | ( ( u >> 6 ) & 0x3F );
+					*out++ = 0x80 | ( u & 0x3F );
+				}
+			}
+			break;
+		default:
+			return -1;
+		}
+	}
+}
+
+
+static inline bool _digits( struct parser *p ) {
+	const char *start = p->pc;
+	while( p->pc < p->end && '0' <= *p->pc && *p->pc <= '9' )
+		p->pc++;
+	return p->pc > start;
+}
+
+
+/**
+  * Returns false if no RFC8259 number is at p->pc.
+  */
+static bool _number( struct parser *p ) {
+	if( p->pc < p->end && *p->pc == '-' )
+		p->pc++;
+	if( p->pc < p->end && *p->pc == '0' )
+		p->pc++;
+	else
+	if( ! _digits( p ) )
+		return false;
+	if( p->pc < p->end && *p->pc == '.' ) {
+		p->pc++;
+		if( ! _digits( p ) )
+			return false;
+	}
+	if( p->pc < p->end && ( *p->pc == 'e' || *p->pc == 'E' ) ) {
+		p->pc++;
+		if( p->pc < p->end && ( *p->pc == '+' || *p->pc == '-' ) )
+			p->pc++;
+		if( ! _digits( p ) )
+			return false;
+	}
+	return true;
+}
+
+
+static bool _literal( struct parser *p, const char *lit, unsigned len ) {
+	if( (unsigned)( p->end - p->pc ) < len || memcmp( p->pc, lit, len ) )
+		return false;
+	p->pc += len;
+	return true;
+}
+
+
+/**
+  * Validate (without unescaping) the value at p->pc, leaving p->pc beyond
+  * it. Nesting is bounded only by the stack...so is bounded iteratively.
+  */
+static bool _skip_value( struct parser *p ) {
+
+	long depth = 0;
+
+	do {
+		_skip_ws( p );
+		if( p->pc == p->end )
+			return false;
+		switch( *p->pc ) {
+		case '{':
+		case '[':
+			{
+				const char OPEN = *p->pc++;
+				depth++;
+				_skip_ws( p );
+				if( p->pc < p->end && *p->pc == ( OPEN == '{' ? '}' : ']' ) ) {
+					p->pc++;
+					depth--;
+					break;
+				}
+				if( OPEN == '{' && p->pc < p->end && *p->pc != '"' )
+					return false;
+			}
+			continue; // ...to the first member or element.
+		case '"':
+			p->pc++;
+			while( p->pc < p->end && *p->pc != '"' ) {
+				if( (unsigned char)*p->pc < 0x20 )
+					return false;
+				if( *p->pc == '\\' && ++p->pc == p->end )
+					return false;
+				p->pc++;
+			}
+			if( p->pc++ == p->end )
+				return false;
+			_skip_ws( p );
+			if( p->pc < p->end && *p->pc == ':' ) {
+				// ...it was a member's key (not checked to be in an object).
+				p->pc++;
+				continue;
+			}
+			break;
+		case 't':
+			if( ! _literal( p, "true", 4 ) ) return false;
+			break;
+		case 'f':
+			if( ! _literal( p, "false", 5 ) ) return false;
+			break;
+		case 'n':
+			if( ! _literal( p, "null", 4 ) ) return false;
+			break;
+		default:
+			if( ! _number( p ) ) return false;
+		}
+		// ...after a complete value.
+		while( depth > 0 ) {
+			_skip_ws( p );
+			if( p->pc == p->end )
+				return false;
+			if( *p->pc == ',' ) {
+				p->pc++;
+				break;
+			}
+			if( *p->pc != '}' && *p->pc != ']' )
+				return false;
+			p->pc++;
+			depth--;
+		}
+	} while( depth > 0 );
+
+	return true;
+}
+
+
+static struct pending *_push( struct parser *p, const char *key, unsigned len ) {
+
+	struct record_description *d = p->d;
+	const int N = p->npending;
+	struct pending *e;
+
+	if( N == p->pending_cap ) {
+		const int CAP = p->pending_cap ? 2*p->pending_cap : 64;
+		e = realloc( p->pending, CAP*sizeof(struct pending) );
+		if( e == NULL ) {
+			p->oom = true;
+			return NULL;
+		}
+		p->pending = e;
+		p->pending_cap = CAP;
+	}
+	e = p->pending + p->npending++;
+
+	if( N < p->predict_cap && p->predict[N] >= 0
+			&& d->key[ p->predict[N] ].len == len
+			&& memcmp( d->key[ p->predict[N] ].name, key, len ) == 0 ) {
+		e->key = p->predict[N];
+	} else {
+		e->hash = murmur3_32( key, len, KEY_HASH_SEED );
+		e->key  = _lookup( d, key, len, e->hash );
+		if( e->key < 0 ) {
+			e->key_off = _stash( p, key, len );
+			e->key_len = len;
+		}
+	}
+	return e;
+}
+
+
+/**
+  * With p->pc just beyond an object's opening brace, parse its members. The
+  * object's dotted key (if it is not the record itself) occupies
+  * p->path[0,base).
+  */
+static bool _object( struct parser *p, int depth, unsigned base ) {
+
+	_skip_ws( p );
+	if( p->pc < p->end && *p->pc == '}' ) {
+		p->pc++;
+		return true;
+	}
+
+	while( true ) {
+
+		const char *key;
+		char *name;
+		struct pending *e;
+		unsigned len;
+		int n;
+
+		if( p->pc == p->end || *p->pc != '"' )
+			return false;
+		p->pc++;
+		if( ( n = _string( p, &name ) ) < 0 )
+			return false;
+		_skip_ws( p );
+		if( p->pc == p->end || *p->pc != ':' )
+			return false;
+		p->pc++;
+		_skip_ws( p );
+		if( p->pc == p->end )
+			return false;
+
+		if( depth == 0 ) {
+			key = name;
+			len = n;
+		} else {
+			len = base + 1 + n;
+			if( len > p->path_cap ) {
+				char *path = realloc( p->path, 2*len );
+				if( path == NULL ) {
+					p->oom = true;
+					return false;
+				}
+				p->path = path;
+				p->path_cap = 2*len;
+			}
+			p->path[ base ] = '.';
+			memcpy( p->path + base + 1, name, n );
+			key = p->path;
+		}
+
+		if( *p->pc == '{' && depth + 1 < JSONL_MAX_DEPTH ) {
+			p->pc++;
+			if( depth == 0 ) {
+				if( len > p->path_cap ) {
+					char *path = realloc( p->path, 2*len + 1 );
+					if( path == NULL ) {
+						p->oom = true;
+						return false;
+					}
+					p->path = path;
+					p->path_cap = 2*len + 1;
+				}
+				memcpy( p->path, name, len );
+			}
+			if( ! _object( p, depth + 1, len ) )
+				return false;
+		} else {
+			char *start = p->pc;
+			if( ( e = _push( p, key, len ) ) == NULL )
+				return false;
+			e->value = NULL;
+			e->as_string = true;
+			switch( *p->pc ) {
+			case '"':
+				p->pc++;
+				if( _string( p, &name ) < 0 )
+					return false;
+				e->value = name;
+				break;
+			case 't':
+				if( ! _literal( p, "true", 4 ) )
+					return false;
+				e->value = "true";
+				break;
+			case 'f':
+				if( ! _literal( p, "false", 5 ) )
+					return false;
+				e->value = "false";
+				break;
+			case 'n':
+				if( ! _literal( p, "null", 4 ) )
+					return false;
+				e->value = "";
+				break;
+			case '{':
+			case '[':
+				if( ! _skip_value( p ) )
+					return false;
+				e->value_off = _stash( p, start, p->pc - start );
+				break;
+			default:
+				if( ! _number( p ) )
+					return false;
+				e->value_off = _stash( p, start, p->pc - start );
+				e->as_string = false;
+			}
+			if( p->oom )
+				return false;
+		}
+
+		_skip_ws( p );
+		if( p->pc == p->end )
+			return false;
+		if( *p->pc == '}' ) {
+			p->pc++;
+			return true;
+		}
+		if( *p->pc++ != ',' )
+			return false;
+		_skip_ws( p );
+	}
+}
+
+
+/**
+  * Tally the pending values of the line just parsed.
+  */
+static void _commit( struct parser *p, int line ) {
+
+	struct record_description *d = p->d;
+
+	if( p->npending > p->predict_cap ) {
+		int *predict = realloc( p->predict, p->npending*sizeof(int) );
+		if( predict == NULL ) {
+			p->oom = true;
+			return;
+		}
+		p->predict = predict;
+		p->predict_cap = p->npending;
+	}
+
+	d->records += 1;
+
+	for(int i = 0; i < p->npending; i++ ) {
+		const struct pending *e = p->pending + i;
+		int k = e->key;
+		if( k < 0 ) {
+			const char *NAME = p->scratch + e->key_off;
+			// ...an earlier value in this record may have added it.
+			k = _lookup( d, NAME, e->key_len, e->hash );
+			if( k < 0 )
+				k = _add_key( d, NAME, e->key_len, e->hash );
+			if( k == -2 ) {
+				p->oom = true;
+				return;
+			}
+		}
+		p->predict[i] = k;
+		if( k < 0 ) {
+			d->keys_exceeded += 1;
+			continue;
+		}
+		if( d->key[k].last_record != d->records ) {
+			d->key[k].last_record = d->records;
+			d->key[k].present += 1;
+		}
+		column_tally( d->column + k,
+			e->value ? e->value : p->scratch + e->value_off,
+			line, e->as_string );
+	}
+	for(int i = p->npending; i < p->predict_cap; i++ )
+		p->predict[i] = -1;
+}
+
+
+static void _line( struct parser *p, char *line, const char *end ) {
+
+	struct record_description *d = p->d;
+	const int LINE
+		= d->records + d->empty + d->aberrant;
+
+	p->pc  = line;
+	p->end = end;
+	p->npending = 0;
+	p->scratch_len = 0;
+
+	_skip_ws( p );
+	if( p->pc == p->end ) {
+		d->empty += 1;
+		return;
+	}
+	if( *p->pc++ == '{' && _object( p, 0, 0 ) ) {
+		_skip_ws( p );
+		if( p->pc == p->end ) {
+			_commit( p, LINE );
+			return;
+		}
+	}
+	if( ! p->oom )
+		d->aberrant += 1;
+}
+
+
+/***************************************************************************
+  * Driver
+  */
+
+int jsonl_scan( FILE *fp, struct record_description *d ) {
+
+	struct parser p;
+	char *buf = NULL;
+	size_t cap = JSONL_BLOCK_SIZE, len = 0, pos = 0;
+	bool eof = false;
+
+	memset( &p, 0, sizeof(p) );
+	p.d = d;
+
+	if( init_column_analysis() ) {
+		errno = ENOMEM;
+		return d->status = E_FILE_IO;
+	}
+	d->arena = arena_create();
+	buf = malloc( cap );
+	if( d->arena == NULL || buf == NULL ) {
+		p.oom = true;
+		goto done;
+	}
+
+	while( ! p.oom ) {
+		char *nl = memchr( buf + pos, '\n', len - pos );
+		if( nl ) {
+			_line( &p, buf + pos, nl );
+			pos = nl - buf + 1;
+			continue;
+		}
+		if( eof ) {
+			if( pos < len )
+				_line( &p, buf + pos, buf + len );
+			break;
+		}
+		// Move the partial line to the front of the buffer, growing it if
+		// the partial line fills it, and refill.
+		if( pos > 0 ) {
+			memmove( buf, buf + pos, len - pos );
+			len -= pos;
+			pos = 0;
+		} else
+		if( len == cap ) {
+			char *b = realloc( buf, 2*cap );
+			if( b == NULL ) {
+				p.oom = true;
+				break;
+			}
+			buf = b;
+			cap *= 2;
+		}
+		len += fread( buf + len, 1, cap - len, fp );
+		if( len < cap ) {
+			if( ferror( fp ) )
+				break;
+			eof = feof( fp );
+		}
+	}
+
+done:
+	free( buf );
+	free( p.path );
+	free( p.scratch );
+	free( p.pending );
+	free( p.predict );
+
+	if( p.oom || ferror( fp ) ) {
+		if( p.oom )
+			errno = ENOMEM;
+		return d->status = E_FILE_IO;
+	}
+
+	for(int i = 0; i < d->key_count; i++ ) {
+		analyze_column( d->column + i );
+		// Convert variance to standard deviation
+		d->column[i].statistics[1] = sqrt( d->column[i].statistics[1] );
+	}
+	return d->status = E_COMPLETE;
+}
+
+
+unsigned long jsonl_missing( const struct record_description *d, int i ) {
+	return d->records - d->key[i].present;
+}
+
+
+void jsonl_free( struct record_description *d ) {
+	for(int i = 0; i < d->key_count; i++ ) {
+		set_fini( & d->column[i].value_set );
+		tdigest_destroy( d->column[i].sketch );
+		hll_destroy( d->column[i].cardinality );
+	}
+	free( d->column );
+	free( d->key );
+	free( d->index );
+	d->column = NULL;
+	d->key    = NULL;
+	d->index  = NULL;
+	d->key_count = 0;
+	arena_destroy( d->arena ); // ...after the sets that refer to it.
+	d->arena = NULL;
+}
+
+
+#ifdef UNIT_TEST_JSONL
+
+/**
+  * Summarizes the JSON Lines file named by the argument (or stdin).
+  */
+int main( int argc, char *argv[] ) {
+
+	struct record_description d;
+	FILE *fp = argc > 1 ? fopen( argv[1], "r" ) : stdin;
+
+	if( fp == NULL ) {
+		perror( argv[1] );
+		return EXIT_FAILURE;
+	}
+	memset( &d, 0, sizeof(d) );
+	if( jsonl_scan( fp, &d ) != E_COMPLETE ) {
+		perror( "jsonl_scan" );
+		return EXIT_FAILURE;
+	}
+	printf( "records\t%lu\nempty\t%lu\naberrant\t%lu\nkeys\t%d (%lu ignored)\n",
+		d.records, d.empty, d.aberrant, d.key_count, d.keys_exceeded );
+	for(int i = 0; i < d.key_count; i++ ) {
+		const struct column *c = d.column + i;
+		printf( "%s\t%s\tmissing=%lu\tE/S/I/F=%d/%d/%d/%d\tmean=%g\tsd=%g\tlabels=%lu\n",
+			d.key[i].name,
+			STAT_CLASS_NAME[ c->stat_class ],
+			jsonl_missing( &d, i ),
+			c->type_vote[ FTY_EMPTY ],
+			c->type_vote[ FTY_STRING ],
+			c->type_vote[ FTY_INTEGER ],
+			c->type_vote[ FTY_FLOAT ],
+			c->statistics[0],
+			c->statistics[1],
+			column_distinct_values( c ) );
+	}
+	jsonl_free( &d );
+	if( fp != stdin )
+		fclose( fp );
+	return EXIT_SUCCESS;
+}
+#endif
+
@@ -0,0 +1,75 @@
+
+#ifndef _jsonl_h_
+#define _jsonl_h_
+
+/**
+  * Analysis of JSON Lines (a.k.a. NDJSON): files in which each line is a
+  * JSON object. Records are summarized in the same terms as tables: each
+  * distinct key is a column, and the values of each key are tallied into
+  * a struct column exactly as a table's fields are. Nested objects' keys
+  * are joined to their parents' with '.', so {"a":{"b":1}} has key "a.b".
+  */
+
+struct column;
+struct arena;
+
+struct record_key {
+	const char *name; // ...in the description's arena.
+	unsigned len;
+	unsigned hash;
+	/**
+	  * Count of records in which the key occurred, and the (1-based)
+	  * ordinal of the last such record.
+	  */
+	unsigned long present;
+	unsigned long last_record;
+};
+
+struct record_description {
+
+	/**
+	  * E_COMPLETE or E_FILE_IO (see enum TabularStatus).
+	  */
+	int status;
+
+	/**
+	  * Lines that were JSON objects, empty (or all whitespace) and
+	  * anything else. Aberrant lines contribute nothing to the columns.
+	  */
+	unsigned long records;
+	unsigned long empty;
+	unsigned long aberrant;
+
+	/**
+	  * The keys and their columns, in order of first occurrence. At most
+	  * MAX_RECORD_KEYS are tallied; keys_exceeded counts occurrences of
+	  * the others, which are ignored.
+	  */
+	int key_count;
+	unsigned long keys_exceeded;
+	struct record_key *key;
+	struct column *column;
+
+	/**
+	  * Open-addressed hash of key indices (-1 if empty).
+	  */
+	int *index;
+	unsigned mask;
+
+	struct arena *arena;
+};
+
+/**
+  * Like tabular_scan, <summary> must be zeroed, and its dynamically-
+  * allocated members must be released with jsonl_free.
+  */
+int  jsonl_scan( FILE *fp, struct record_description *summary );
+void jsonl_free( struct record_description * );
+
+/**
+  * The count of records lacking the <i>th key.
+  */
+unsigned long jsonl_missing( const struct record_description *, int i );
+
+#endif
+
@@ -15,6 +15,7 @@
 #include <stdbool.h>
 #include <ctype.h>
 #include <string.h>
+#include <limits.h>
 #include <math.h>
 #include <assert.h>
 
@@ -23,6 +24,9 @@
 #include "murmur3.h"
 #include "rstrip.h"
 #include "column.h"
+#include "tdigest.h"
+#include "hll.h"
+#include "arena.h"
 #include "environ.h"
 
 
@@ -33,15 +37,23 @@ int _init_analysis( struct table_description *d ) {
 	const int COLUMNS
 		= d->table.column_count;
 	if( COLUMNS > 0 ) {
-		d->column = calloc( COLUMNS, sizeof(struct column) );
+		d->arena = arena_create();
+		d->column = d->arena ? calloc( COLUMNS, sizeof(struct column) ) : NULL;
 		if( d->column ) {
 			int i = 0;
+			/**
+			  * Each set is seeded by its column's index (not rand(), whose
+			  * state is shared by every scan in the process) so that labels
+			  * are listed in the same order whatever was scanned before, and
+			  * in whichever thread or process.
+			  */
 			for(; i < COLUMNS; i++ ) {
 				if( set_init( & d->column[i].value_set,
 					MAX_CATEGORY_CARDINALITY,
 					true, /* duplicate strings */
 					murmur3_32, // fnv_32,
-					rand() ) ) break;
+					i ) ) break;
+				set_use_arena( & d->column[i].value_set, d->arena );
 			}
 			// Graceful, exhaustive clean-up and abort.
 			if( i < COLUMNS || init_column_analysis() ) {
@@ -53,12 +65,175 @@ int _init_analysis( struct table_description *d ) {
 				d->column = NULL;
 			}
 		}
+		if( d->column == NULL ) {
+			arena_destroy( d->arena );
+			d->arena = NULL;
+		}
 		return d->column ? 0 : -1;
 	} else
 		return 0; // ...not failure, since nothing to allocate.
 }
 
 
+/**
+  * Powers of ten exactly representable as doubles. A decimal mantissa of at
+  * most 53 bits scaled by one of these is correctly rounded by a single
+  * multiplication or division (Clinger's "fast path"), so the value is
+  * identical to what strtod would produce.
+  */
+static const double _EXACT_POW10[] = {
+	1e0,  1e1,  1e2,  1e3,  1e4,  1e5,  1e6,  1e7,  1e8,  1e9,  1e10, 1e11,
+	1e12, 1e13, 1e14, 1e15, 1e16, 1e17, 1e18, 1e19, 1e20, 1e21, 1e22
+};
+#define MAX_EXACT_POW10   (22)
+#define MAX_EXACT_MANTISSA (1UL<<53)
+
+/**
+  * The largest count of decimal digits that cannot overflow a long.
+  */
+#define MAX_SAFE_DIGITS (18)
+
+/**
+  * floor(log10(v)) for v >= 1, in integer arithmetic.
+  */
+static inline int _decimal_magnitude( unsigned long v ) {
+	int k = 0;
+	unsigned long decade = 10;
+	while( v >= decade ) {
+		k += 1;
+		if( decade > ULONG_MAX / 10 )
+			break;
+		decade *= 10;
+	}
+	return k;
+}
+
+
+/**
+  * Returned by _lex_field when classification must be delegated to
+  * strtol/strtod.
+  */
+#define LEX_DEFER (-1)
+
+/**
+  * Unlike isdigit this is locale-independent and safe for any char.
+  */
+#define IS_DIGIT(c) ((unsigned)((c) - '0') < 10)
+
+/**
+  * Classify the NUL-terminated field as FTY_EMPTY, FTY_STRING, FTY_INTEGER
+  * or FTY_FLOAT and parse its value in a single pass. The length of the
+  * field is returned in *len.
+  *
+  * The grammar recognized here is plain decimal notation:
+  *
+  *   [+-]? ( D+ | D+ . D* | . D+ | D* . D+ ) ( [eE] [+-]? D+ )?
+  *
+  * which classifies exactly as the strtol( ,,0)/strtod sequence it replaces.
+  * Everything on which those functions' behavior is more subtle is
+  * deferred to them (LEX_DEFER): leading whitespace, base prefixes and
+  * leading zeros (which strtol interprets as octal), inf and nan, and
+  * integers too long to be sure of not overflowing.
+  */
+static int _lex_field( const char *field, int *len, long *ival, double *fval ) {
+
+	const char *pc = field;
+	bool negative = false;
+	bool is_float = false;
+	unsigned long m = 0; // mantissa
+	int ndigits = 0;     // ...in mantissa
+	int scale = 0;       // power of 10 by which to scale mantissa
+
+	switch( *pc ) {
+	case '\0':
+		*len = 0;
+		return FTY_EMPTY;
+	case '-':
+		negative = true;
+		// fall through
+	case '+':
+		pc++;
+	}
+
+	if( ! IS_DIGIT( *pc ) && *pc != '.' ) {
+		if( *pc && ( isspace( (unsigned char)*pc ) || strchr( "iInN", *pc ) ) )
+			return LEX_DEFER;
+		goto string;
+	}
+
+	// Leading zeros select octal or hex in strtol( ,,0).
+
+	if( pc[0] == '0' && ( IS_DIGIT( pc[1] ) || pc[1] == 'x' || pc[1] == 'X' ) )
+		return LEX_DEFER;
+
+	while( IS_DIGIT( *pc ) ) {
+		m = 10*m + (*pc++ - '0');
+		ndigits++;
+	}
+
+	if( *pc == '\0' ) {
+		if( ndigits > MAX_SAFE_DIGITS )
+			return LEX_DEFER; // ...strtol saturates on overflow.
+		*ival = negative ? -(long)m : (long)m;
+		*len = pc - field;
+		return FTY_INTEGER;
+	}
+
+	if( *pc == '.' ) {
+		is_float = true;
+		pc++;
+		while( IS_DIGIT( *pc ) ) {
+			m = 10*m + (*pc++ - '0');
+			ndigits++;
+			scale--;
+		}
+	}
+
+	if( ndigits == 0 )
+		goto string; // "." or "+." etc.
+
+	if( *pc == 'e' || *pc == 'E' ) {
+		const char *exp = pc + 1;
+		bool exp_negative = false;
+		int e = 0;
+		if( *exp == '-' || *exp == '+' )
+			exp_negative = ( *exp++ == '-' );
+		if( ! IS_DIGIT( *exp ) )
+			goto string; // ...strtod would stop at the 'e'.
+		while( IS_DIGIT( *exp ) ) {
+			if( e < 100000 )
+				e = 10*e + (*exp - '0');
+			exp++;
+		}
+		scale += exp_negative ? -e : e;
+		is_float = true;
+		pc = exp;
+	}
+
+	if( *pc != '\0' || ! is_float )
+		goto string;
+
+	*len = pc - field;
+
+	if( ndigits <= MAX_SAFE_DIGITS + 1
+			&& m <= MAX_EXACT_MANTISSA
+			&& -MAX_EXACT_POW10 <= scale && scale <= MAX_EXACT_POW10 ) {
+		double x = m;
+		if( scale < 0 )
+			x /= _EXACT_POW10[ -scale ];
+		else
+			x *= _EXACT_POW10[ scale ];
+		*fval = negative ? -x : x;
+	} else
+		*fval = strtod( field, NULL ); // ...known to be valid.
+	return FTY_FLOAT;
+
+string:
+	*len = ( pc - field ) + strlen( pc );
+	return FTY_STRING;
+}
+
+
 /**
   * Because, in general, a numeric column may contain other non-numeric
   * "magic" values (e.g. NaN, or NA), we reassess the type of each field on
@@ -70,43 +245,28 @@ int _init_analysis( struct table_description *d ) {
   * other than current tallies might lead one to expect. We simply tally
   * everything up.
   * In general, there are no errors, only statistics to gather.
-  * Returns number of chars consumed.
+  * <line> is the 0-based line number of the field. If <as_string> the
+  * field is tallied as a string (or as empty) whatever it resembles.
   */
-static void _parse_field( const char *field, int off, void *context ) {
-
-	struct table_description *d
-		= (struct table_description*)context;
-	struct column *c
-		= d->column + off;
+static inline void _tally_field( struct column *c, const char *field, int line, bool as_string ) {
 
 	union {
 		long int ival;
 		double fval;
 	} u;
-	char *endpt = NULL;
-	int type = FTY_STRING; // unless demonstrated otherwise below.
-
-	const int FIELD_LEN
-		= strlen( field );
-
-	assert( off < d->table.column_count );
-
-	if( FIELD_LEN == 0 ) {
-		c->type_vote[ FTY_EMPTY ] += 1;
-		return;
-	}
-
-	if( c->max_field_len < FIELD_LEN )
-		c->max_field_len = FIELD_LEN;
+	int FIELD_LEN;
+	int type;
 
 	/**
 	  * 1. Determine the type
-	  * ...by speculatively trying to treat it as a number since, if it is
-	  * numeric, we'll operate on its value. Specifically, try to interpret
-	  * the field as an integer (the most restrictive type) or else a float,
-	  * and fall back to string if both fail. Note that even if it's a 
-	  * floating-point representation of an int (1.0) we *want* to treat
-	  * that as a float; someone upstream decided that floats were needed!
+	  * ...and, if it is numeric, its value, since we'll operate on it.
+	  * Note that even if it's a floating-point representation of an int
+	  * (1.0) we *want* to treat that as a float; someone upstream decided
+	  * that floats were needed!
+	  * Most fields are classified and parsed by _lex_field in one pass.
+	  * Otherwise, try to interpret the field as an integer (the most
+	  * restrictive type) or else a float, and fall back to string if both
+	  * fail.
 	  *
 	  * Note that strtod DOES handle the special values: /[+-]?(inf|nan)/i
 	  * as demonstrated by:
@@ -115,18 +275,48 @@ static void _parse_field( const char *field, int off, void *context ) {
 	  * void main(int argc,char*argv[]) {printf("%f\n",strtod(argv[1],NULL));}
 	  */
 
-	if( ( u.ival = strtol( field, &endpt, 0 ), *endpt == '\0' ) ) {
-		type = FTY_INTEGER;
-		// ...and update two other statistics associated with integers.
+	if( as_string ) {
+		FIELD_LEN = strlen( field );
+		type = FIELD_LEN > 0 ? FTY_STRING : FTY_EMPTY;
+	} else
+		type = _lex_field( field, &FIELD_LEN, &u.ival, &u.fval );
+
+	if( type == LEX_DEFER ) {
+		char *endpt = NULL;
+		FIELD_LEN = strlen( field );
+		type = FTY_STRING; // unless demonstrated otherwise below.
+		if( ( u.ival = strtol( field, &endpt, 0 ), *endpt == '\0' ) ) {
+			type = FTY_INTEGER;
+		} else // ...*entire* string wasn't consumed by strtol, so...
+		if( ( u.fval = strtod( field, &endpt    ), *endpt == '\0' ) ) {
+			type = FTY_FLOAT;
+		}
+	}
+
+	if( type == FTY_EMPTY ) {
+		c->type_vote[ FTY_EMPTY ] += 1;
+		return;
+	}
+
+	if( c->max_field_len < FIELD_LEN )
+		c->max_field_len = FIELD_LEN;
+
+	if( c->cardinality == NULL )
+		c->cardinality = hll_create(); // ...failure merely forgoes the estimate.
+	if( c->cardinality )
+		hll_add( c->cardinality, murmur3_32( field, FIELD_LEN, HLL_SEED ) );
+
+	if( type == FTY_INTEGER ) {
+		// ...update two other statistics associated with integers.
+		const unsigned long ABS
+			= u.ival < 0
+			? -(unsigned long)u.ival
+			: (unsigned long)u.ival;
 		c->has_negative_integers
 			= c->has_negative_integers
 			|| u.ival < 0;
 		c->integer_magnitudes
-			|= ( 1 << (int)floorf(log10f(1.0+abs(u.ival))) );
-
-	} else // ...*entire* string wasn't consumed by strtol, so...
-	if( ( u.fval = strtod( field, &endpt    ), *endpt == '\0' ) ) {
-		type = FTY_FLOAT;
+			|= ( 1U << _decimal_magnitude( ABS + 1 ) );
 	}
 
 	/**
@@ -152,10 +342,7 @@ static void _parse_field( const char *field, int off, void *context ) {
 				= set_insert( & c->value_set, field );
 			if( SZS_TABLE_FULL == status ) {
 				// Note the (0-based) line number at which the table filled.
-				c->excess_values
-					= d->rows.empty
-					+ d->rows.meta
-					+ d->rows.data;
+				c->excess_values = line;
 				// Since the table can't possibly fill on the 0th line,
 				// excess_values can be treated as a boolean, too.
 			}
@@ -207,6 +394,11 @@ static void _parse_field( const char *field, int off, void *context ) {
 				/   (N-0.0);
 		}
 
+		if( c->sketch == NULL )
+			c->sketch = tdigest_create(); // ...failure merely forgoes quantiles.
+		if( c->sketch )
+			tdigest_add( c->sketch, X );
+
 		// Update the extrema
 
 		if( N > 0 ) {
@@ -225,6 +417,23 @@ static void _parse_field( const char *field, int off, void *context ) {
 }
 
 
+static void _parse_field( const char *field, int off, void *context ) {
+
+	struct table_description *d
+		= (struct table_description*)context;
+
+	assert( off < d->table.column_count );
+
+	_tally_field( d->column + off, field,
+		d->rows.empty + d->rows.meta + d->rows.data, false );
+}
+
+
+void column_tally( struct column *c, const char *field, int line, bool as_string ) {
+	_tally_field( c, field, line, as_string );
+}
+
+
 /**
   * Classify and, if appropriate, parse the line.
   * Given a line and a struct field_spec parse the line and 
@@ -279,7 +488,49 @@ void _fini_analysis( struct table_description *d ) {
 		// Convert variance to standard deviation
 		d->column[i].statistics[1] = sqrt( d->column[i].statistics[1] );
 	}
-	fini_column_analysis();
+}
+
+
+/**
+  * Fold the row counts and column accumulators of <w>, an analysis of lines
+  * that followed all those analyzed by <d>, into <d>. Both analyses must
+  * share a format and neither may have been finished.
+  */
+void _merge_analysis( struct table_description *d, const struct table_description *w ) {
+
+	const int LINES
+		= d->rows.empty
+		+ d->rows.meta
+		+ d->rows.data;
+
+	assert( d->table.column_count == w->table.column_count );
+
+	for(int i = 0; i < d->table.column_count; i++ )
+		merge_column( d->column + i, w->column + i, LINES );
+
+	d->rows.empty    += w->rows.empty;
+	d->rows.meta     += w->rows.meta;
+	d->rows.data     += w->rows.data;
+	d->rows.aberrant += w->rows.aberrant;
+}
+
+
+/**
+  * Returns true if every column has converged (see column_converged) since
+  * <prior>, an array of copies of the columns made by an earlier call
+  * (or zeroed), which is then updated. Only the copies' accumulators, not
+  * their value sets, may be used.
+  */
+bool _analysis_converged( const struct table_description *d, struct column *prior, double tolerance ) {
+
+	bool converged = true;
+
+	for(int i = 0; i < d->table.column_count; i++ ) {
+		if( ! column_converged( prior + i, d->column + i, tolerance ) )
+			converged = false;
+	}
+	memcpy( prior, d->column, d->table.column_count*sizeof(struct column) );
+	return converged;
 }
 
 
@@ -287,8 +538,12 @@ void tabular_free( struct table_description *d ) {
 	if( d->column ) {
 		for(int i = 0; i < d->table.column_count; i++ ) {
 			set_fini( & d->column[i].value_set );
+			tdigest_destroy( d->column[i].sketch );
+			hll_destroy( d->column[i].cardinality );
 		}
 		free( d->column );
 		d->column = NULL;
 	}
+	arena_destroy( d->arena ); // ...after the sets that refer to it.
+	d->arena = NULL;
 }
@@ -21,16 +21,21 @@ int main( int argc, char *argv[] ) {
 
 	int exit_status = EXIT_FAILURE;
 	FILE *fp = stdin;
+	struct scan_options o;
 	struct table_description d;
 
+	memset( &o, 0, sizeof(o) );
 	memset( &d, 0, sizeof(d) );
 
 	do {
 		static const char *CHAR_OPTIONS 
-			= "h";
+			= "ht:s:S:";
 		static struct option LONG_OPTIONS[] = {
 
 			{"help",       0,0,'h'},
+			{"threads",    1,0,'t'},
+			{"sample",     1,0,'s'},
+			{"seed",       1,0,'S'},
 			{ NULL,        0,0, 0 }
 		};
 
@@ -38,6 +43,18 @@ int main( int argc, char *argv[] ) {
 		const int c = getopt_long( argc, argv, CHAR_OPTIONS, LONG_OPTIONS, &opt_offset );
 		switch (c) {
 
+		case 't':
+			o.threads = atoi( optarg );
+			break;
+
+		case 's':
+			o.sample_tolerance = atof( optarg );
+			break;
+
+		case 'S':
+			o.sample_seed = strtoul( optarg, NULL, 0 );
+			break;
+
 		case -1: // ...signals no more options.
 			break;
 		default:
@@ -52,7 +69,7 @@ int main( int argc, char *argv[] ) {
 
 	if( fp ) {
 
-		exit_status = tabular_scan( fp, &d );
+		exit_status = tabular_scan_ex( fp, &o, &d );
 		fclose( fp );
 
 		if( d.status != E_COMPLETE ) {
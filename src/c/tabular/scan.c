@@ -1,4 +1,5 @@
 
+#define _DEFAULT_SOURCE // ...for madvise (posix_madvise's DONTNEED is a no-op in glibc).
 #include <stdio.h>
 #include <stdlib.h>
 #include <stdint.h>
@@ -6,10 +7,19 @@
 #include <string.h>
 #include <ctype.h>
 #include <assert.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <pthread.h>
+#ifdef _POSIX_MAPPED_FILES
+#include <sys/mman.h>
+#include <sys/stat.h>
+#endif
 
 #include "utf8.h"
 #include "sspp.h"
 #include "tabular.h"
+#include "strset.h"
+#include "column.h"
 #include "rstrip.h"
 
 /**
@@ -19,23 +29,61 @@ extern int _format_infer( FILE *fp, int delim, int nlines, struct format *inferr
 extern int _init_analysis( struct table_description * );
 extern int _analyze_line( struct table_description *, char *line, int len );
 extern void _fini_analysis( struct table_description * );
+extern void _merge_analysis( struct table_description *, const struct table_description * );
+extern bool _analysis_converged( const struct table_description *, struct column *prior, double tolerance );
 
 #define MAX_COUNT_HEADER_LINES (256)
 #define MAX_COUNT_SAMPLE_LINES (16)
 
 /**
-  * Used by all calls to getdelim().
+  * A format hint is accepted once this many data lines (after the first
+  * line) split as it prescribes, provided none failed to within the first
+  * MAX_COUNT_HEADER_LINES lines.
   */
-static size_t _blen = 0;
-static char *_line = NULL;
+#define HINT_CHECK_LINES (8)
+
+/**
+  * Input is consumed in blocks of this size rather than byte-by-byte.
+  */
+#ifndef SCAN_BLOCK_SIZE
+#define SCAN_BLOCK_SIZE (256*1024)
+#endif
+
+/**
+  * When a regular file is scanned through a mapping, pages behind the
+  * scan are released in increments of this size. So, if the scan_options
+  * ask it, are the page cache's pages of mapped and streamed files.
+  */
+#define MAP_RELEASE_INTERVAL (16*1024*1024)
+
+/**
+  * The least amount of a mapped file worth scanning on a thread of its own.
+  */
+#ifndef MIN_CHUNK_SIZE
+#define MIN_CHUNK_SIZE (4*1024*1024)
+#endif
+
+/**
+  * Sampling reads (line-aligned) blocks of this size, at least
+  * MIN_SAMPLE_BLOCKS of them, and stops once the column statistics have
+  * held still for SAMPLE_STABLE_CHECKS consecutive checks. Files with
+  * fewer than 2*MIN_SAMPLE_BLOCKS blocks are scanned in full.
+  */
+#ifndef SAMPLE_BLOCK_SIZE
+#define SAMPLE_BLOCK_SIZE (1024*1024)
+#endif
+#define MIN_SAMPLE_BLOCKS    (8)
+#define SAMPLE_STABLE_CHECKS (2)
 
 enum {
 	ASTAT_SYSERR = -1,
 	// A system error (e.g. malloc failure) precluded (further) analysis.
 	ASTAT_ABORT,
 	// The data is not tabular, so just fall back to character counting.
-	ASTAT_CONTINUE
+	ASTAT_CONTINUE,
 	// We seem to have a table and are proceeding on that assumption.
+	ASTAT_RETRY
+	// The lines contradict the format hint; start over without it.
 };
 
 /**
@@ -127,6 +175,60 @@ struct state {
 	  */
 	FILE *cache;
 
+	/**
+	  * Buffer (and its capacity) used by all calls to getdelim() on the
+	  * cache. Held here rather than in statics so that concurrent scans
+	  * (in different threads) share nothing.
+	  * Once the cache has served its purpose (table format is known) this
+	  * buffer accumulates the current line directly; .llen is its length.
+	  */
+	char *line;
+	size_t blen;
+	size_t llen;
+
+	/**
+	  * The input stream and the block currently being consumed from it.
+	  * Unconsumed bytes are [.cur, .lim).
+	  * If .fp is NULL (and the input is not mapped) input is fed by the
+	  * caller (see tabular_scanner_feed) and the blocks are the caller's
+	  * buffers. Then .more is true until the caller signals the end of
+	  * input, and exhausting a block just suspends the scan.
+	  */
+	FILE *fp;
+	unsigned char *block;
+	const unsigned char *cur;
+	const unsigned char *lim;
+	bool more;
+
+	/**
+	  * If fp is a regular file it is mapped rather than read, and .map
+	  * serves as the (single) block. Then no tmpfile cache is used: the
+	  * cached lines are just the first .nbytes of the mapping, and each
+	  * line is copied once into .line only when it is analyzed (splitters
+	  * NUL-terminate fields in place; doing that in a private writable
+	  * mapping costs a copy-on-write fault per page, which is slower than
+	  * copying lines that are already in the CPU cache).
+	  * [.map, .map + .released) has been returned to the OS.
+	  */
+	unsigned char *map;
+	size_t maplen;
+	size_t released;
+
+	/**
+	  * If .drop_cache, pages are also released from the page cache: those
+	  * of the mapping as it is released, and those of a stream (read from
+	  * descriptor .fd) below offset .dropped.
+	  */
+	bool drop_cache;
+	int fd;
+	off_t dropped;
+
+	/**
+	  * Bytes of the mapping that were never scanned because the file was
+	  * sampled.
+	  */
+	size_t skipped;
+
 	/**
 	  * Warning: these functions WILL be called on each and every character
 	  * read, including the first...in which .last will not be meaningful.
@@ -142,10 +244,31 @@ struct state {
 	  */
 	int state_lines;
 
+	/**
+	  * A format hint (see struct scan_options) being checked or, once
+	  * accepted, used in lieu of inference. .column_count == 0 if none.
+	  */
+	struct format hint;
+	bool hint_meta_seen;
+
 	struct table_description *analysis;
 };
 
 
+/**
+  * Use the (accepted) format hint as the table's format. Inference only
+  * finds a metadata prefix if metadata lines lead the file, so the hint's
+  * is dropped if none were seen.
+  */
+static void _adopt_hint( struct state *s ) {
+	if( ! s->hint_meta_seen ) {
+		s->hint.metadata_line_prefix[0] = '\0';
+		s->hint.metadata_line_prefix_len = 0;
+	}
+	s->analysis->table = s->hint;
+}
+
+
 /**
   * 1. Analyzes the cached initial lines of file to infer table properties.
   * 2. based on #1 creates structs/buffers required for subsequent content
@@ -155,12 +278,22 @@ struct state {
   * Return is one of the ternary ASTAT_x codes.
   */
 
+static int _analyze_top_lines_mapped( struct state *s );
+static int _line_append( struct state *s, const void *buf, size_t n );
+static int _cs_check_hint( struct state *s );
+
 static int _analyze_top_lines( struct state *s ) {
 
 	ssize_t llen;
 
+	if( s->map )
+		return _analyze_top_lines_mapped( s );
+
 	rewind( s->cache );
 
+	if( s->check_state == _cs_check_hint )
+		_adopt_hint( s );
+	else
 	if( _format_infer( s->cache, s->final_line_separator, s->lines, & s->analysis->table ) )
 		return ASTAT_ABORT;
 
@@ -171,24 +304,102 @@ static int _analyze_top_lines( struct state *s ) {
 
 	rewind( s->cache );
 
-	while( (llen = getdelim( &_line, &_blen, s->final_line_separator, s->cache )) > 0 )
-		_analyze_line( s->analysis, _line, llen );
+	while( (llen = getdelim( &s->line, &s->blen, s->final_line_separator, s->cache )) > 0 )
+		_analyze_line( s->analysis, s->line, llen );
 
-	rewind( s->cache );
+	// The cache has served its purpose. Henceforth, lines are accumulated
+	// in s->line (see _cache_append).
+
+	fclose( s->cache );
+	s->cache = NULL;
+	s->llen = 0;
 
 	return ASTAT_CONTINUE;
 }
 
 
+/**
+  * The equivalent of _analyze_top_lines when the file is mapped: the
+  * "cache" is the first .nbytes of the mapping.
+  */
+static int _analyze_top_lines_mapped( struct state *s ) {
+
+	char *pc = (char *)s->map;
+	char *const END = pc + s->nbytes;
+
+	if( s->check_state == _cs_check_hint )
+		_adopt_hint( s );
+	else {
+		FILE *cache = fmemopen( s->map, s->nbytes, "r" );
+		if( cache == NULL )
+			return ASTAT_SYSERR;
+		if( _format_infer( cache, s->final_line_separator, s->lines, & s->analysis->table ) ) {
+			fclose( cache );
+			return ASTAT_ABORT;
+		}
+		fclose( cache );
+	}
+
+	assert( s->analysis->table.column_count > 0 );
+
+	if( _init_analysis( s->analysis ) )
+		return ASTAT_SYSERR;
+
+	while( pc < END ) {
+		const char *eol = memchr( pc, s->final_line_separator, END - pc );
+		const size_t N
+			= eol ? eol + 1 - pc : END - pc;
+		s->llen = 0;
+		if( _line_append( s, pc, N ) )
+			return ASTAT_SYSERR;
+		_analyze_line( s->analysis, s->line, s->llen );
+		pc += N;
+	}
+
+	s->llen = 0;
+	return ASTAT_CONTINUE;
+}
+
+
 /**
   * The possible values for state.check_state.
   */
 static int _cs_infer_lineterm( struct state *s );
+static int _cs_check_hint( struct state *s );
 static int _cs_discard_header( struct state *s );
 static int _cs_acquire_sample( struct state *s );
 static int _cs_analyze_content( struct state *s );
 
 
+static bool _is_admissable_prefix( const char *prefix );
+
+static void _ignore_field( const char *field, int offset, void *context ) {
+}
+
+/**
+  * Returns 1 if <line> is a data line that splits into exactly the fields
+  * <f> prescribes, 2 if it is metadata, 0 if it is empty, or -1 if it
+  * contradicts <f>.
+  * A line that might be metadata under another prefix (e.g. a "#"-prefixed
+  * header when <f> has none) also contradicts <f>, though it may split
+  * correctly, since inference might have made a different choice. Leading
+  * signs, decimal points and quotes are exempt: they commonly begin data.
+  */
+static int _check_line( struct format *f, char *line, int len ) {
+	if( (len = rstrip( line, len )) == 0 )
+		return 0;
+	if( f->metadata_line_prefix_len > 0
+			&& strncmp( line, f->metadata_line_prefix, f->metadata_line_prefix_len ) == 0 ) {
+		// Inference takes all the leading punctuation (that fits) as prefix.
+		const int N = f->metadata_line_prefix_len;
+		return N < MAXLEN_METADATA_PREFIX && ispunct( (unsigned char)line[N] ) ? -1 : 2;
+	}
+	if( _is_admissable_prefix( line ) && strchr( "+-.\"", line[0] ) == NULL )
+		return -1;
+	return f->split_line( line, f, _ignore_field, NULL ) == f->column_count ? 1 : -1;
+}
+
+
 /**
   * This detects the end of the first line which is signalled by the first
   * encounter of successive bytes matching /[\n\r]./.
@@ -246,8 +457,54 @@ static int _cs_infer_lineterm( struct state *s ) {
 		sspp_flush( s->lpas );
 		s->lines += 1;
 
+		{
+			char *const T = s->analysis->table.line_terminator;
+			if( s->final_line_separator == LAST ) {
+				T[0] = LAST;
+				T[1] = '\0';
+			} else {
+				T[0] = LAST;
+				T[1] = s->final_line_separator;
+				T[2] = '\0';
+			}
+		}
+
 		// The final act of this cache monitor is to transfer 
 		// control to the next...
+
+		if( s->hint.column_count > 0
+				&& strcmp( s->hint.line_terminator, s->analysis->table.line_terminator ) == 0 ) {
+			/**
+			  * Header and format inference are bypassed, but the lines
+			  * must be checked, one at a time, starting with the first.
+			  * The current character may already belong to the next.
+			  */
+			const size_t N = s->nbytes
+				- ( _is_line_terminator_cc( s->cc_curr ) ? 0 : 1 + s->suffix_len );
+			if( s->map ) {
+				s->llen = 0;
+				if( _line_append( s, s->map, N ) )
+					return ASTAT_SYSERR;
+			}
+			switch( _check_line( & s->hint, s->line, N ) ) {
+			case -1:
+				return ASTAT_RETRY;
+			case 2:
+				s->hint_meta_seen = true;
+			}
+			s->check_state = _cs_check_hint;
+			s->state_lines = HINT_CHECK_LINES;
+			s->llen = 0;
+			if( ! _is_line_terminator_cc( s->cc_curr ) ) {
+				if( s->map )
+					s->llen = 1 + s->suffix_len;
+				else
+				if( _line_append( s, s->analysis->utf8, 1 + s->suffix_len ) )
+					return ASTAT_SYSERR;
+			}
+			return ASTAT_CONTINUE;
+		}
+
 		s->check_state = _cs_discard_header;
 		s->state_lines = MAX_COUNT_HEADER_LINES - 1;
 	}
@@ -259,6 +516,53 @@ static int _cs_infer_lineterm( struct state *s ) {
 }
 
 
+/**
+  * Checks each line against the format hint. Once HINT_CHECK_LINES data
+  * lines have matched it the cached lines are analyzed with it (exactly as
+  * they would have been with the same inferred format); any mismatch, or
+  * the lack of data lines, forces a retry without it.
+  */
+static int _cs_check_hint( struct state *s ) {
+
+	if( s->analysis->utf8[0] == s->final_line_separator /* we've finished another line */ ) {
+
+		int verdict;
+
+		if( s->map ) {
+			// The line is the last .llen bytes consumed.
+			const size_t N = s->llen;
+			s->llen = 0;
+			if( _line_append( s, s->map + s->nbytes - N, N ) )
+				return ASTAT_SYSERR;
+		}
+
+		s->lines ++;
+
+		verdict = s->llen > 0 ? _check_line( & s->hint, s->line, s->llen ) : 0;
+		s->llen = 0;
+		if( verdict < 0 )
+			return ASTAT_RETRY;
+		if( verdict == 2 )
+			s->hint_meta_seen = true;
+		else
+			s->state_lines -= verdict;
+
+		if( s->state_lines == 0
+				|| ( s->lines >= MAX_COUNT_HEADER_LINES && s->state_lines < HINT_CHECK_LINES ) ) {
+			const int ASTAT
+				= _analyze_top_lines( s );
+			if( ASTAT_CONTINUE == ASTAT )
+				s->check_state = _cs_analyze_content;
+			else
+				return ASTAT;
+		} else
+		if( s->lines >= MAX_COUNT_HEADER_LINES )
+			return ASTAT_RETRY;
+	}
+	return ASTAT_CONTINUE;
+}
+
+
 /**
   * Localize the decision about what makes a valid header/metadata prefix.
   */
@@ -398,23 +702,798 @@ static int _cs_analyze_content( struct state *s ) {
 
 	if( s->analysis->utf8[0] == s->final_line_separator /* we've finished another line */ ) {
 
-		ssize_t llen;
+		if( s->map ) {
+			// The line is the last .llen bytes consumed.
+			const size_t N = s->llen;
+			s->llen = 0;
+			if( _line_append( s, s->map + s->nbytes - N, N ) )
+				return ASTAT_SYSERR;
+		}
+
 		s->lines  ++;
 
-		rewind( s->cache );
+		_analyze_line( s->analysis, s->line, s->llen ); // ...whether empty or not!
+		s->llen = 0;
+
+#ifdef _POSIX_MAPPED_FILES
+		/**
+		  * Nothing before the next line will be revisited, so unmap those
+		  * pages to keep the resident set small on large files.
+		  */
+		if( s->map && s->nbytes - s->released >= MAP_RELEASE_INTERVAL ) {
+			const size_t PAGE = sysconf( _SC_PAGESIZE );
+			const size_t END = s->nbytes / PAGE * PAGE;
+			madvise( s->map + s->released, END - s->released, MADV_DONTNEED );
+#ifdef POSIX_FADV_DONTNEED
+			// ...and, now that they're unmapped, drop them from the cache.
+			if( s->drop_cache )
+				posix_fadvise( s->fd, s->released, END - s->released, POSIX_FADV_DONTNEED );
+#endif
+			s->released = END;
+		}
+#endif
+	}
+	return ASTAT_CONTINUE;
+}
+
+
+/**
+  * Append bytes to the current line buffer.
+  */
+static int _line_append( struct state *s, const void *buf, size_t n ) {
+
+	if( s->llen + n + 1 > s->blen ) {
+		size_t cap
+			= s->blen > 0 ? s->blen : 256;
+		char *p;
+		while( cap < s->llen + n + 1 )
+			cap *= 2;
+		if( (p = realloc( s->line, cap )) == NULL )
+			return -1;
+		s->line = p;
+		s->blen = cap;
+	}
+	memcpy( s->line + s->llen, buf, n );
+	s->llen += n;
+	s->line[ s->llen ] = '\0';
+	return 0;
+}
+
+
+/**
+  * Append consumed bytes either to the cache (while the top of the file is
+  * being collected for format inference) or to the current line buffer
+  * (thereafter). When the file is mapped the bytes are already where they
+  * are needed, so only the line length is maintained.
+  */
+static int _cache_append( struct state *s, const void *buf, size_t n ) {
+
+	if( s->map ) {
+		s->llen += n;
+		return 0;
+	}
+
+	if( s->cache ) {
+		// While a format hint is checked each line is needed whole, too.
+		if( s->hint.column_count > 0
+				&& ( s->check_state == _cs_check_hint || s->check_state == _cs_infer_lineterm )
+				&& _line_append( s, buf, n ) )
+			return -1;
+		return fwrite( buf, sizeof(char), n, s->cache ) == n ? 0 : -1;
+	}
+
+	return _line_append( s, buf, n );
+}
+
+
+/**
+  * Read the next block of input. Returns the count of bytes available,
+  * which is 0 only at EOF or on error.
+  */
+static size_t _refill( struct state *s ) {
+	size_t n;
+	if( s->map || s->fp == NULL )
+		return 0; // The mapping is the only block; fed blocks come unbidden.
+	n = fread( s->block, sizeof(char), SCAN_BLOCK_SIZE, s->fp );
+	s->cur = s->block;
+	s->lim = s->block + n;
+#ifdef POSIX_FADV_DONTNEED
+	if( s->drop_cache ) {
+		const off_t POS = ftello( s->fp );
+		if( POS - s->dropped >= MAP_RELEASE_INTERVAL ) {
+			posix_fadvise( s->fd, s->dropped, POS - s->dropped, POSIX_FADV_DONTNEED );
+			s->dropped = POS;
+		}
+	}
+#endif
+	return n;
+}
+
+
+/**
+  * fgetc on the block buffer.
+  */
+static inline int _getc( struct state *s ) {
+	if( s->cur < s->lim || _refill( s ) > 0 )
+		return *s->cur++;
+	return EOF;
+}
+
+
+/**
+  * Equivalent of utf8_consume_suffix on the block buffer, since a UTF-8
+  * character may straddle two blocks.
+  */
+static int _consume_suffix( struct state *s, const int n, char *buf ) {
+	for(int i = 0; i < n; i++ ) {
+		const int C = _getc( s );
+		if( C == EOF )
+			return -1;
+		buf[i] = C;
+	}
+	for(int i = 0; i < n; i++ ) {
+		// ALL UTF8 suffix bytes' MSBs should be 10xx-xxxx
+		if( ( buf[i] & 0xC0 ) != 0x80 )
+			return n;
+	}
+	return 0;
+}
 
-		if( (llen = getdelim( &_line, &_blen, s->final_line_separator, s->cache )) > 0 )
-			_analyze_line( s->analysis, _line, llen ); // ...whether empty or not!
 
+/**
+  * Word-at-a-time (SWAR) detection of bytes that end an ASCII run: any
+  * byte with its MSB set (UTF8/2+ or invalid) or equal to LF or CR.
+  */
+#define ONES  (0x0101010101010101ULL)
+#define HIGHS (0x8080808080808080ULL)
+
+static inline uint64_t _has_zero_byte( uint64_t w ) {
+	return (w - ONES) & ~w & HIGHS;
+}
+
+static inline bool _has_run_terminator( uint64_t w ) {
+	return ( w & HIGHS )
+		|| _has_zero_byte( w ^ (ONES * '\n') )
+		|| _has_zero_byte( w ^ (ONES * '\r') );
+}
+
+
+/**
+  * Returns the length of the run of non-line-terminating ASCII characters
+  * beginning at pc.
+  */
+static inline size_t _ascii_run( const unsigned char *pc, const unsigned char *lim ) {
+	const unsigned char *const START = pc;
+	uint64_t w;
+	while( pc + sizeof(w) <= lim ) {
+		memcpy( &w, pc, sizeof(w) );
+		if( _has_run_terminator( w ) )
+			break;
+		pc += sizeof(w);
+	}
+	while( pc < lim && *pc < 0x80 && *pc != '\n' && *pc != '\r' )
+		pc++;
+	return pc - START;
+}
+
+
+/**
+  * In these states check_state only acts on line terminators, so a run of
+  * non-terminating characters can be consumed without consulting it.
+  * The earlier states (_cs_infer_lineterm, _cs_discard_header) examine
+  * every character's prefix and so require _consume_char.
+  */
+static inline bool _is_run_state( const struct state *s ) {
+	return s->check_state == NULL
+		|| s->check_state == _cs_check_hint
+		|| s->check_state == _cs_acquire_sample
+		|| s->check_state == _cs_analyze_content;
+}
+
+
+/**
+  * Consume N ASCII non-line-terminating characters at s->cur in bulk.
+  * This has exactly the effect N calls of _consume_char would have.
+  */
+static int _consume_run( struct state *s, const size_t N ) {
+
+	struct table_description *d
+		= s->analysis;
+	unsigned long *T
+		= d->char_class_transition_matrix;
+
+	d->char_class_counts[ CC_CHAR ] += N;
+	if( s->nchars > 0 )
+		T[ s->cc_last*CC_COARSE_COUNT + CC_CHAR ] += 1;
+	T[ CC_CHAR*CC_COARSE_COUNT + CC_CHAR ] += N - 1;
+
+	s->nchars += N;
+	s->nbytes += N;
+	d->len     = 1;
+	d->ordinal = s->nbytes;
+	d->utf8[0] = s->cur[ N-1 ];
+	s->suffix_len = 0;
+	s->cc_curr = s->cc_last = CC_CHAR;
+
+	if( s->check_state && _cache_append( s, s->cur, N ) ) {
+		d->status = E_FILE_IO;
+		return -1;
+	}
+	s->cur += N;
+	return 0;
+}
+
+
+/**
+  * Discard everything consumed (all of which was cached, if the input is
+  * not mapped) and the format hint, and set up to consume it all again.
+  * The analysis has not yet been initialized, so it need only be zeroed.
+  */
+static int _restart( struct state *s ) {
+
+	memset( & s->hint, 0, sizeof(s->hint) );
+	s->hint_meta_seen = false;
+	memset( s->analysis, 0, sizeof(struct table_description) );
+
+	if( s->map ) {
+		s->cur = s->map;
+		s->lim = s->map + s->maplen;
+	} else {
+		const size_t CACHED  = s->nbytes;
+		const size_t PENDING = s->lim - s->cur;
+		unsigned char *block
+			= malloc( CACHED + PENDING > SCAN_BLOCK_SIZE ? CACHED + PENDING : SCAN_BLOCK_SIZE );
+		if( block == NULL )
+			return -1;
 		rewind( s->cache );
+		if( fread( block, sizeof(char), CACHED, s->cache ) != CACHED ) {
+			free( block );
+			return -1;
+		}
+		memcpy( block + CACHED, s->cur, PENDING );
+		free( s->block );
+		s->block = block;
+		s->cur = block;
+		s->lim = block + CACHED + PENDING;
+		fclose( s->cache );
+		if( (s->cache = tmpfile()) == NULL )
+			return -1;
 	}
-	return ASTAT_CONTINUE;
+
+	sspp_destroy( s->lpas );
+	if( (s->lpas = sspp_create_state( 2 )) == NULL )
+		return -1;
+
+	s->suffix_len = 0;
+	s->cc_curr = 0;
+	s->cc_last = CC_COUNT; // an invalid value
+	s->nbytes = 0;
+	s->nchars = 0;
+	s->final_line_separator = 0;
+	s->lines = 0;
+	s->llen = 0;
+	s->check_state = _cs_infer_lineterm;
+	s->state_lines = 0;
+	return 0;
+}
+
+
+/**
+  * Consume exactly one (possibly multi-byte) character. s->cur must point
+  * to at least one unconsumed byte.
+  * Returns non-zero if the scan must terminate (d->status says why).
+  */
+static int _consume_char( struct state *s ) {
+
+	struct table_description *d
+		= s->analysis;
+
+	s->suffix_len = 0;
+	*d->utf8 = *s->cur++;
+	s->nbytes ++;
+
+	// We might consume more bytes inside switch to parse UTF8/2+.
+
+	switch( *d->utf8 ) {
+	case '\n':
+		s->cc_curr = CC_LF;
+		break;
+	case '\r':
+		s->cc_curr = CC_CR;
+		break;
+	default:
+		s->cc_curr = CC_CHAR;
+		// Set up error info speculatively.
+		d->len     = 1;
+		d->ordinal = s->nbytes;
+		s->suffix_len = utf8_suffix_len( *d->utf8 );
+		if( s->suffix_len > 0 ) {
+			const int n
+				= _consume_suffix( s, s->suffix_len, d->utf8+1 );
+			if( n != 0 /* some kind of failure */ ) {
+				if( n > 0 ) {
+					d->len += n;
+					d->status = E_UTF8_SUFFIX;
+				} else
+					d->status = E_FILE_IO;
+				return -1;
+			}
+			s->nbytes += s->suffix_len;
+		} else
+		if( s->suffix_len < 0 ) {
+			d->status = E_UTF8_PREFIX;
+			return -1;
+		}
+	}
+
+	/**
+	  * One more character consisting of one OR MORE bytes has now been
+	  * fully consumed...
+	  */
+
+	s->nchars                                        += 1;
+	d->char_class_counts[ s->cc_curr + s->suffix_len ] += 1;
+
+	if( s->nchars >= 2 /* character transitions have occurred */ )
+		d->char_class_transition_matrix[ s->cc_last*CC_COARSE_COUNT + s->cc_curr ] += 1;
+
+	if( s->check_state ) {
+
+		if( _cache_append( s, d->utf8, 1+s->suffix_len ) ) {
+			d->status = E_FILE_IO;
+			return -1;
+		}
+
+		/**
+		  * ...then give the current analysis method a chance to act.
+		  * Failure is graceful--that is, failure to ascertain table
+		  * format, causes analysis to fall back to just byte content.
+		  */
+
+		const int ASTAT
+			= s->check_state( s );
+
+		if( ASTAT == ASTAT_RETRY ) {
+			if( _restart( s ) ) {
+				d->status = E_FILE_IO;
+				return -1;
+			}
+			return 0;
+		} else
+		if( ASTAT != ASTAT_CONTINUE ) {
+			s->check_state = NULL;
+			// The cache is only for analysis. If it has failed,
+			// we no longer need the cache...
+			if( s->cache ) {
+				fclose( s->cache );
+				s->cache = NULL;
+			}
+			d->status = E_NO_TABLE;
+		}
+	}
+
+	s->cc_last = s->cc_curr;
+	return 0;
+}
+
+
+/**
+  * Consume input until EOF or, if <until_content>, only until the table
+  * format has been inferred and content analysis is about to begin.
+  * The input is consumed a block (or the whole mapping) at a time. Runs of
+  * ASCII characters (other than line terminators) are counted in bulk
+  * whenever the current analysis state permits; everything else is
+  * consumed one character at a time.
+  * Returns non-zero if the scan must terminate (d->status says why).
+  */
+static int _scan( struct state *s, bool until_content ) {
+
+	while( ! ( until_content && s->check_state == _cs_analyze_content ) ) {
+
+		if( s->cur == s->lim && _refill( s ) == 0 ) {
+			if( s->fp && ferror( s->fp ) ) {
+				s->analysis->status = E_FILE_IO;
+				return -1;
+			}
+			if( s->more )
+				break; // ...until the next block is fed.
+			if( s->check_state == _cs_check_hint
+					&& s->state_lines == HINT_CHECK_LINES ) {
+				// No data line confirmed the hint before EOF.
+				if( _restart( s ) ) {
+					s->analysis->status = E_FILE_IO;
+					return -1;
+				}
+				continue;
+			}
+			break; // EOF
+		}
+
+		if( _is_run_state( s ) ) {
+			const size_t N
+				= _ascii_run( s->cur, s->lim );
+			if( N > 0 ) {
+				if( _consume_run( s, N ) )
+					return -1;
+				continue;
+			}
+		}
+
+		if( _consume_char( s ) )
+			return -1;
+	}
+	return 0;
+}
+
+
+/**
+  * A line-aligned part of a mapped file scanned (possibly by a thread of
+  * its own) into a private table_description.
+  */
+struct chunk {
+	struct state s;
+	struct table_description d;
+	pthread_t thread;
+	bool started;
+	int failed;
+};
+
+static void *_scan_chunk( void *arg ) {
+	struct chunk *c = arg;
+	c->failed = _scan( & c->s, false );
+	return NULL;
+}
+
+
+/**
+  * Prepare c to scan [start,end) of s's mapping with the table format s
+  * inferred. Both bounds must be the starts of lines (or end the mapping).
+  */
+static int _chunk_init( struct chunk *c, const struct state *s,
+		const unsigned char *start, const unsigned char *end ) {
+
+	const size_t PAGE
+		= sysconf( _SC_PAGESIZE );
+
+	memset( c, 0, sizeof(struct chunk) );
+	c->d.table = s->analysis->table;
+	if( _init_analysis( & c->d ) )
+		return -1;
+
+	c->s.analysis = & c->d;
+	c->s.check_state = _cs_analyze_content;
+	c->s.final_line_separator = s->final_line_separator;
+	c->s.map      = s->map;
+	c->s.maplen   = s->maplen;
+	c->s.cur      = start;
+	c->s.lim      = end;
+	c->s.nbytes   = start - s->map;
+	c->s.released = c->s.nbytes / PAGE * PAGE;
+	c->s.drop_cache = s->drop_cache;
+	c->s.fd       = s->fd;
+	// The chunk's first character follows a line terminator. Counting
+	// a fictitious preceding character lets the chunk itself count the
+	// transition; _merge_chunk discounts it.
+	c->s.nchars   = 1;
+	c->s.cc_last  = start[-1] == '\n' ? CC_LF : CC_CR;
+	c->s.cc_curr  = c->s.cc_last;
+	return 0;
+}
+
+
+/**
+  * Fold the results of a chunk into the scan.
+  * All character counts are additive. The transition into the chunk's first
+  * character was counted by the chunk itself (its .cc_last was the class of
+  * the preceding line terminator).
+  * Returns non-zero if the chunk terminated the scan.
+  */
+static int _merge_chunk( struct state *s, struct chunk *c ) {
+
+	struct table_description *d
+		= s->analysis;
+
+	for(int i = 0; i < CC_COUNT; i++ )
+		d->char_class_counts[i] += c->d.char_class_counts[i];
+	for(int i = 0; i < CC_COARSE_COUNT*CC_COARSE_COUNT; i++ )
+		d->char_class_transition_matrix[i] += c->d.char_class_transition_matrix[i];
+	s->nchars += c->s.nchars - 1; // ...see _chunk_init.
+
+	if( s->check_state ) {
+		if( c->s.check_state ) {
+			s->lines += c->s.lines;
+			_merge_analysis( d, & c->d );
+		} else {
+			// Analysis of the chunk failed, so analysis of the file has.
+			s->check_state = NULL;
+			d->status = E_NO_TABLE;
+		}
+	}
+
+	if( c->failed ) {
+		memcpy( d->utf8, c->d.utf8, sizeof(d->utf8) );
+		d->len     = c->d.len;
+		d->ordinal = c->d.ordinal;
+		d->status  = c->d.status;
+		return -1;
+	}
+	return 0;
 }
 
 
+/**
+  * Scan n initialized chunks on threads of their own while the calling
+  * thread scans whatever remains of s's own part of the mapping (which
+  * precedes all the chunks), then merge the chunks into s in order and
+  * release them.
+  * Returns non-zero if any part terminated the scan, in which case chunks
+  * following it are not merged.
+  */
+static int _scan_chunks( struct state *s, struct chunk *chunk, int n ) {
+
+	int failed;
+
+	for(int i = 0; i < n; i++ )
+		chunk[i].started
+			= pthread_create( & chunk[i].thread, NULL, _scan_chunk, chunk + i ) == 0;
+
+	failed = _scan( s, false );
+
+	for(int i = 0; i < n; i++ ) {
+		struct chunk *c
+			= chunk + i;
+		if( c->started )
+			pthread_join( c->thread, NULL );
+		else
+			_scan_chunk( c ); // ...no thread was available, so do it here.
+		if( ! failed )
+			failed = _merge_chunk( s, c );
+		free( c->s.line );
+		tabular_free( & c->d );
+	}
+	return failed;
+}
+
+
+/**
+  * If the table format has been inferred and enough of the mapping remains,
+  * split the remainder at line boundaries into (at most) <threads> parts.
+  * The first is scanned by the calling thread with s itself, the others as
+  * chunks (see _scan_chunks). Accumulators are merged in file order, so the
+  * result is that of a serial scan up to the order of operations (see
+  * merge_column).
+  * Thus, on return, either the whole mapping has been consumed or the scan
+  * must terminate (non-zero return, d->status says why). If the remainder
+  * cannot be (usefully) split, nothing is done and the caller carries on
+  * serially.
+  */
+static int _scan_parallel( struct state *s, int threads ) {
+
+	const unsigned char *const END
+		= s->map + s->maplen;
+	const size_t REMAINING
+		= END - s->cur;
+	struct chunk *chunk;
+	int n = 0, failed;
+
+	if( s->check_state != _cs_analyze_content )
+		return 0;
+	if( (size_t)threads > REMAINING / MIN_CHUNK_SIZE )
+		threads = REMAINING / MIN_CHUNK_SIZE;
+	if( threads < 2 )
+		return 0;
+
+	chunk = calloc( threads - 1, sizeof(struct chunk) );
+	if( chunk == NULL )
+		return 0;
+
+	/**
+	  * Chunks begin immediately after a line's final separator, so every
+	  * chunk consists of whole lines (except, possibly, the last line of
+	  * the file) and no UTF8 character straddles two chunks.
+	  */
+
+	for(int i = 1; i < threads; i++ ) {
+
+		const unsigned char *pc
+			= s->cur + REMAINING / threads * i;
+		const unsigned char *eol;
+
+		if( n > 0 && pc < chunk[n-1].s.cur )
+			pc = chunk[n-1].s.cur;
+		eol = memchr( pc, s->final_line_separator, END - pc );
+		if( eol == NULL || eol + 1 == END )
+			break;
+		if( _chunk_init( chunk + n, s, eol + 1, END ) )
+			break;
+		if( n > 0 )
+			chunk[n-1].s.lim = eol + 1;
+		n++;
+	}
+
+	if( n > 0 ) {
+		s->lim = chunk[0].s.cur;
+		failed = _scan_chunks( s, chunk, n );
+		s->cur = s->lim = END;
+		s->nbytes = s->maplen;
+	} else
+		failed = 0;
+
+	free( chunk );
+	return failed;
+}
+
+
+/**
+  * Returns the start of the first line beginning at or after p, where
+  * <start> is known to begin a line.
+  */
+static const unsigned char *_line_start( const struct state *s,
+		const unsigned char *start, const unsigned char *p ) {
+
+	const unsigned char *const END
+		= s->map + s->maplen;
+	const unsigned char *eol;
+
+	if( p == start || p == END )
+		return p;
+	eol = memchr( p - 1, s->final_line_separator, END - (p - 1) );
+	return eol ? eol + 1 : END;
+}
+
+
+/**
+  * splitmix64: a tiny, seedable generator that is identical on every
+  * platform, so a seed always selects the same sample.
+  */
+static uint64_t _next_random( uint64_t *state ) {
+	uint64_t z = ( *state += 0x9E3779B97F4A7C15ULL );
+	z = ( z ^ (z >> 30) ) * 0xBF58476D1CE4E5B9ULL;
+	z = ( z ^ (z >> 27) ) * 0x94D049BB133111EBULL;
+	return z ^ (z >> 31);
+}
+
+
+/**
+  * Rather than scanning all of a large mapping following the lines from
+  * which the table format was inferred, scan SAMPLE_BLOCK_SIZE blocks of it
+  * in a random order determined by o->sample_seed until every column's
+  * statistics have converged (see _analysis_converged) on SAMPLE_STABLE_CHECKS
+  * consecutive checks. A check follows each batch of o->threads blocks,
+  * which are scanned concurrently (see _scan_chunks).
+  * Blocks tile the mapping and are extended to line boundaries such that
+  * each line belongs to exactly one; scanning every block is equivalent
+  * to scanning the whole.
+  * The count of bytes never scanned is left in s->skipped. As for
+  * _scan_parallel, if nothing is done the caller carries on serially.
+  */
+static int _scan_sampled( struct state *s, const struct scan_options *o ) {
+
+	const unsigned char *const START
+		= s->cur;
+	const unsigned char *const END
+		= s->map + s->maplen;
+	const size_t BLOCKS
+		= ( END - START + SAMPLE_BLOCK_SIZE - 1 ) / SAMPLE_BLOCK_SIZE;
+	const int THREADS
+		= o->threads > 1 ? o->threads : 1;
+	struct table_description *d
+		= s->analysis;
+	size_t *order = NULL;
+	struct column *prior = NULL;
+	struct chunk *chunk = NULL;
+	size_t next = 0, scanned = 0;
+	int stable = 0, failed = 0;
+
+	if( s->check_state != _cs_analyze_content || BLOCKS < 2*MIN_SAMPLE_BLOCKS )
+		return 0;
+
+	order = malloc( BLOCKS * sizeof(size_t) );
+	prior = calloc( d->table.column_count, sizeof(struct column) );
+	chunk = calloc( THREADS, sizeof(struct chunk) );
+	if( order == NULL || prior == NULL || chunk == NULL )
+		goto leave;
+
+	{
+		// Fisher-Yates shuffle of the block indices
+		uint64_t random = o->sample_seed;
+		for(size_t i = 0; i < BLOCKS; i++ )
+			order[i] = i;
+		for(size_t i = BLOCKS - 1; i > 0; i-- ) {
+			const size_t j = _next_random( &random ) % (i + 1);
+			const size_t t = order[i];
+			order[i] = order[j];
+			order[j] = t;
+		}
+	}
+
+	_analysis_converged( d, prior, o->sample_tolerance ); // ...to initialize prior.
+	s->lim = s->cur; // All blocks are scanned as chunks.
+
+	while( next < BLOCKS && stable < SAMPLE_STABLE_CHECKS ) {
+
+		int n = 0;
+
+		while( n < THREADS && next < BLOCKS ) {
+			const size_t OFF
+				= order[ next++ ] * SAMPLE_BLOCK_SIZE;
+			const unsigned char *lo
+				= _line_start( s, START, START + OFF );
+			const unsigned char *hi
+				= _line_start( s, START,
+					OFF + SAMPLE_BLOCK_SIZE < (size_t)(END - START)
+					? START + OFF + SAMPLE_BLOCK_SIZE
+					: END );
+			if( lo < hi && _chunk_init( chunk + n, s, lo, hi ) == 0 ) {
+				scanned += hi - lo;
+				n++;
+			}
+		}
+
+		if( _scan_chunks( s, chunk, n ) ) {
+			failed = -1;
+			break;
+		}
+		if( s->check_state == NULL )
+			break; // Analysis failed; the sample is all there will be.
+
+		if( _analysis_converged( d, prior, o->sample_tolerance )
+				&& next >= MIN_SAMPLE_BLOCKS )
+			stable++;
+		else
+			stable = 0;
+	}
+
+leave:
+	free( order );
+	free( prior );
+	free( chunk );
+
+	if( next > 0 /* sampling was actually carried out */ ) {
+		s->skipped = (END - START) - scanned;
+		s->cur = s->lim = END;
+		s->nbytes = s->maplen;
+	}
+	return failed;
+}
+
+
+#ifdef _POSIX_MAPPED_FILES
+/**
+  * Map fp if it is a (non-empty) regular file positioned at its start.
+  * Otherwise (pipes, decompressing streams, etc.) it is read in blocks.
+  */
+static bool _map_input( struct state *s ) {
+
+	struct stat st;
+	void *p;
+	const int FD
+		= fileno( s->fp );
+
+	if( FD < 0 || fstat( FD, &st ) || ! S_ISREG( st.st_mode ) || st.st_size <= 0 )
+		return false;
+	if( ftello( s->fp ) != 0 )
+		return false;
+
+	p = mmap( NULL, st.st_size, PROT_READ, MAP_PRIVATE, FD, 0 );
+	if( p == MAP_FAILED )
+		return false;
+	madvise( p, st.st_size, MADV_SEQUENTIAL );
+
+	s->map    = p;
+	s->maplen = st.st_size;
+	s->cur    = s->map;
+	s->lim    = s->map + s->maplen;
+	return true;
+}
+#endif
+
+
 /**
   * This is the primary entry point for tabular file analysis.
   * The <analysis> parameter should point to a zeroed struct.
+  * All scan state lives on this function's stack (and in <analysis>), so
+  * concurrent calls on different files from different threads are safe.
   *
   * Count and classify characters and transitions between character classes
   * in a byte stream assumed to represent UTF8-encoded text.
@@ -430,6 +1509,13 @@ static int _cs_analyze_content( struct state *s ) {
   *		with only character content					JSON
   *		with character content and table analysis	JSON
   *
+  * Options (which may be NULL) only affect mapped files, and then only the
+  * part of the file following the lines from which the table format is
+  * inferred:
+  * 1. If o->sample_tolerance > 0 that part is sampled (see _scan_sampled).
+  * 2. Otherwise, if o->threads > 1 it is split at line boundaries and
+  *    scanned by that many threads (see _scan_parallel).
+  *
   * Returns:
   *  EXIT_SUCCESS
   *    if at least some analysis was completed and output is expected to
@@ -437,163 +1523,281 @@ static int _cs_analyze_content( struct state *s ) {
   *  EXIT_FAILURE
   *    otherwise 
   */
-int tabular_scan( FILE *fp, struct table_description *d /* out */ ) {
+/**
+  * Verify output container is empty before allocating anything.
+  * Yes, I could simply zero it here, but it contains pointers to heap-
+  * allocated elements, the validity of which can't be ascertained here.
+  * Thus, it's caller's responsibility to insure it's initialized...and
+  * our responsibility to trust but verify.
+  */
+static bool _is_zeroed( struct table_description *d ) {
+	int i = sizeof(struct table_description);
+	const char *raw = (const char *)d;
+	while( i-- > 0 ) {
+		if( *raw++ ) {
+			d->status = E_UNINITIALIZED_OUTPUT;
+			return false;
+		}
+	}
+	return true;
+}
 
-	static struct state s;
-	memset( &s, 0, sizeof(s) );
 
-	/**
-	  * Verify output container is empty before allocating anything.
-	  * Yes, I could simply zero it here, but it contains pointers to heap-
-	  * allocated elements, the validity of which can't be ascertained here.
-	  * Thus, it's caller's responsibility to insure it's initialized...and
-	  * our responsibility to trust but verify.
-	  */
-	{
-		int i = sizeof(struct table_description);
-		const char *raw = (const char *)d;
-		while( i-- > 0 ) {
-			if( *raw++ ) {
-				d->status = E_UNINITIALIZED_OUTPUT;
-				return EXIT_FAILURE; // This is the ONLY early return!
-			}
+/**
+  * Prepare to consume the first character; the input must already be set
+  * up.
+  */
+static void _begin( struct state *s, const struct scan_options *o, struct table_description *d ) {
+	s->cc_last = CC_COUNT;  // an invalid value
+	s->check_state = _cs_infer_lineterm;
+	s->lpas = sspp_create_state( 2 );
+	s->analysis = d;
+	if( o && o->hint )
+		s->hint = *o->hint;
+	// Decompressing streams (which have no descriptor) drop their own.
+	if( o && o->drop_cache && s->fp && fileno( s->fp ) >= 0 ) {
+		s->drop_cache = true;
+		s->fd = fileno( s->fp );
+	}
+}
+
+
+/**
+  * Complete the analysis once all input has been consumed.
+  */
+static void _end( struct state *s ) {
+
+	struct table_description *d
+		= s->analysis;
+
+	if( s->check_state /* If we didn't abort analysis... */ ) {
+		/** ...but we didn't reach the actual analysis phase,
+		  * do it now...
+		  */
+		if( s->check_state != _cs_analyze_content ) {
+			if( _analyze_top_lines( s ) != ASTAT_CONTINUE )
+				s->check_state = NULL;
 		}
 	}
 
-	s.cc_last = CC_COUNT;  // an invalid value
-	s.cache = tmpfile();
-	s.check_state = _cs_infer_lineterm;
-	s.lpas = sspp_create_state( 2 );
-	s.analysis = d;
+	if( s->check_state /* If we didn't abort analysis... */ ) {
+		_fini_analysis( d );
+	}
 
-	do {
-		s.suffix_len = 0;
-		*s.analysis->utf8 = fgetc( fp );
+	/**
+	  * Check invariants
+	  */
 
-		if( feof(fp) )
-			break;
-		if( ferror(fp) ) {
+	assert( (d->table.column_separator[0] != 0) == (d->table.column_count > 0) );
+	assert( s->check_state == NULL /* we aborted analysis */ ||
+			( s->lines == d->rows.empty
+			  + d->rows.meta
+			  + d->rows.data ) );
+}
+
+
+/**
+  * Release everything but the analysis. This may be called repeatedly.
+  */
+static void _release( struct state *s ) {
+
+	if( s->block )
+		free( s->block );
+	s->block = NULL;
+
+#ifdef _POSIX_MAPPED_FILES
+	if( s->map )
+		munmap( s->map, s->maplen );
+	s->map = NULL;
+#endif
+
+	if( s->line )
+		free( s->line );
+	s->line = NULL;
+
+	if( s->cache )
+		fclose( s->cache );
+	s->cache = NULL;
+
+	if( s->lpas )
+		sspp_destroy( s->lpas );
+	s->lpas = NULL;
+}
+
+
+int tabular_scan_ex( FILE *fp, const struct scan_options *o, struct table_description *d /* out */ ) {
+
+	struct state s;
+	memset( &s, 0, sizeof(s) );
+
+	if( ! _is_zeroed( d ) )
+		return EXIT_FAILURE; // This is the ONLY early return!
+
+	s.fp = fp;
+#ifdef _POSIX_MAPPED_FILES
+	if( ! _map_input( &s ) )
+#endif
+	{
+		s.block = malloc( SCAN_BLOCK_SIZE );
+		if( s.block == NULL ) {
 			d->status = E_FILE_IO;
 			goto leave;
 		}
+		s.cache = tmpfile();
+	}
+	_begin( &s, o, d );
 
-		s.nbytes ++;
-
-		// We might consume more bytes inside switch to parse UTF8/2+.
+	/**
+	  * The table format is inferred from the head of the file; if the rest
+	  * of a mapped file is large enough it is then sampled or scanned in
+	  * parallel.
+	  */
 
-		switch( *s.analysis->utf8 ) {
-		case '\n':
-			s.cc_curr = CC_LF;
-			break;
-		case '\r':
-			s.cc_curr = CC_CR;
-			break;
-		default:
-			s.cc_curr = CC_CHAR;
-			// Set up error info speculatively.
-			d->len     = 1;
-			d->ordinal = s.nbytes;
-			s.suffix_len = utf8_suffix_len( *s.analysis->utf8 );
-			if( s.suffix_len > 0 ) {
-				const int n
-					= utf8_consume_suffix( s.suffix_len, fp, s.analysis->utf8+1 );
-				if( n != 0 /* some kind of failure */ ) {
-					if( n > 0 ) {
-						d->len += n;
-						d->status = E_UTF8_SUFFIX;
-					} else
-						d->status = E_FILE_IO;
-					goto leave;
-				}
-				s.nbytes += s.suffix_len;
-			} else
-			if( s.suffix_len < 0 ) {
-				d->status = E_UTF8_PREFIX;
+	if( o && s.map ) {
+		if( o->sample_tolerance > 0 ) {
+			if( _scan( &s, true ) || _scan_sampled( &s, o ) )
+				goto leave;
+		} else
+		if( o->threads > 1 ) {
+			if( _scan( &s, true ) || _scan_parallel( &s, o->threads ) )
 				goto leave;
-			}
 		}
+	}
 
-		/**
-		  * One more character consisting of one OR MORE bytes has now been
-		  * fully consumed...
-		  */
+	if( _scan( &s, false ) )
+		goto leave;
 
-		s.nchars                                                += 1;
-		d->char_class_counts[ s.cc_curr + s.suffix_len ] += 1;
+	_end( &s );
 
-		if( s.nchars >= 2 /* character transitions have occurred */ )
-			d->char_class_transition_matrix[ s.cc_last*CC_COARSE_COUNT + s.cc_curr ] += 1;
+leave:
+	d->sampled_fraction
+		= s.map ? 1.0 - (double)s.skipped / s.maplen : 1.0;
 
-		if( s.cache ) {
+	_release( &s );
 
-			const int N = 1+s.suffix_len;
-			if( fwrite( s.analysis->utf8, sizeof(char), N, s.cache ) != N ) {
-				d->status = E_FILE_IO;
-				goto leave;
-			}
+	return d->status < E_FILE_IO ? EXIT_SUCCESS : EXIT_FAILURE;
+}
 
-			/**
-			  * ...then give the current analysis method a chance to act.
-			  * Failure is graceful--that is, failure to ascertain table
-			  * format, causes analysis to fall back to just byte content.
-			  */
 
-			if( s.check_state( &s ) != ASTAT_CONTINUE ) {
-				s.check_state = NULL;
-				// The cache is only for analysis. If it has failed,
-				// we no longer need the cache...
-				fclose( s.cache );
-				s.cache = NULL;
-				d->status = E_NO_TABLE;
-			}
-		}
+/**
+  * The state of a scan of fed input, and the leading bytes of a UTF-8
+  * character split between fed buffers (which are consumed only once the
+  * character is complete, so that the scan never awaits input mid-
+  * character).
+  */
+struct tabular_scanner {
+	struct state s;
+	unsigned char pending[4];
+	int npending;
+	bool stopped; // ...by an error or tabular_scanner_finish.
+};
 
-		s.cc_last = s.cc_curr;
 
-	} while( 1 );
+struct tabular_scanner *tabular_scanner_create( const struct scan_options *o, struct table_description *d ) {
 
-	if( s.check_state /* If we didn't abort analysis... */ ) {
-		/** ...but we didn't reach the actual analysis phase,
-		  * do it now...
-		  */
-		if( s.check_state != _cs_analyze_content ) {
-			if( _analyze_top_lines( &s ) != ASTAT_CONTINUE )
-				s.check_state = NULL;
-		}
+	struct tabular_scanner *t;
+
+	if( ! _is_zeroed( d ) )
+		return NULL;
+
+	if( (t = calloc( 1, sizeof(struct tabular_scanner) )) == NULL )
+		return NULL;
+
+	t->s.more = true;
+	t->s.cache = tmpfile();
+	_begin( & t->s, o, d );
+
+	if( t->s.cache == NULL || t->s.lpas == NULL ) {
+		tabular_scanner_destroy( t );
+		return NULL;
 	}
+	return t;
+}
 
-	if( s.check_state /* If we didn't abort analysis... */ ) {
-		_fini_analysis( d );
+
+static int _scan_fed( struct tabular_scanner *t, const unsigned char *buf, size_t len ) {
+	t->s.cur = buf;
+	t->s.lim = buf + len;
+	if( _scan( & t->s, false ) ) {
+		t->stopped = true;
+		return -1;
+	}
+	return 0;
+}
+
+
+int tabular_scanner_feed( struct tabular_scanner *t, const void *buf, size_t len ) {
+
+	const unsigned char *pc = buf;
+	size_t held = 0;
+
+	if( t->stopped )
+		return -1;
+
+	if( t->npending > 0 ) {
+		const int N
+			= 1 + utf8_suffix_len( t->pending[0] );
+		while( t->npending < N && len > 0 ) {
+			t->pending[ t->npending++ ] = *pc++;
+			len--;
+		}
+		if( t->npending < N )
+			return 0;
+		t->npending = 0;
+		if( _scan_fed( t, t->pending, N ) )
+			return -1;
 	}
 
 	/**
-	  * Check invariants
+	  * Hold back a trailing, incomplete UTF-8 character. (Invalid bytes
+	  * are consumed as they come, and fail as they would in a file.)
 	  */
 
-	assert( (d->table.column_separator[0] != 0) == (d->table.column_count > 0) );
-	assert( s.check_state == NULL /* we aborted analysis */ ||
-			( s.lines == d->rows.empty
-			  + d->rows.meta
-			  + d->rows.data ) );
-leave:
-	if( _line )
-		free( _line );
+	for(size_t i = 1; i <= 3 && i <= len; i++ ) {
+		const int C = pc[ len - i ];
+		if( ( C & 0xC0 ) != 0x80 /* not a suffix byte */ ) {
+			if( utf8_suffix_len( C ) >= (int)i )
+				held = i;
+			break;
+		}
+	}
+	memcpy( t->pending, pc + len - held, held );
+	t->npending = held;
+
+	return _scan_fed( t, pc, len - held );
+}
 
-	if( s.cache )
-		fclose( s.cache );
 
-	if( s.lpas )
-		sspp_destroy( s.lpas );
+int tabular_scanner_finish( struct tabular_scanner *t ) {
 
-	// In case this is used in context of a library in which case BSS might
-	// NOT be reinitialized before another call to scan...
-	_line = NULL;
-	_blen = 0;
+	struct table_description *d
+		= t->s.analysis;
+
+	if( ! t->stopped ) {
+		t->s.more = false;
+		// An incomplete character at EOF fails just as it would in a file.
+		if( _scan_fed( t, t->pending, t->npending ) == 0 )
+			_end( & t->s );
+		t->stopped = true;
+	}
+	d->sampled_fraction = 1.0;
+	_release( & t->s );
 
 	return d->status < E_FILE_IO ? EXIT_SUCCESS : EXIT_FAILURE;
 }
 
 
+void tabular_scanner_destroy( struct tabular_scanner *t ) {
+	_release( & t->s );
+	free( t );
+}
+
+
+int tabular_scan( FILE *fp, struct table_description *d /* out */ ) {
+	return tabular_scan_ex( fp, NULL, d );
+}
+
+
 int tabular_error( struct table_description *d, int len, char *buf ) {
 	int n = 0;
 	const char *template = _error_template[ d->status ];
@@ -11,11 +11,19 @@
 #include <assert.h>
 
 #include "strset.h"
+#include "arena.h"
 
 struct entry {
 
 	const char *str;
 
+	/**
+	  * The string's hash is cached so that probes can usually reject
+	  * occupied entries without a strcmp, and so that growing the table
+	  * never re-hashes strings.
+	  */
+	unsigned int hash;
+
 #ifdef HAVE_BAG
 	/**
 	  * A "bag" is a set which allows duplicates, so a set can
@@ -43,31 +51,22 @@ static int _power_of_2_upper_bound( int v ) {
 
 #ifdef HAVE_SET_GROW
 /**
-  * Rehash all valid entries in the entry array. There is no reason why 
-  * every entry that fit in the previous (half-sized) table should not go
-  * in the new table.
-  * Warning: Disable strdup'ing temporarily
+  * Re-place all valid entries of the entry array by their cached hashes.
+  * Every entry that fit in the previous (half-sized) table fits in the new
+  * one, and the strings (which the table may own) are neither re-hashed,
+  * re-compared nor re-duplicated; entries are simply moved.
   */
-static int _rehash( struct entry *cur, int n, struct strset *t ) {
-	int error = 0;
-	// Turn OFF string duplicating while rehashing...
-	const int DUPING = s->dup;
-	s->dup = 0;
-	// ...because either:
-	// 1. we weren't duplicating anyway, or
-	// 2. we're rehashing strings already duplicated once that we own!
-	// set_insert doesn't know which of these is true; but we do here.
+static int _rehash( struct entry *cur, int n, struct strset *s ) {
 	for(int i = 0; i < n; i++ ) {
 		if( cur[i].str != NULL ) {
-			if( set_insert( t, cur[i].str, NULL ) != SZS_ADDED ) {
-				error = -1;
-				break;
-			}
+			int pos = cur[i].hash & s->mask;
+			while( ENTRY_IS_OCCUPIED(s,pos) )
+				pos = (pos + 1) & s->mask;
+			s->array[pos] = cur[i];
+			s->occupancy += 1;
 		}
 	}
-	// WARNING: Don't return without resetting s->dup!
-	s->dup = DUPING;
-	return error;
+	return 0;
 }
 #endif
 
@@ -122,6 +121,11 @@ int set_init( struct strset *s, unsigned int max, int dup, string_hash_fx fxn, u
 	return -1;
 }
 
+void set_use_arena( struct strset *s, struct arena *a ) {
+	s->arena = a;
+}
+
+
 #ifdef HAVE_SET_GROW
 /**
   * Doubles the capacity of the table.
@@ -147,7 +151,7 @@ int set_grow( struct strset *s ) {
 		s->capacity *= 2;
 		s->mask = (s->capacity-1);
 
-		if( _rehash( cur, CAPACITY, t ) ) {
+		if( _rehash( cur, CAPACITY, s ) ) {
 			// On failure reset everything to its original state.
 			free( s->array );
 			s->occupancy = OCCUPANCY;
@@ -188,8 +192,9 @@ int set_insert( struct strset *s, const char *str ) {
 
 		// Find either an empty slot or a slot with the same key.
 
-		while( ENTRY_IS_OCCUPIED(s,pos) && strcmp( s->array[pos].str, str ) ) {
-			pos = (pos + 1) % s->capacity;
+		while( ENTRY_IS_OCCUPIED(s,pos)
+				&& ( s->array[pos].hash != K || strcmp( s->array[pos].str, str ) ) ) {
+			pos = (pos + 1) & s->mask;
 			if( pos == IDEAL )
 				break;
 		}
@@ -199,11 +204,14 @@ int set_insert( struct strset *s, const char *str ) {
 		ent->count += 1; // ...whatever it's current occupancy state.
 #endif
 		if( ENTRY_IS_EMPTY(s,pos) ) {
-			ent->str    = s->dup ? strdup(str) : str;
+			ent->str    = s->dup
+				? ( s->arena ? arena_strndup( s->arena, str, L ) : strdup(str) )
+				: str;
+			ent->hash   = K;
 			s->occupancy += 1;
 			return SZS_ADDED;
 		} else
-		if( strcmp( ent->str, str ) == 0 ) {
+		if( ent->hash == K && strcmp( ent->str, str ) == 0 ) {
 			return SZS_PRESENT;
 		}
 	} else
@@ -258,10 +266,10 @@ int set_count( const struct strset *s ) {
 
 /**
   * Frees strings owned by the table--that is, those that were copied on
-  * insertion--and NULLs all pointers.
+  * insertion, unless into an arena--and NULLs all pointers.
   */
 void set_clear( struct strset *s ) {
-	if( s->dup ) {
+	if( s->dup && s->arena == NULL ) {
 		for(int i = 0; i < s->capacity; i++ ) {
 			if( s->array[i].str ) {
 				free( (void*)(s->array[i].str) );
@@ -350,6 +358,7 @@ int main( int argc, char *argv[] ) {
 	size_t blen = 0;
 	ssize_t llen;
 	struct strset *s;
+	struct arena *arena = NULL;
 
 	if( NULL == fp ) {
 		fprintf( stderr, "no input\n" );
@@ -357,6 +366,8 @@ int main( int argc, char *argv[] ) {
 	}
 
 	s = set_create( CAP, DUP, murmur3_32, 17 );
+	if( getenv("ARENA") )
+		set_use_arena( s, arena = arena_create() );
 
 	while( exit_status == 0 
 			&& (llen = getline( &line, &blen, fp )) > 0 ) {
@@ -417,6 +428,7 @@ retry:
 
 EXIT:
 	set_destroy( s );
+	arena_destroy( arena );
 	return exit_status;
 }
 
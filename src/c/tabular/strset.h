@@ -5,6 +5,7 @@
 typedef unsigned int (*string_hash_fx)(const char *str, uint32_t len, uint32_t seed );
 
 struct entry;
+struct arena;
 
 /**
   * This is publicly declared only so that its size may be determined
@@ -32,6 +33,12 @@ struct strset {
 	  */
 	int dup;
 
+	/**
+	  * If non-NULL (and dup), duplicates are allocated from this arena
+	  * instead, and are released only with the arena.
+	  */
+	struct arena *arena;
+
 	/**
 	  * The hashing function and seed, provided by client.
 	  */
@@ -58,6 +65,11 @@ struct strset *set_create( unsigned int max, int dup, string_hash_fx fxn, uint32
   */
 int set_init( struct strset *, unsigned int max, int dup, string_hash_fx fxn, unsigned int seed );
 
+/**
+  * Allocate duplicated strings from <arena>, which must outlive the set.
+  */
+void set_use_arena( struct strset *, struct arena * );
+
 #define SZS_ADDED          (+1)
 #define SZS_PRESENT        ( 0)
 #define SZS_ZERO_KEY       (-1)
@@ -90,7 +102,7 @@ int    set_next( const struct strset *, void **, const char ** /* out */);
 
 /**
   * Clears the content without freeing the array. Memory allocated for
-  * individual strings -is- released.
+  * individual strings -is- released (unless it belongs to an arena).
   * This is expressly to reuse existing array for new content.
   */
 void   set_clear( struct strset * );
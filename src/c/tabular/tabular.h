@@ -10,6 +10,7 @@
   * Forward decls
   */
 struct column;
+struct arena;
 
 /**
   * These character class labels are used to index two histograms:
@@ -114,6 +115,17 @@ struct format {
 	char column_separator[8];
 	bool column_separator_is_regex;
 
+	/**
+	  * True if fields are RFC4180-quoted (column_separator is then ",").
+	  */
+	bool quoted;
+
+	/**
+	  * The line terminator inferred from the first line: one of "\n",
+	  * "\r", "\r\n" or "\n\r".
+	  */
+	char line_terminator[3];
+
 	/**
 	  * The fields per line.
 	  */
@@ -199,6 +211,19 @@ struct table_description {
 	  * but this one member is dynamically allocated and must be freed!
 	  */
 	struct column *column;
+
+	/**
+	  * Backs the (copies of) strings in all columns' value sets, so they
+	  * are released together, and along with column, by tabular_free.
+	  */
+	struct arena *arena;
+
+	/**
+	  * The fraction of the file's bytes that were scanned; less than 1
+	  * only if the file was sampled, in which case all counts (including
+	  * character counts) describe only the sample.
+	  */
+	double sampled_fraction;
 };
 
 /**
@@ -206,6 +231,80 @@ struct table_description {
   */
 int tabular_scan( FILE *fp, struct table_description *summary );
 
+/**
+  * Optional behavior of tabular_scan_ex. Except for the hint, all of it
+  * applies only to (large enough) regular files and only once the table
+  * format is known; a zeroed struct is equivalent to tabular_scan.
+  */
+struct scan_options {
+
+	/**
+	  * The count of threads that may scan (parts of) the file.
+	  */
+	int threads;
+
+	/**
+	  * If non-zero, the file is sampled in randomly-chosen, line-aligned
+	  * blocks rather than scanned in full. Sampling stops once no column's
+	  * mean, variance or type vote proportions change (relative to its
+	  * standard deviation, variance and 1, respectively) by more than
+	  * this between successive blocks.
+	  */
+	double sample_tolerance;
+
+	/**
+	  * The same seed always selects the same sample of a file.
+	  */
+	unsigned sample_seed;
+
+	/**
+	  * If non-NULL, a format (e.g. inferred from another file of the same
+	  * collection and completed by tabular_resolve_format) that is checked
+	  * against the first data lines and, if they match it, used instead of
+	  * inferring one. This applies to all files, mapped or not. If the
+	  * lines contradict it, the scan restarts without it.
+	  */
+	const struct format *hint;
+
+	/**
+	  * If true, the file's pages are released from the page cache (by
+	  * posix_fadvise, where available) as the scan passes them, so that
+	  * scanning many large files doesn't evict everything else cached.
+	  */
+	bool drop_cache;
+};
+
+int tabular_scan_ex( FILE *fp, const struct scan_options *, struct table_description *summary );
+
+/**
+  * An incremental scan of input fed in buffers of any size (e.g. from a
+  * pipe, decompressor or archive member) rather than read from a FILE.
+  * Given the same bytes the results are the same as tabular_scan_ex's
+  * for a stream, and so are the scan_options that apply: only the hint.
+  * tabular_scanner_create returns NULL if <summary> is not zeroed (when
+  * its status is set as by tabular_scan) or memory is exhausted.
+  * tabular_scanner_feed scans buf[0,len) before returning and retains no
+  * reference to it. It returns non-zero once an error has stopped the
+  * scan (the status is in <summary>) or after tabular_scanner_finish.
+  * tabular_scanner_finish completes <summary> and returns as tabular_scan
+  * does; only tabular_scanner_destroy may follow it. Scanners share
+  * nothing, but each must be used by one thread at a time.
+  */
+struct tabular_scanner;
+
+struct tabular_scanner *tabular_scanner_create( const struct scan_options *, struct table_description *summary );
+int  tabular_scanner_feed( struct tabular_scanner *, const void *buf, size_t len );
+int  tabular_scanner_finish( struct tabular_scanner * );
+void tabular_scanner_destroy( struct tabular_scanner * );
+
+/**
+  * Complete a format of which only the separator (and whether it is a regex
+  * or quoted), column count, metadata prefix and line terminator are set,
+  * so that it may serve as a scan_options.hint. Returns non-zero if these
+  * describe no format tabular_scan could have inferred.
+  */
+int tabular_resolve_format( struct format * );
+
 /**
   * Even though struct table_description may be allocated on the stack, the
   * struct contains dynamically-allocated members which require cleanup!
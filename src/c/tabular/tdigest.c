@@ -0,0 +1,287 @@
+
+/**
+  * Buffered values are sorted and merged into the (sorted) centroids
+  * whenever the buffer fills, so the cost per value is a constant share of
+  * sorting TDIGEST_BUFFER values and one pass over the centroids. Merging uses the k1 scale function,
+  *
+  *		k(q) = delta/(2 pi) * asin(2q - 1)
+  *
+  * allowing each centroid to span at most one unit of k. Thus centroids
+  * near q = 0 and q = 1 are small (singletons at the very extremes) and
+  * at most about delta/2 centroids result.
+  */
+
+#include <stdlib.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include <string.h>
+#include <math.h>
+#include <assert.h>
+
+#include "tdigest.h"
+
+#ifndef M_PI
+#define M_PI (3.14159265358979323846)
+#endif
+
+struct tdigest *tdigest_create( void ) {
+	struct tdigest *t
+		= calloc( 1, sizeof(struct tdigest) );
+	if( t ) {
+		t->min = +INFINITY;
+		t->max = -INFINITY;
+	}
+	return t;
+}
+
+
+void tdigest_destroy( struct tdigest *t ) {
+	free( t );
+}
+
+
+static inline double _k( double q ) {
+	return TDIGEST_COMPRESSION / (2*M_PI) * asin( 2*q - 1 );
+}
+
+
+static inline double _q( double k ) {
+	if( k >= TDIGEST_COMPRESSION / 4.0 )
+		return 1.0;
+	return ( sin( k * (2*M_PI) / TDIGEST_COMPRESSION ) + 1 ) / 2;
+}
+
+
+/**
+  * Map a double to an unsigned integer with the same ordering: positive
+  * values need only their sign bit set; negative values are inverted.
+  */
+static inline uint64_t _key( double x ) {
+	uint64_t u;
+	memcpy( &u, &x, sizeof(u) );
+	return ( u >> 63 ) ? ~u : ( u | ( UINT64_C(1) << 63 ) );
+}
+
+
+static inline double _unkey( uint64_t u ) {
+	double x;
+	u = ( u >> 63 ) ? ( u & ~( UINT64_C(1) << 63 ) ) : ~u;
+	memcpy( &x, &u, sizeof(x) );
+	return x;
+}
+
+
+/**
+  * Sorts doubles into unit-weight centroids by an LSD radix sort of their
+  * keys. Passes over bytes in which all keys agree (e.g. the low mantissa
+  * bytes of integers) are skipped, as is everything if the values arrived
+  * in order. This is several times faster than qsort, whose indirect
+  * comparisons would otherwise dominate the cost of the digest.
+  */
+static void _sort( const double *x, int n, struct centroid *out ) {
+
+	uint64_t key[ TDIGEST_BUFFER ], tmp[ TDIGEST_BUFFER ];
+	uint64_t *src = key, *dst = tmp;
+	uint64_t all = ~UINT64_C(0), any = 0;
+	bool sorted = true;
+	int count[ 256 ];
+
+	for(int i = 0; i < n; i++ ) {
+		const uint64_t K = _key( x[i] );
+		key[i] = K;
+		all &= K;
+		any |= K;
+		if( i > 0 && key[i-1] > K )
+			sorted = false;
+	}
+
+	for(int shift = 0; shift < 64 && ! sorted; shift += 8 ) {
+		int sum = 0;
+		if( ( ( all ^ any ) >> shift & 0xFF ) == 0 )
+			continue;
+		memset( count, 0, sizeof(count) );
+		for(int i = 0; i < n; i++ )
+			count[ src[i] >> shift & 0xFF ] += 1;
+		for(int i = 0; i < 256; i++ ) {
+			const int T = count[i];
+			count[i] = sum;
+			sum += T;
+		}
+		for(int i = 0; i < n; i++ )
+			dst[ count[ src[i] >> shift & 0xFF ]++ ] = src[i];
+		uint64_t *const T = src;
+		src = dst;
+		dst = T;
+	}
+
+	for(int i = 0; i < n; i++ ) {
+		out[i].mean   = _unkey( src[i] );
+		out[i].weight = 1;
+	}
+}
+
+
+/**
+  * Replace the centroids with the compression of the union of the sorted
+  * centroids a[0,na) and b[0,nb), the total weight of which is t->weight.
+  * Each is greedily absorbed into its predecessor while the predecessor
+  * would span no more than one unit of k.
+  */
+static void _compress( struct tdigest *t,
+		const struct centroid *a, int na,
+		const struct centroid *b, int nb ) {
+
+	const struct centroid *const A_END = a + na;
+	const struct centroid *const B_END = b + nb;
+	struct centroid *cur = t->c;
+	double w_so_far = 0, w_limit;
+	double sum; // ...of weight*mean in *cur.
+
+	t->merged = 0;
+	if( na + nb == 0 )
+		return;
+
+	*cur = ( nb == 0 || ( na > 0 && a->mean <= b->mean ) ) ? *a++ : *b++;
+	sum = cur->weight * cur->mean;
+	w_limit = _q( _k( 0 ) + 1 ) * t->weight;
+
+	while( a < A_END || b < B_END ) {
+		const struct centroid *pc
+			= ( b == B_END || ( a < A_END && a->mean <= b->mean ) ) ? a++ : b++;
+		if( w_so_far + cur->weight + pc->weight <= w_limit ) {
+			cur->weight += pc->weight;
+			sum         += pc->weight * pc->mean;
+		} else {
+			cur->mean = sum / cur->weight;
+			w_so_far += cur->weight;
+			w_limit = _q( _k( w_so_far / t->weight ) + 1 ) * t->weight;
+			*++cur = *pc;
+			sum = pc->weight * pc->mean;
+		}
+	}
+	cur->mean = sum / cur->weight;
+	t->merged = cur - t->c + 1;
+	// Each pair of adjacent centroids spans more than one unit of k, and
+	// k spans delta/2 units.
+	assert( t->merged <= TDIGEST_CENTROIDS );
+}
+
+
+/**
+  * Merge the buffer into the centroids.
+  */
+static void _flush( struct tdigest *t ) {
+
+	struct centroid prior[ TDIGEST_CENTROIDS ];
+	struct centroid values[ TDIGEST_BUFFER ];
+	const int N = t->buffered;
+
+	if( N == 0 )
+		return;
+
+	_sort( t->buffer, N, values );
+	memcpy( prior, t->c, t->merged*sizeof(struct centroid) );
+	t->weight  += N;
+	t->buffered = 0;
+	_compress( t, prior, t->merged, values, N );
+}
+
+
+void tdigest_add( struct tdigest *t, double x ) {
+	if( ! isfinite( x ) )
+		return;
+	if( t->buffered == TDIGEST_BUFFER )
+		_flush( t );
+	t->buffer[ t->buffered++ ] = x;
+	if( t->min > x )
+		t->min = x;
+	if( t->max < x )
+		t->max = x;
+}
+
+
+void tdigest_merge( struct tdigest *into, const struct tdigest *from ) {
+
+	struct centroid prior[ TDIGEST_CENTROIDS ];
+
+	_flush( into );
+	if( from->merged > 0 ) {
+		memcpy( prior, into->c, into->merged*sizeof(struct centroid) );
+		into->weight += from->weight;
+		_compress( into, prior, into->merged, from->c, from->merged );
+		if( into->min > from->min )
+			into->min = from->min;
+		if( into->max < from->max )
+			into->max = from->max;
+	}
+	for(int i = 0; i < from->buffered; i++ )
+		tdigest_add( into, from->buffer[i] );
+}
+
+
+/**
+  * Each centroid's weight is assumed to be spread evenly about its mean,
+  * so quantiles are interpolated linearly between adjacent centroids'
+  * means (and between the outermost centroids and the extrema).
+  */
+double tdigest_quantile( struct tdigest *t, double q ) {
+
+	const struct centroid *c
+		= t->c;
+	double index, w_so_far;
+	int n;
+
+	_flush( t );
+	n = t->merged;
+
+	if( n == 0 )
+		return NAN;
+	if( q <= 0 )
+		return t->min;
+	if( q >= 1 )
+		return t->max;
+	if( n == 1 )
+		return c[0].mean;
+
+	index = q * t->weight;
+
+	if( index < c[0].weight / 2 )
+		return t->min + ( c[0].mean - t->min ) * index / ( c[0].weight / 2 );
+
+	w_so_far = c[0].weight / 2;
+	for(int i = 0; i + 1 < n; i++ ) {
+		const double DW
+			= ( c[i].weight + c[i+1].weight ) / 2;
+		if( w_so_far + DW > index ) {
+			return c[i].mean
+				+ ( c[i+1].mean - c[i].mean ) * ( index - w_so_far ) / DW;
+		}
+		w_so_far += DW;
+	}
+
+	return c[n-1].mean
+		+ ( t->max - c[n-1].mean ) * ( index - w_so_far ) / ( c[n-1].weight / 2 );
+}
+
+
+#ifdef UNIT_TEST_TDIGEST
+
+#include <stdio.h>
+
+/**
+  * Reads numbers from stdin and prints the quantiles given as arguments.
+  */
+int main( int argc, char *argv[] ) {
+	struct tdigest *t = tdigest_create();
+	double x;
+	while( scanf( "%lf", &x ) == 1 )
+		tdigest_add( t, x );
+	for(int i = 1; i < argc; i++ ) {
+		const double Q = atof( argv[i] );
+		printf( "%g\t%g\n", Q, tdigest_quantile( t, Q ) );
+	}
+	tdigest_destroy( t );
+	return EXIT_SUCCESS;
+}
+#endif
+
@@ -0,0 +1,61 @@
+
+#ifndef _tdigest_h_
+#define _tdigest_h_
+
+/**
+  * A "merging" t-digest (Dunning & Ertl) summarizing the distribution of
+  * a stream of values in a fixed amount of memory. Quantiles near the
+  * extremes are estimated with greater accuracy than those near the median.
+  * Digests of disjoint streams can be merged into a digest of the union.
+  */
+
+/**
+  * The compression parameter (conventionally delta) bounds the count of
+  * centroids retained; values are buffered TDIGEST_BUFFER at a time
+  * before being merged into them.
+  */
+#ifndef TDIGEST_COMPRESSION
+#define TDIGEST_COMPRESSION (100)
+#endif
+#define TDIGEST_CENTROIDS   (TDIGEST_COMPRESSION+1)
+#ifndef TDIGEST_BUFFER
+#define TDIGEST_BUFFER      (10*TDIGEST_COMPRESSION)
+#endif
+
+struct centroid {
+	double mean;
+	double weight;
+};
+
+/**
+  * NONE OF THIS STRUCT SHOULD BE USED DIRECTLY.
+  * c[0,.merged) are centroids sorted by mean; buffer[0,.buffered) are
+  * values (of unit weight) not yet merged into them.
+  */
+struct tdigest {
+	int merged;
+	int buffered;
+	double weight; // ...of the centroids alone.
+	double min, max;
+	struct centroid c[ TDIGEST_CENTROIDS ];
+	double buffer[ TDIGEST_BUFFER ];
+};
+
+struct tdigest *tdigest_create( void );
+void   tdigest_destroy( struct tdigest * );
+
+void   tdigest_add( struct tdigest *, double x );
+
+/**
+  * Add all of <from> to <into>.
+  */
+void   tdigest_merge( struct tdigest *into, const struct tdigest *from );
+
+/**
+  * Estimate the <q>th quantile (0 <= q <= 1). Returns NaN if the digest is
+  * empty.
+  */
+double tdigest_quantile( struct tdigest *, double q );
+
+#endif
+
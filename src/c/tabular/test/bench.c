@@ -0,0 +1,242 @@
+
+/**
+  * Throughput benchmark for tabular_scan and its line splitters.
+  *
+  *   bench [ -r <repeats> ] [ -m <megabytes> ] [ -f tsv|csv|ws ] [ <file> ... ]
+  *
+  * Each named file (or, if none are named, a synthetic table of the given
+  * size and format--by default one of each format--written to a temporary
+  * file) is scanned <repeats> times and the best wall-clock throughput is
+  * reported in MB/s. The line splitter inferred by the scan is then timed
+  * alone on the file's lines held in memory. Run it on a file that is
+  * already in the page cache to measure the scanner rather than disk.
+  */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdbool.h>
+#include <string.h>
+#include <time.h>
+#include <getopt.h>
+
+#include "tabular.h"
+
+static const char *LABELS[] = {
+	"alpha", "beta", "gamma", "delta", "NA", "\xc3\xa9t\xc3\xa9", "\xe6\x97\xa5\xe6\x9c\xac"
+};
+
+static const char *QUOTED_LABELS[] = {
+	"\"Smith, J\"", "\"said \"\"hi\"\"\"", "plain", "\"\"", "\"a,b,c\""
+};
+
+#define COUNT(a) (sizeof(a)/sizeof(a[0]))
+
+static const char *FORMATS[] = { "tsv", "csv", "ws" };
+
+/**
+  * Write a table of roughly <bytes> bytes with integer, float and label
+  * columns. Formats are:
+  *  tsv: TAB-separated with a header line,
+  *  csv: RFC4180 with quoted fields containing commas and quotes,
+  *   ws: right-aligned columns separated by runs of spaces.
+  */
+static FILE *_synthesize( long bytes, const char *format ) {
+
+	FILE *fp = tmpfile();
+	long n = 0;
+	if( fp == NULL )
+		return NULL;
+	srand( 17 );
+	if( strcmp( format, "csv" ) == 0 ) {
+		for(long row = 0; n < bytes; row++ ) {
+			n += fprintf( fp, "%ld,%d,%.6f,%s,%.3e\n",
+				row,
+				rand() % 1000,
+				rand() / (double)RAND_MAX,
+				QUOTED_LABELS[ rand() % COUNT(QUOTED_LABELS) ],
+				(rand() - RAND_MAX/2) * 1e-3 );
+		}
+	} else
+	if( strcmp( format, "ws" ) == 0 ) {
+		for(long row = 0; n < bytes; row++ ) {
+			n += fprintf( fp, "%10ld %6d %12.6f %5s\n",
+				row,
+				rand() % 1000,
+				rand() / (double)RAND_MAX,
+				LABELS[ rand() % 5 /* ASCII only */ ] );
+		}
+	} else {
+		n += fprintf( fp, "#id\tcount\tvalue\tlabel\tscore\n" );
+		for(long row = 0; n < bytes; row++ ) {
+			n += fprintf( fp, "%ld\t%d\t%.6f\t%s\t%.3e\n",
+				row,
+				rand() % 1000,
+				rand() / (double)RAND_MAX,
+				LABELS[ rand() % COUNT(LABELS) ],
+				(rand() - RAND_MAX/2) * 1e-3 );
+		}
+	}
+	rewind( fp );
+	return fp;
+}
+
+
+static double _now( void ) {
+	struct timespec ts;
+	clock_gettime( CLOCK_MONOTONIC, &ts );
+	return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+
+/**
+  * Returns the best throughput (MB/s) of <repeats> scans of fp and the
+  * format inferred by the scan.
+  */
+static double _bench( FILE *fp, int repeats, long *bytes, struct format *format ) {
+
+	double best = 0.0;
+	fseek( fp, 0, SEEK_END );
+	*bytes = ftell( fp );
+	while( repeats-- > 0 ) {
+		struct table_description d;
+		double elapsed;
+		memset( &d, 0, sizeof(d) );
+		rewind( fp );
+		elapsed = _now();
+		tabular_scan( fp, &d );
+		elapsed = _now() - elapsed;
+		*format = d.table;
+		tabular_free( &d );
+		if( elapsed > 0 && best < (*bytes / 1e6) / elapsed )
+			best = (*bytes / 1e6) / elapsed;
+	}
+	return best;
+}
+
+
+static void _ignore_field( const char *field, int offset, void *context ) {
+	*(long*)context += 1;
+}
+
+
+/**
+  * Returns the best throughput (MB/s) of <repeats> passes of the format's
+  * line splitter over the data lines of fp held in memory.
+  */
+static double _bench_split( FILE *fp, int repeats, struct format *format ) {
+
+	double best = 0.0;
+	long bytes;
+	char *content, *work;
+
+	if( format->split_line == NULL )
+		return 0.0;
+
+	fseek( fp, 0, SEEK_END );
+	bytes = ftell( fp );
+	rewind( fp );
+	content = malloc( bytes + 1 );
+	work    = malloc( bytes + 1 );
+	if( content == NULL || work == NULL
+			|| fread( content, 1, bytes, fp ) != (size_t)bytes ) {
+		free( content );
+		free( work );
+		return 0.0;
+	}
+	content[ bytes ] = '\0';
+
+	while( repeats-- > 0 ) {
+		char *line = work, *const end = work + bytes;
+		long fields = 0;
+		double elapsed;
+		memcpy( work, content, bytes + 1 ); // ...splitters modify lines.
+		elapsed = _now();
+		while( line < end ) {
+			char *eol = memchr( line, '\n', end - line );
+			if( eol == NULL )
+				eol = end;
+			*eol = '\0';
+			if( eol > line && eol[-1] == '\r' )
+				eol[-1] = '\0';
+			if( *line && ! ( format->metadata_line_prefix_len > 0
+					&& memcmp( line, format->metadata_line_prefix,
+						format->metadata_line_prefix_len ) == 0 ) )
+				format->split_line( line, format, _ignore_field, &fields );
+			line = eol + 1;
+		}
+		elapsed = _now() - elapsed;
+		if( elapsed > 0 && best < (bytes / 1e6) / elapsed )
+			best = (bytes / 1e6) / elapsed;
+	}
+	free( content );
+	free( work );
+	return best;
+}
+
+
+static void _report( const char *name, FILE *fp, int repeats ) {
+	struct format format;
+	long bytes;
+	double scan, split;
+	memset( &format, 0, sizeof(format) );
+	scan  = _bench( fp, repeats, &bytes, &format );
+	split = _bench_split( fp, repeats, &format );
+	printf( "%s\t%ld bytes\tscan %.1f MB/s\tsplit(\"%s\") %.1f MB/s\n",
+		name, bytes, scan, format.column_separator, split );
+}
+
+
+int main( int argc, char *argv[] ) {
+
+	int repeats = 5;
+	long megabytes = 64;
+	const char *format = NULL;
+
+	do {
+		const int c = getopt( argc, argv, "r:m:f:h" );
+		if( c == -1 )
+			break;
+		switch( c ) {
+		case 'r':
+			repeats = atoi( optarg );
+			break;
+		case 'm':
+			megabytes = atol( optarg );
+			break;
+		case 'f':
+			format = optarg;
+			break;
+		default:
+			fprintf( stderr, "%s [ -r <repeats> ] [ -m <megabytes> ] [ -f tsv|csv|ws ] [ <file> ... ]\n", argv[0] );
+			exit( -1 );
+		}
+	} while( true );
+
+	if( optind < argc ) {
+		for(int i = optind; i < argc; i++ ) {
+			FILE *fp = fopen( argv[i], "r" );
+			if( fp == NULL ) {
+				perror( argv[i] );
+				continue;
+			}
+			_report( argv[i], fp, repeats );
+			fclose( fp );
+		}
+	} else {
+		for(int i = 0; i < COUNT(FORMATS); i++ ) {
+			char name[32];
+			FILE *fp;
+			if( format && strcmp( format, FORMATS[i] ) )
+				continue;
+			fp = _synthesize( megabytes * 1000000L, FORMATS[i] );
+			if( fp == NULL ) {
+				perror( "tmpfile" );
+				exit( -1 );
+			}
+			snprintf( name, sizeof(name), "synthetic %s", FORMATS[i] );
+			_report( name, fp, repeats );
+			fclose( fp );
+		}
+	}
+	return EXIT_SUCCESS;
+}
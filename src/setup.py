@@ -16,6 +16,7 @@ setup(name="bdqc",
 		'bdqc.builtin.extrinsic',
 		'bdqc.builtin.filetype',
 		'bdqc.builtin.tabular',
+		'bdqc.builtin.sequence',
 		'bdqc.builtin.image_info'],
 #	package_dir=
 	package_data={'bdqc':['template.html','template.css','render.js', '../data/*.txt']},
@@ -23,20 +24,27 @@ setup(name="bdqc",
 	ext_modules=[
 		Extension('compiled',
 			['c/fopenx.c',
+				'c/bgzf.c',
 				'c/module.c',
 
 				'c/tabular/utf8.c',
 				'c/tabular/murmur3.c',
 				'c/tabular/format.c',
+				'c/tabular/csv.c',
 				'c/tabular/strset.c',
+				'c/tabular/arena.c',
 				'c/tabular/sspp.c',
 				'c/tabular/scan.c',
 				'c/tabular/line.c',
-				'c/tabular/json.c',
+				'c/tabular/jsonl.c',
 				'c/tabular/util.c',
 				'c/tabular/column.c',
+				'c/tabular/tdigest.c',
+				'c/tabular/hll.c',
 				'c/tabular/environ.c',
 
+				'c/sequence/sequence.c',
+
 				'c/stats/bounds.c',
 				'c/stats/central.c',
 				'c/stats/density.c',
@@ -47,7 +55,8 @@ setup(name="bdqc",
 				'c/stats/quantile.c',
 				'c/stats/quicksel.c'
 			 ],
+			 libraries=['z','bz2','lzma'],
 			 extra_compile_args=['-std=c99'],
-			 define_macros=[("_POSIX_C_SOURCE","200809L"),("EXHAUSTIVE_OUTPUT","1")])]
+			 define_macros=[("_POSIX_C_SOURCE","200809L")])]
 	)
 
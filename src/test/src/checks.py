@@ -0,0 +1,190 @@
+"""
+Checks of the store, the content digests, deduplication, the directory
+walker and the worker pool. Each builds what it needs in a temporary
+directory. Run them from the directory containing the bdqc package (once
+its extension is built) with:
+
+	python3 -m unittest discover -s test/src -p checks.py
+"""
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import bdqc.dir
+import bdqc.digest
+import bdqc.plugin
+import bdqc.scan
+import bdqc.store
+
+PLUGINS = [ 'bdqc.builtin.extrinsic', 'bdqc.builtin.tabular' ]
+
+TABLE = "".join( "{}\t{}\tx{}\n".format( i, i*0.5, i % 7 ) for i in range(100) )
+
+class _InTemporaryDirectory(unittest.TestCase):
+
+	def setUp( self ):
+		self.dir = tempfile.mkdtemp()
+
+	def tearDown( self ):
+		shutil.rmtree( self.dir )
+
+	def _file( self, name, content ):
+		path = os.path.join( self.dir, name )
+		os.makedirs( os.path.dirname( path ), exist_ok=True )
+		with open( path, "wb" if isinstance( content, bytes ) else "w" ) as fp:
+			fp.write( content )
+		return path
+
+	def _scan( self, subjects, **kwargs ):
+		"""
+		Run the PLUGINS on subjects, as the command line would (without
+		clobbering), returning their accumulated JSON.
+		"""
+		accum = io.StringIO()
+		_exec = bdqc.scan.Executor( bdqc.plugin.Manager( PLUGINS ), subjects,
+			adjacent=False, clobber=False, **kwargs )
+		self.assertEqual( _exec.run( accumulator=accum ), 0 )
+		if _exec.store:
+			_exec.store.close()
+		return accum.getvalue()
+
+
+class Store(_InTemporaryDirectory):
+
+	def test_round_trip( self ):
+		S = self._file( "s.tsv", TABLE )
+		ST = os.stat( S )
+		VERSIONS = { 'a':1, 'b':[ 2, {'x':0} ] }
+		RESULTS = { 'a':{ 'n':1, 'version':1 }, 'b':{ 'l':[1,2] } }
+		DB = os.path.join( self.dir, "results.db" )
+		store = bdqc.store.Store( DB )
+		store.put( S, ST, RESULTS, VERSIONS )
+		# Queued results are found before they're committed...
+		self.assertEqual( store.get( S, ST ), RESULTS )
+		self.assertEqual( store.versions( S, ST ), VERSIONS )
+		store.close()
+		# ...and after, by another Store.
+		store = bdqc.store.Store( DB )
+		self.assertEqual( store.get( S, ST ), RESULTS )
+		self.assertTrue( store.is_current( S, ST, VERSIONS ) )
+		self.assertFalse( store.is_current( S, ST, { 'a':1, 'b':[ 2, {'x':1} ] } ) )
+		self.assertFalse( store.is_current( S, ST, { 'a':1 } ) )
+		# A subject whose results are incomplete is never current.
+		store.put( S, ST, { 'a':RESULTS['a'] } )
+		store.flush()
+		self.assertFalse( store.is_current( S, ST, VERSIONS ) )
+		self.assertIsNone( store.versions( S, ST ) )
+		store.put( S, ST, RESULTS, VERSIONS )
+		store.flush()
+		# Nor are the results of a subject that has since changed.
+		os.utime( S, ns=( ST.st_atime_ns, ST.st_mtime_ns + 10**9 ) )
+		CHANGED = os.stat( S )
+		self.assertFalse( store.is_current( S, CHANGED, VERSIONS ) )
+		self.assertEqual( store.get( S, CHANGED ), {} )
+		self.assertIsNone( store.versions( S, CHANGED ) )
+		store.close()
+
+	def test_current_subjects_are_skipped( self ):
+		S = self._file( "s.tsv", TABLE )
+		DB = os.path.join( self.dir, "results.db" )
+		FIRST = self._scan( [ S ], store=DB )
+		with self.assertLogs( level="INFO" ) as log:
+			self.assertEqual( self._scan( [ S ], store=DB ), FIRST )
+		self.assertIn( "skipping {}: results are current".format( S ),
+			"\n".join( log.output ) )
+
+
+class Dedup(_InTemporaryDirectory):
+
+	def _reused( self, subjects ):
+		"""
+		Scan subjects with deduplication, returning the log lines
+		reporting reused results.
+		"""
+		with self.assertLogs( level="INFO" ) as log:
+			self._scan( subjects, store=os.path.join( self.dir, "results.db" ), dedup=True )
+		return [ l for l in log.output if "reusing" in l ]
+
+	def test_identical_files_share_results( self ):
+		A = self._file( "a.tsv", TABLE )
+		B = self._file( "b.tsv", TABLE )
+		C = self._file( "c.tsv", TABLE.upper() )
+		REUSED = self._reused( [ A, B, C ] )
+		self.assertEqual( len(REUSED), 1 )
+		self.assertIn( "bdqc.builtin.tabular results of content identical to {}".format( B ), REUSED[0] )
+		# ...including with a file scanned in a later run.
+		D = self._file( "d.tsv", TABLE )
+		REUSED = self._reused( [ D ] )
+		self.assertEqual( len(REUSED), 1 )
+		self.assertIn( D, REUSED[0] )
+
+	def test_partial_collisions_are_resolved( self ):
+		BLOCK = bdqc.digest.PARTIAL_BLOCK
+		ENDS = os.urandom( 2*BLOCK )
+		A = self._file( "a.bin", ENDS[:BLOCK] + b'a'*BLOCK + ENDS[BLOCK:] )
+		B = self._file( "b.bin", ENDS[:BLOCK] + b'b'*BLOCK + ENDS[BLOCK:] )
+		C = self._file( "c.bin", ENDS[:BLOCK] + b'a'*BLOCK + ENDS[BLOCK:] )
+		self.assertFalse( bdqc.digest.is_complete( os.path.getsize( A ) ) )
+		self.assertEqual( bdqc.digest.partial( A ), bdqc.digest.partial( B ) )
+		self.assertNotEqual( bdqc.digest.full( A ), bdqc.digest.full( B ) )
+		self.assertEqual( bdqc.digest.full( A ), bdqc.digest.full( C ) )
+		# B's partial digest collides with A's but its content differs...
+		self.assertEqual( self._reused( [ A, B ] ), [] )
+		# ...whereas C's is the same as A's.
+		REUSED = self._reused( [ C ] )
+		self.assertEqual( len(REUSED), 1 )
+		self.assertIn( C, REUSED[0] )
+		store = bdqc.store.Store( os.path.join( self.dir, "results.db" ) )
+		CONTENT = [ store.content_of( s, os.stat( s ) ) for s in ( A, B, C ) ]
+		store.close()
+		self.assertEqual( len( set( partial for partial,_ in CONTENT ) ), 1 )
+		self.assertNotEqual( CONTENT[0][1], CONTENT[1][1] )
+		self.assertEqual( CONTENT[0][1], CONTENT[2][1] )
+
+
+class Walk(_InTemporaryDirectory):
+
+	def setUp( self ):
+		super().setUp()
+		for name in ( "a.txt", "d1/b.txt", "d1/d2/c.txt", "skip/d.txt", "d1/skip/e.txt" ):
+			self._file( name, name )
+
+	def _walk( self, **kwargs ):
+		return sorted( os.path.relpath( f, self.dir )
+			for f in bdqc.dir.iwalk( self.dir, **kwargs ) )
+
+	def test_depth( self ):
+		for threads in ( 1, 3 ):
+			self.assertEqual( self._walk( depth=1, threads=threads ), [ "a.txt" ] )
+			self.assertEqual( self._walk( depth=2, threads=threads ),
+				[ "a.txt", "d1/b.txt", "skip/d.txt" ] )
+			self.assertEqual( self._walk( threads=threads ),
+				[ "a.txt", "d1/b.txt", "d1/d2/c.txt", "d1/skip/e.txt", "skip/d.txt" ] )
+
+	def test_excluded_directories_are_pruned( self ):
+		for threads in ( 1, 3 ):
+			self.assertEqual( self._walk( exclude=r".*/skip$", threads=threads ),
+				[ "a.txt", "d1/b.txt", "d1/d2/c.txt" ] )
+			self.assertEqual( self._walk( include=r".*/[bc]\.txt$", threads=threads ),
+				[ "d1/b.txt", "d1/d2/c.txt" ] )
+
+	def test_with_stat( self ):
+		for f,st in bdqc.dir.iwalk( self.dir, with_stat=True ):
+			self.assertEqual( st, os.stat( f ) )
+
+
+class Jobs(_InTemporaryDirectory):
+
+	def test_pool_output_matches_serial( self ):
+		subjects = [ self._file( "{}.tsv".format(i), TABLE[ i*40: ] ) for i in range(12) ]
+		SERIAL = self._scan( subjects )
+		self.assertEqual( self._scan( subjects, jobs=3 ), SERIAL )
+		self.assertEqual( len( json.loads( SERIAL ) ), len(subjects) )
+
+
+if __name__=="__main__":
+	unittest.main()